@@ -19,7 +19,11 @@ import aws_cdk as cdk
 import aws_cdk.aws_dynamodb as dynamodb
 
 import constants
+from backend.api.infrastructure import APISettings
+from backend.api.infrastructure import PerformanceProfile
 from backend.component import Backend
+from backend.component import BackendSettings
+from backend.database.infrastructure import DatabaseSettings
 from toolchain import Toolchain
 
 app = cdk.App()
@@ -32,8 +36,16 @@ Backend(
         account=os.environ["CDK_DEFAULT_ACCOUNT"],
         region=os.environ["CDK_DEFAULT_REGION"],
     ),
-    api_lambda_reserved_concurrency=1,
-    database_dynamodb_billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+    settings=BackendSettings(
+        api=APISettings(
+            lambda_reserved_concurrency=1,
+            # No provisioned concurrency, the sandbox tolerates cold starts
+            performance_profile=PerformanceProfile(memory_size=512),
+        ),
+        database=DatabaseSettings(
+            dynamodb_billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST
+        ),
+    ),
 )
 
 # Toolchain stack (defines the continuous deployment pipeline)
@@ -0,0 +1,206 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import dataclasses
+import hashlib
+import itertools
+import os
+import pathlib
+import shutil
+import subprocess  # nosec
+import sys
+import uuid
+from typing import Any, List, Optional, Sequence
+
+import aws_cdk as cdk
+import aws_cdk.aws_lambda as lambda_
+import jsii
+
+# Part of the asset hash, bump it when bundles are built differently
+BUNDLE_FORMAT_VERSION = "1"
+IGNORED_PATTERNS = ("__pycache__", "*.pyc")
+REQUIREMENTS_FILE_NAME = "requirements.txt"
+# Installed on top of the requirements, only for functions using a DAX cluster
+DAX_REQUIREMENTS_FILE_NAME = "requirements-dax.txt"
+PLATFORM_TAGS = {
+    "arm64": "manylinux2014_aarch64",
+    "x86_64": "manylinux2014_x86_64",
+}
+
+
+@dataclasses.dataclass(frozen=True)
+class RuntimeSources:
+    path: pathlib.Path
+    # Pinned requirements files of the path, all installed in the bundle
+    requirements_file_names: Sequence[str] = (REQUIREMENTS_FILE_NAME,)
+
+
+def compute_asset_hash(
+    sources: RuntimeSources,
+    *,
+    runtime: lambda_.Runtime,
+    architecture: lambda_.Architecture,
+) -> str:
+    # Changes with the sources, the pinned requirements installed and the
+    # target platform
+    digest = hashlib.sha256()
+    digest.update(
+        f"{BUNDLE_FORMAT_VERSION}:{runtime.name}:{architecture.name}:"
+        f"{','.join(sources.requirements_file_names)}".encode()
+    )
+    for path in sorted(_source_files(sources.path)):
+        digest.update(path.relative_to(sources.path).as_posix().encode() + b"\0")
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def build_code(
+    sources: RuntimeSources,
+    *,
+    runtime: lambda_.Runtime,
+    architecture: lambda_.Architecture,
+    cache_directory: Optional[pathlib.Path],
+    local_bundling: bool = True,
+) -> lambda_.Code:
+    asset_hash = compute_asset_hash(sources, runtime=runtime, architecture=architecture)
+    local = None
+    if local_bundling:
+        local = LocalBundling(
+            sources,
+            runtime=runtime,
+            architecture=architecture,
+            cached_bundle_path=None
+            if cache_directory is None
+            else cache_directory.joinpath(asset_hash),
+        )
+    requirement_options = " ".join(
+        f"--requirement {file_name}" for file_name in sources.requirements_file_names
+    )
+    return lambda_.Code.from_asset(
+        str(sources.path),
+        # Known ahead of bundling, unchanged assets skip it within an output
+        # directory, the cache extends that across output directories
+        asset_hash=asset_hash,
+        asset_hash_type=cdk.AssetHashType.CUSTOM,
+        exclude=list(IGNORED_PATTERNS),
+        bundling=cdk.BundlingOptions(
+            image=runtime.bundling_image,
+            platform=architecture.docker_platform,
+            command=[
+                "bash",
+                "-c",
+                f"pip install --no-cache-dir {requirement_options} "
+                "--target /asset-output && cp --archive . /asset-output",
+            ],
+            local=local,
+        ),
+    )
+
+
+@jsii.implements(cdk.ILocalBundling)
+class LocalBundling:
+    """Bundles with pip on the host, falling back to Docker when it can't."""
+
+    def __init__(
+        self,
+        sources: RuntimeSources,
+        *,
+        runtime: lambda_.Runtime,
+        architecture: lambda_.Architecture,
+        # Named by the asset hash, shared by the output directories of synths
+        cached_bundle_path: Optional[pathlib.Path],
+    ):
+        self._sources = sources
+        self._python_version = runtime.name.removeprefix("python")
+        self._platform_tag = PLATFORM_TAGS[architecture.name]
+        self._cached_bundle_path = cached_bundle_path
+
+    def try_bundle(self, output_dir: str, *_: Any, **__: Any) -> bool:
+        output_path = pathlib.Path(output_dir)
+        cached_bundle_path = self.cached_bundle_path
+        if cached_bundle_path is not None and cached_bundle_path.is_dir():
+            shutil.copytree(cached_bundle_path, output_path, dirs_exist_ok=True)
+            return True
+        python = self._find_python()
+        if python is None or not self._install_requirements(python, output_path):
+            return False
+        shutil.copytree(
+            self._sources.path,
+            output_path,
+            dirs_exist_ok=True,
+            ignore=shutil.ignore_patterns(*IGNORED_PATTERNS),
+        )
+        self._cache(output_path)
+        return True
+
+    def _find_python(self) -> Optional[str]:
+        # Source distributions are built by the same Python version as the runtime
+        if f"{sys.version_info.major}.{sys.version_info.minor}" == (
+            self._python_version
+        ):
+            return sys.executable
+        return shutil.which(f"python{self._python_version}")
+
+    def _install_requirements(self, python: str, output_path: pathlib.Path) -> bool:
+        # Requirements are pinned with their dependencies. Wheels for the target
+        # platform are preferred, pure Python source distributions build anywhere
+        command = [
+            python,
+            "-m",
+            "pip",
+            "install",
+            "--quiet",
+            *itertools.chain.from_iterable(
+                ["--requirement", str(self._sources.path.joinpath(file_name))]
+                for file_name in self._sources.requirements_file_names
+            ),
+            "--target",
+            str(output_path),
+            "--no-deps",
+            "--prefer-binary",
+            "--platform",
+            self._platform_tag,
+            "--implementation",
+            "cp",
+            "--python-version",
+            self._python_version,
+        ]
+        return subprocess.run(command, check=False).returncode == 0  # nosec
+
+    @property
+    def cached_bundle_path(self) -> Optional[pathlib.Path]:
+        return self._cached_bundle_path
+
+    def _cache(self, output_path: pathlib.Path) -> None:
+        cached_bundle_path = self.cached_bundle_path
+        if cached_bundle_path is None:
+            return
+        # Copied aside and renamed, concurrent synths never see partial bundles
+        staging_path = cached_bundle_path.with_name(
+            f"{cached_bundle_path.name}.{uuid.uuid4().hex}"
+        )
+        shutil.copytree(output_path, staging_path)
+        try:
+            os.rename(staging_path, cached_bundle_path)
+        except OSError:
+            shutil.rmtree(staging_path, ignore_errors=True)
+
+
+def _source_files(runtime_path: pathlib.Path) -> List[pathlib.Path]:
+    return [
+        path
+        for path in runtime_path.rglob("*")
+        if path.is_file() and "__pycache__" not in path.parts and path.suffix != ".pyc"
+    ]
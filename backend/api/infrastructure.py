@@ -13,44 +13,239 @@
 # IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
+import dataclasses
 import pathlib
+from typing import Dict
 
+import aws_cdk as cdk
 import aws_cdk.aws_apigatewayv2_alpha as apigatewayv2_alpha
 import aws_cdk.aws_apigatewayv2_integrations_alpha as apigatewayv2_integrations_alpha
 import aws_cdk.aws_lambda as lambda_
-import aws_cdk.aws_lambda_python_alpha as lambda_python_alpha
 from constructs import Construct
 
+from backend.api import bundling
+from backend.database.infrastructure import Database
+
+# Context keys, e.g. cdk synth -c localBundling=false
+LOCAL_BUNDLING_CONTEXT_KEY = "localBundling"
+BUNDLING_CACHE_DIRECTORY_CONTEXT_KEY = "bundlingCacheDirectory"
+DEFAULT_BUNDLING_CACHE_DIRECTORY = pathlib.Path.home().joinpath(".cache", "cdk-bundles")
+
+
+@dataclasses.dataclass(frozen=True)
+class DynamoDBClientSettings:
+    max_pool_connections: int = 10
+    tcp_keepalive: bool = True
+    connect_timeout_seconds: float = 1.0
+    read_timeout_seconds: float = 2.0
+    retry_mode: str = "standard"
+    max_attempts: int = 3
+
+    def to_environment(self) -> Dict[str, str]:
+        return {
+            "DYNAMODB_MAX_POOL_CONNECTIONS": str(self.max_pool_connections),
+            "DYNAMODB_TCP_KEEPALIVE": str(self.tcp_keepalive).lower(),
+            "DYNAMODB_CONNECT_TIMEOUT": str(self.connect_timeout_seconds),
+            "DYNAMODB_READ_TIMEOUT": str(self.read_timeout_seconds),
+            "DYNAMODB_RETRY_MODE": self.retry_mode,
+            "DYNAMODB_MAX_ATTEMPTS": str(self.max_attempts),
+        }
+
+
+@dataclasses.dataclass(frozen=True)
+class CacheSettings:
+    enabled: bool = False
+    max_size: int = 1024
+    ttl_seconds: float = 30
+    negative_ttl_seconds: float = 5
+
+    def to_environment(self) -> Dict[str, str]:
+        return {
+            "USERS_CACHE_ENABLED": str(self.enabled).lower(),
+            "USERS_CACHE_MAX_SIZE": str(self.max_size),
+            "USERS_CACHE_TTL": str(self.ttl_seconds),
+            "USERS_CACHE_NEGATIVE_TTL": str(self.negative_ttl_seconds),
+        }
+
+
+@dataclasses.dataclass(frozen=True)
+class AdmissionControlSettings:
+    # Sheds requests with 429 responses while the table throttles
+    enabled: bool = False
+    # Requests per second and execution environment, until throttling is seen
+    read_max_rate: float = 100
+    write_max_rate: float = 100
+    min_rate: float = 1
+    decrease_factor: float = 0.5
+    recovery_rate: float = 1
+
+    def to_environment(self) -> Dict[str, str]:
+        return {
+            "USERS_ADMISSION_CONTROL_ENABLED": str(self.enabled).lower(),
+            "USERS_ADMISSION_READ_MAX_RATE": str(self.read_max_rate),
+            "USERS_ADMISSION_WRITE_MAX_RATE": str(self.write_max_rate),
+            "USERS_ADMISSION_MIN_RATE": str(self.min_rate),
+            "USERS_ADMISSION_DECREASE_FACTOR": str(self.decrease_factor),
+            "USERS_ADMISSION_RECOVERY_RATE": str(self.recovery_rate),
+        }
+
+
+@dataclasses.dataclass(frozen=True)
+class InstrumentationSettings:
+    # Embedded metric format logs, no PutMetricData calls on the request path
+    metrics_enabled: bool = True
+    # Active X-Ray tracing of the function and its AWS SDK calls
+    tracing_enabled: bool = True
+    metrics_namespace: str = "UserManagement"
+    service_name: str = "users"
+
+    def to_environment(self) -> Dict[str, str]:
+        return {
+            "USERS_METRICS_ENABLED": str(self.metrics_enabled).lower(),
+            "USERS_TRACING_ENABLED": str(self.tracing_enabled).lower(),
+            "POWERTOOLS_METRICS_NAMESPACE": self.metrics_namespace,
+            "POWERTOOLS_SERVICE_NAME": self.service_name,
+        }
+
+    def to_tracing(self) -> lambda_.Tracing:
+        if self.tracing_enabled:
+            return lambda_.Tracing.ACTIVE
+        return lambda_.Tracing.DISABLED
+
+
+@dataclasses.dataclass(frozen=True)
+class PerformanceProfile:
+    memory_size: int = 512
+    # Graviton, dependencies are bundled for the matching platform
+    architecture: lambda_.Architecture = lambda_.Architecture.ARM_64
+    # Execution environments kept initialized behind the alias, 0 disables them
+    provisioned_concurrency: int = 0
+    # Scales provisioned concurrency on utilization when above the minimum
+    max_provisioned_concurrency: int = 0
+    provisioned_concurrency_utilization_target: float = 0.7
+
+
+@dataclasses.dataclass(frozen=True)
+class APISettings:
+    lambda_reserved_concurrency: int
+    dynamodb_client: DynamoDBClientSettings = DynamoDBClientSettings()
+    cache: CacheSettings = CacheSettings()
+    performance_profile: PerformanceProfile = PerformanceProfile()
+    instrumentation: InstrumentationSettings = InstrumentationSettings()
+    admission_control: AdmissionControlSettings = AdmissionControlSettings()
+
 
 class API(Construct):
     def __init__(
-        self,
-        scope: Construct,
-        id_: str,
-        *,
-        dynamodb_table_name: str,
-        lambda_reserved_concurrency: int,
+        self, scope: Construct, id_: str, *, database: Database, settings: APISettings
     ):
         super().__init__(scope, id_)
 
-        self.lambda_function = lambda_python_alpha.PythonFunction(
+        self.lambda_function = lambda_.Function(
             self,
             "LambdaFunction",
             runtime=lambda_.Runtime.PYTHON_3_11,
-            environment={"DYNAMODB_TABLE_NAME": dynamodb_table_name},
-            reserved_concurrent_executions=lambda_reserved_concurrency,
-            entry=str(pathlib.Path(__file__).parent.joinpath("runtime").resolve()),
-            index="lambda_function.py",
-            handler="lambda_handler",
+            architecture=settings.performance_profile.architecture,
+            memory_size=settings.performance_profile.memory_size,
+            tracing=settings.instrumentation.to_tracing(),
+            environment=_build_environment(database, settings),
+            reserved_concurrent_executions=settings.lambda_reserved_concurrency,
+            vpc=None if database.dax_cluster is None else database.dax_cluster.vpc,
+            vpc_subnets=None
+            if database.dax_cluster is None
+            else database.dax_cluster.vpc_subnets,
+            code=build_runtime_code(
+                self,
+                settings.performance_profile.architecture,
+                dax=database.dax_cluster is not None,
+            ),
+            handler="lambda_function.lambda_handler",
         )
+        self.lambda_alias = self._create_lambda_alias(settings.performance_profile)
 
-        api_gateway_http_lambda_integration = (
-            apigatewayv2_integrations_alpha.HttpLambdaIntegration(
-                "APIGatewayHTTPLambdaIntegration", handler=self.lambda_function
-            )
-        )
         self.api_gateway_http_api = apigatewayv2_alpha.HttpApi(
             self,
             "APIGatewayHTTPAPI",
-            default_integration=api_gateway_http_lambda_integration,
+            # Invoking the alias lands on the provisioned execution environments
+            default_integration=apigatewayv2_integrations_alpha.HttpLambdaIntegration(
+                "APIGatewayHTTPLambdaIntegration", handler=self.lambda_alias
+            ),
+        )
+
+    def _create_lambda_alias(
+        self, performance_profile: PerformanceProfile
+    ) -> lambda_.Alias:
+        lambda_alias = lambda_.Alias(
+            self,
+            "LambdaAlias",
+            alias_name="live",
+            version=self.lambda_function.current_version,
+            provisioned_concurrent_executions=(
+                performance_profile.provisioned_concurrency or None
+            ),
         )
+        if performance_profile.max_provisioned_concurrency > (
+            performance_profile.provisioned_concurrency
+        ):
+            lambda_alias.add_auto_scaling(
+                min_capacity=performance_profile.provisioned_concurrency,
+                max_capacity=performance_profile.max_provisioned_concurrency,
+            ).scale_on_utilization(
+                utilization_target=(
+                    performance_profile.provisioned_concurrency_utilization_target
+                )
+            )
+        return lambda_alias
+
+
+def build_runtime_code(
+    scope: Construct, architecture: lambda_.Architecture, *, dax: bool = False
+) -> lambda_.Code:
+    # Shared by the functions of the runtime, e.g. the stats stream. Bundles
+    # with pip on the host when possible, else in Docker. Bundles are cached by
+    # a hash of the runtime sources and pinned requirements. The DAX client is
+    # only bundled for functions using a DAX cluster
+    requirements_file_names = [bundling.REQUIREMENTS_FILE_NAME]
+    if dax:
+        requirements_file_names.append(bundling.DAX_REQUIREMENTS_FILE_NAME)
+    local_bundling = scope.node.try_get_context(LOCAL_BUNDLING_CONTEXT_KEY)
+    cache_directory = scope.node.try_get_context(BUNDLING_CACHE_DIRECTORY_CONTEXT_KEY)
+    return bundling.build_code(
+        bundling.RuntimeSources(
+            pathlib.Path(__file__).parent.joinpath("runtime").resolve(),
+            requirements_file_names,
+        ),
+        runtime=lambda_.Runtime.PYTHON_3_11,
+        architecture=architecture,
+        cache_directory=pathlib.Path(
+            cache_directory or DEFAULT_BUNDLING_CACHE_DIRECTORY
+        ),
+        local_bundling=str(local_bundling).lower() != "false",
+    )
+
+
+def _build_environment(database: Database, settings: APISettings) -> Dict[str, str]:
+    environment = {
+        "DYNAMODB_TABLE_NAME": database.dynamodb_table.table_name,
+        # The replica of the function's region when tables are global
+        "DYNAMODB_REGION": cdk.Stack.of(database).region,
+        "DYNAMODB_EMAIL_TABLE_NAME": database.dynamodb_email_table.table_name,
+        "STATS_TABLE_NAME": database.dynamodb_stats_table.table_name,
+        "ATTRIBUTES_BUCKET_NAME": database.attributes_bucket.bucket_name,
+    }
+    if database.attributes_bucket_region is not None:
+        environment["ATTRIBUTES_BUCKET_REGION"] = database.attributes_bucket_region
+    if database.write_region is not None:
+        environment["DYNAMODB_WRITE_REGION"] = database.write_region
+    if database.dax_cluster is not None:
+        environment["DAX_ENDPOINT"] = database.dax_cluster.endpoint
+    for settings_environment in [
+        database.settings.email_index.to_environment(),
+        database.settings.large_attributes.to_environment(),
+        settings.dynamodb_client.to_environment(),
+        settings.cache.to_environment(),
+        settings.instrumentation.to_environment(),
+        settings.admission_control.to_environment(),
+    ]:
+        environment.update(settings_environment)
+    return environment
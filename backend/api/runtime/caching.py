@@ -0,0 +1,201 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import collections
+import dataclasses
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import instrumentation
+import users
+
+
+@dataclasses.dataclass
+class CacheStatistics:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+
+class CachingDatabase(users.DatabaseInterface):
+    def __init__(
+        self,
+        *,
+        database: users.DatabaseInterface,
+        max_size: int,
+        ttl_seconds: float,
+        negative_ttl_seconds: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        super().__init__()
+        self._database = database
+        self._max_size = max_size
+        self._ttl_seconds = ttl_seconds
+        self._negative_ttl_seconds = negative_ttl_seconds
+        self._clock = clock
+        # Maps username to (expiry time, user), None user caches a missing user
+        self._entries: collections.OrderedDict[
+            str, Tuple[float, Optional[Dict[str, Any]]]
+        ] = collections.OrderedDict()
+        self.statistics = CacheStatistics()
+        # Fanned out calls share the entries and statistics
+        self._lock = threading.Lock()
+
+    def create_user(
+        self, username: str, user_attributes: Dict[str, str]
+    ) -> Dict[str, Any]:
+        self._invalidate(username)
+        user = self._database.create_user(username, user_attributes)
+        self._put(username, user)
+        return user
+
+    def update_user(
+        self,
+        username: str,
+        user_attributes: Dict[str, str],
+        expected_version: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        self._invalidate(username)
+        user = self._database.update_user(username, user_attributes, expected_version)
+        self._put(username, user)
+        return user
+
+    def apply_user_update(
+        self,
+        username: str,
+        user_update: users.UserUpdate,
+        expected_version: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        self._invalidate(username)
+        user = self._database.apply_user_update(username, user_update, expected_version)
+        self._put(username, user)
+        return user
+
+    def get_user(
+        self, username: str, fields: Optional[Sequence[str]] = None
+    ) -> Optional[Dict[str, Any]]:
+        hit, user = self._lookup(username)
+        if hit:
+            return users.project_user(user, fields)
+        # Only whole users are cached, projected reads keep their smaller cost
+        user = self._database.get_user(username, fields)
+        if fields is None:
+            self._put(username, user)
+        return _copy(user)
+
+    def delete_user(
+        self, username: str, expected_version: Optional[int] = None
+    ) -> None:
+        self._invalidate(username)
+        self._database.delete_user(username, expected_version)
+        self._put(username, None)
+
+    def get_user_by_email(
+        self, email: str, fields: Optional[Sequence[str]] = None
+    ) -> Optional[Dict[str, Any]]:
+        # Keyed by username, emails are looked up in the database
+        return self._database.get_user_by_email(email, fields)
+
+    def find_users(
+        self, email: str, fields: Optional[Sequence[str]] = None
+    ) -> List[Dict[str, Any]]:
+        return self._database.find_users(email, fields)
+
+    def batch_get_users(
+        self, usernames: Sequence[str], fields: Optional[Sequence[str]] = None
+    ) -> List[users.BatchItemResult]:
+        results, missed_usernames = self._lookup_many(usernames, fields)
+        if missed_usernames:
+            for result in self._database.batch_get_users(missed_usernames, fields):
+                self._put_result(result, fields)
+                results[result.username] = result
+        return [results[username] for username in dict.fromkeys(usernames)]
+
+    def batch_write_users(
+        self,
+        users_to_put: Dict[str, Dict[str, str]],
+        usernames_to_delete: Sequence[str],
+    ) -> List[users.BatchItemResult]:
+        for username in list(users_to_put) + list(usernames_to_delete):
+            self._invalidate(username)
+        return self._database.batch_write_users(users_to_put, usernames_to_delete)
+
+    def list_users(
+        self,
+        limit: int,
+        cursor: Optional[str] = None,
+        fields: Optional[Sequence[str]] = None,
+    ) -> users.UsersPage:
+        return self._database.list_users(limit, cursor, fields)
+
+    def iter_users(self, total_segments: int = 1) -> Iterator[Dict[str, Any]]:
+        return self._database.iter_users(total_segments)
+
+    def _lookup(self, username: str) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None or entry[0] <= self._clock():
+                entry = None
+                self.statistics.misses += 1
+            else:
+                self._entries.move_to_end(username)
+                self.statistics.hits += 1
+        if entry is None:
+            instrumentation.add_count("CacheMisses")
+            return False, None
+        instrumentation.add_count("CacheHits")
+        return True, _copy(entry[1])
+
+    def _lookup_many(
+        self, usernames: Sequence[str], fields: Optional[Sequence[str]]
+    ) -> Tuple[Dict[str, users.BatchItemResult], List[str]]:
+        results: Dict[str, users.BatchItemResult] = {}
+        missed_usernames = []
+        for username in dict.fromkeys(usernames):
+            hit, user = self._lookup(username)
+            if hit:
+                results[username] = users.BatchItemResult.from_user(
+                    username, users.project_user(user, fields)
+                )
+            else:
+                missed_usernames.append(username)
+        return results, missed_usernames
+
+    def _put_result(
+        self, result: users.BatchItemResult, fields: Optional[Sequence[str]]
+    ) -> None:
+        if fields is None and result.status != users.BatchItemStatus.UNPROCESSED:
+            self._put(result.username, result.user)
+
+    def _put(self, username: str, user: Optional[Dict[str, Any]]) -> None:
+        ttl_seconds = self._negative_ttl_seconds if user is None else self._ttl_seconds
+        if ttl_seconds <= 0:
+            return
+        entry = (self._clock() + ttl_seconds, _copy(user))
+        with self._lock:
+            self._entries[username] = entry
+            self._entries.move_to_end(username)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+                self.statistics.evictions += 1
+
+    def _invalidate(self, username: str) -> None:
+        with self._lock:
+            self._entries.pop(username, None)
+
+
+def _copy(user: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    return None if user is None else dict(user)
@@ -0,0 +1,44 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+from typing import Optional
+
+import amazondax  # type: ignore
+import large_attributes
+import users
+from botocore import config
+
+
+class DaxDatabase(users.DynamoDBDatabase):
+    def __init__(
+        self,
+        table_name: str,
+        *,
+        dax_endpoint: str,
+        dynamodb_config: Optional[config.Config] = None,
+        email_index: users.EmailIndex = users.EmailIndex(),
+        large_attribute_store: Optional[large_attributes.LargeAttributes] = None,
+    ):
+        super().__init__(
+            table_name,
+            dynamodb_config=dynamodb_config,
+            email_index=email_index,
+            large_attribute_store=large_attribute_store,
+        )
+        # Item reads and writes go through the write-through item cache, scans
+        # keep reading DynamoDB as the query cache would serve stale pages
+        self._dynamodb = amazondax.AmazonDaxClient(
+            endpoint_url=dax_endpoint, config=dynamodb_config
+        )
@@ -0,0 +1,156 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import dataclasses
+import functools
+import time
+from concurrent import futures
+from typing import Any, Callable, Dict, List, Mapping, Optional, Protocol, Sequence
+
+import users
+
+# The default connection pool size of the DynamoDB client, more workers would
+# wait for connections rather than run requests
+DEFAULT_MAX_CONCURRENCY = 10
+# Left of the invocation's remaining time to build and return the response
+DEFAULT_DEADLINE_MARGIN_SECONDS = 1.0
+
+
+class DeadlineExceededError(Exception):
+    def __init__(self, username: str):
+        # Requests in flight at the deadline may still complete
+        super().__init__(f"Deadline exceeded before user {username} was processed")
+        self.username = username
+
+
+class RemainingTime(Protocol):
+    def get_remaining_time_in_millis(self) -> int:
+        ...
+
+
+@dataclasses.dataclass(frozen=True)
+class ItemResult:
+    username: str
+    user: Optional[Dict[str, Any]] = None
+    error: Optional[BaseException] = None
+
+
+class FanOutUsersRepository(users.UsersRepository):
+    """Users operations, with multi-user operations fanned out to a thread pool.
+
+    Every user is a single-item call of the repository, admitted from its budget
+    and sent over the shared client, with at most max_concurrency in flight.
+    The threads share the database, which must be safe to call concurrently as
+    the DynamoDB, in-memory and caching databases are.
+    Results keep the order of the users, with the error of each failed call.
+    Calls still queued at the deadline are cancelled and fail with
+    DeadlineExceededError.
+    """
+
+    def __init__(
+        self,
+        *,
+        database: users.DatabaseInterface,
+        read_budget: Optional[users.AdaptiveTokenBucket] = None,
+        write_budget: Optional[users.AdaptiveTokenBucket] = None,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        super().__init__(
+            database=database, read_budget=read_budget, write_budget=write_budget
+        )
+        self._max_concurrency = max_concurrency
+        self._clock = clock
+
+    def get_users_many(
+        self,
+        usernames: Sequence[str],
+        fields: Optional[Sequence[str]] = None,
+        *,
+        deadline: Optional[float] = None,
+    ) -> List[ItemResult]:
+        # A user not found has neither a user nor an error
+        calls = {
+            username: functools.partial(self.get_user, username, fields)
+            for username in dict.fromkeys(usernames)
+        }
+        return self._fan_out(calls, deadline)
+
+    def update_users_many(
+        self,
+        users_attributes: Mapping[str, Dict[str, str]],
+        expected_versions: Optional[Mapping[str, int]] = None,
+        *,
+        deadline: Optional[float] = None,
+    ) -> List[ItemResult]:
+        expected_versions = expected_versions or {}
+        calls = {
+            username: functools.partial(
+                self.update_user,
+                username,
+                user_attributes,
+                expected_versions.get(username),
+            )
+            for username, user_attributes in users_attributes.items()
+        }
+        return self._fan_out(calls, deadline)
+
+    def _fan_out(
+        self,
+        calls: Mapping[str, Callable[[], Optional[Dict[str, Any]]]],
+        deadline: Optional[float],
+    ) -> List[ItemResult]:
+        if not calls:
+            return []
+        executor = futures.ThreadPoolExecutor(
+            max_workers=min(self._max_concurrency, len(calls))
+        )
+        try:
+            submitted = {
+                username: executor.submit(call) for username, call in calls.items()
+            }
+            futures.wait(submitted.values(), timeout=self._timeout(deadline))
+        finally:
+            # Returns at the deadline, without waiting for the calls in flight
+            executor.shutdown(wait=False, cancel_futures=True)
+        return [
+            _item_result(username, future) for username, future in submitted.items()
+        ]
+
+    def _timeout(self, deadline: Optional[float]) -> Optional[float]:
+        if deadline is None:
+            return None
+        return max(0.0, deadline - self._clock())
+
+
+def deadline_from_context(
+    context: RemainingTime,
+    margin_seconds: float = DEFAULT_DEADLINE_MARGIN_SECONDS,
+    clock: Callable[[], float] = time.monotonic,
+) -> float:
+    # Monotonic, as the deadlines of the repository
+    remaining_seconds = context.get_remaining_time_in_millis() / 1000
+    return clock() + max(0.0, remaining_seconds - margin_seconds)
+
+
+def _item_result(
+    username: str, future: "futures.Future[Optional[Dict[str, Any]]]"
+) -> ItemResult:
+    if not future.done() or future.cancelled():
+        return ItemResult(username, error=DeadlineExceededError(username))
+    exception = future.exception()
+    if exception is not None:
+        return ItemResult(username, error=exception)
+    return ItemResult(username, user=future.result())
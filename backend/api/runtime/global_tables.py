@@ -0,0 +1,109 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import users
+
+
+class GlobalTableDatabase(users.DatabaseInterface):
+    """Reads the local replica of global tables, writes the primary region's.
+
+    Replicas accept writes in every region, but their conditions are only
+    checked against the replica written to, and replication keeps the last
+    writer. Writing every user in one region keeps version checks and email
+    claims exclusive across regions, at the latency of a round trip to it.
+    Reads stay local and may miss writes not replicated yet.
+    """
+
+    def __init__(
+        self,
+        *,
+        local_database: users.DatabaseInterface,
+        primary_database: users.DatabaseInterface,
+    ):
+        super().__init__()
+        self._local_database = local_database
+        self._primary_database = primary_database
+
+    def create_user(
+        self, username: str, user_attributes: Dict[str, str]
+    ) -> Dict[str, Any]:
+        return self._primary_database.create_user(username, user_attributes)
+
+    def update_user(
+        self,
+        username: str,
+        user_attributes: Dict[str, str],
+        expected_version: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        return self._primary_database.update_user(
+            username, user_attributes, expected_version
+        )
+
+    def apply_user_update(
+        self,
+        username: str,
+        user_update: users.UserUpdate,
+        expected_version: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        return self._primary_database.apply_user_update(
+            username, user_update, expected_version
+        )
+
+    def get_user(
+        self, username: str, fields: Optional[Sequence[str]] = None
+    ) -> Optional[Dict[str, Any]]:
+        return self._local_database.get_user(username, fields)
+
+    def delete_user(
+        self, username: str, expected_version: Optional[int] = None
+    ) -> None:
+        self._primary_database.delete_user(username, expected_version)
+
+    def get_user_by_email(
+        self, email: str, fields: Optional[Sequence[str]] = None
+    ) -> Optional[Dict[str, Any]]:
+        return self._local_database.get_user_by_email(email, fields)
+
+    def find_users(
+        self, email: str, fields: Optional[Sequence[str]] = None
+    ) -> List[Dict[str, Any]]:
+        return self._local_database.find_users(email, fields)
+
+    def batch_get_users(
+        self, usernames: Sequence[str], fields: Optional[Sequence[str]] = None
+    ) -> List[users.BatchItemResult]:
+        return self._local_database.batch_get_users(usernames, fields)
+
+    def batch_write_users(
+        self,
+        users_to_put: Dict[str, Dict[str, str]],
+        usernames_to_delete: Sequence[str],
+    ) -> List[users.BatchItemResult]:
+        return self._primary_database.batch_write_users(
+            users_to_put, usernames_to_delete
+        )
+
+    def list_users(
+        self,
+        limit: int,
+        cursor: Optional[str] = None,
+        fields: Optional[Sequence[str]] = None,
+    ) -> users.UsersPage:
+        return self._local_database.list_users(limit, cursor, fields)
+
+    def iter_users(self, total_segments: int = 1) -> Iterator[Dict[str, Any]]:
+        return self._local_database.iter_users(total_segments)
@@ -13,12 +13,193 @@
 # IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
+import functools
 import os
+from typing import Literal, Optional, cast
 
+import caching
+import fan_out
+import global_tables
+import large_attributes
+import serialization
+import stats
 import users
+from botocore import config
 
 
-def init_users_repository() -> users.UsersRepository:
-    dynamodb_database = users.DynamoDBDatabase(os.environ["DYNAMODB_TABLE_NAME"])
-    users_repository = users.UsersRepository(database=dynamodb_database)
+def init_dynamodb_config(region_name: Optional[str] = None) -> config.Config:
+    dynamodb_config = config.Config(
+        # The function's region by default
+        region_name=region_name or os.environ.get("DYNAMODB_REGION"),
+        max_pool_connections=int(os.environ.get("DYNAMODB_MAX_POOL_CONNECTIONS", "10")),
+        tcp_keepalive=os.environ.get("DYNAMODB_TCP_KEEPALIVE", "false") == "true",
+        connect_timeout=float(os.environ.get("DYNAMODB_CONNECT_TIMEOUT", "60")),
+        read_timeout=float(os.environ.get("DYNAMODB_READ_TIMEOUT", "60")),
+        retries={
+            "mode": cast(
+                Literal["legacy", "standard", "adaptive"],
+                os.environ.get("DYNAMODB_RETRY_MODE", "legacy"),
+            ),
+            "max_attempts": int(os.environ.get("DYNAMODB_MAX_ATTEMPTS", "5")),
+        },
+    )
+    return dynamodb_config
+
+
+def init_email_index() -> users.EmailIndex:
+    # * when the index projects all attributes, else the projected non-key ones
+    projected_attributes = os.environ.get("DYNAMODB_EMAIL_INDEX_ATTRIBUTES", "*")
+    return users.EmailIndex(
+        index_name=os.environ.get("DYNAMODB_EMAIL_INDEX_NAME", "email"),
+        projected_attributes=None
+        if projected_attributes == "*"
+        else frozenset(filter(None, projected_attributes.split(","))),
+        claims_table_name=os.environ.get("DYNAMODB_EMAIL_TABLE_NAME"),
+    )
+
+
+def init_large_attributes() -> Optional[large_attributes.LargeAttributes]:
+    return create_large_attributes(
+        compression_threshold_bytes=int(
+            os.environ.get("DYNAMODB_COMPRESSION_THRESHOLD", "0")
+        ),
+        offload_threshold_bytes=int(
+            os.environ.get("DYNAMODB_OFFLOAD_THRESHOLD", "65536")
+        ),
+        bucket_name=os.environ.get("ATTRIBUTES_BUCKET_NAME"),
+        bucket_region=os.environ.get("ATTRIBUTES_BUCKET_REGION"),
+    )
+
+
+def create_large_attributes(
+    *,
+    compression_threshold_bytes: int,
+    # Items are limited to 400 KB, offloading keeps a margin for the others
+    offload_threshold_bytes: int = 65536,
+    bucket_name: Optional[str] = None,
+    # Replica regions of global tables use the bucket of the primary region
+    bucket_region: Optional[str] = None,
+) -> Optional[large_attributes.LargeAttributes]:
+    # 0 keeps every value as is
+    if compression_threshold_bytes == 0:
+        return None
+    return large_attributes.LargeAttributes(
+        compression_threshold_bytes=compression_threshold_bytes,
+        offload_threshold_bytes=offload_threshold_bytes,
+        bucket_name=bucket_name,
+        s3_config=None
+        if bucket_region is None
+        else config.Config(region_name=bucket_region),
+        plain_attributes=frozenset(
+            {"username", users.VERSION_ATTRIBUTE, users.EMAIL_ATTRIBUTE}
+        ),
+    )
+
+
+def init_json_serializer() -> serialization.JsonSerializer:
+    # orjson, falling back to json where it isn't installed, or json
+    return serialization.create_serializer(
+        os.environ.get("USERS_JSON_SERIALIZER", "orjson")
+    )
+
+
+def init_database() -> users.DatabaseInterface:
+    database: users.DatabaseInterface
+    if os.environ.get("USERS_DATABASE", "dynamodb") == "in_memory":
+        # Local runs and benchmarks without AWS access
+        import in_memory  # pylint: disable=import-outside-toplevel
+
+        database = in_memory.InMemoryDatabase(
+            latency_seconds=float(os.environ.get("IN_MEMORY_DATABASE_LATENCY", "0"))
+        )
+    elif "DAX_ENDPOINT" in os.environ:
+        # Deferred, stacks without a DAX cluster don't pay for importing its client
+        import dax  # pylint: disable=import-outside-toplevel
+
+        database = dax.DaxDatabase(
+            os.environ["DYNAMODB_TABLE_NAME"],
+            dax_endpoint=os.environ["DAX_ENDPOINT"],
+            dynamodb_config=init_dynamodb_config(),
+            email_index=init_email_index(),
+            large_attribute_store=init_large_attributes(),
+        )
+    else:
+        database = init_dynamodb_database()
+    if "DYNAMODB_WRITE_REGION" in os.environ:
+        # Global tables check conditions in the replica written to only, the
+        # replica regions write the primary region's
+        database = global_tables.GlobalTableDatabase(
+            local_database=database,
+            primary_database=init_dynamodb_database(
+                os.environ["DYNAMODB_WRITE_REGION"]
+            ),
+        )
+    if os.environ.get("USERS_CACHE_ENABLED", "false") == "true":
+        database = caching.CachingDatabase(
+            database=database,
+            max_size=int(os.environ.get("USERS_CACHE_MAX_SIZE", "1024")),
+            ttl_seconds=float(os.environ.get("USERS_CACHE_TTL", "30")),
+            negative_ttl_seconds=float(os.environ.get("USERS_CACHE_NEGATIVE_TTL", "5")),
+        )
+    return database
+
+
+def init_dynamodb_database(region_name: Optional[str] = None) -> users.DynamoDBDatabase:
+    return users.DynamoDBDatabase(
+        os.environ["DYNAMODB_TABLE_NAME"],
+        dynamodb_config=init_dynamodb_config(region_name),
+        email_index=init_email_index(),
+        large_attribute_store=init_large_attributes(),
+    )
+
+
+def init_budget(max_rate_variable: str) -> Optional[users.AdaptiveTokenBucket]:
+    if os.environ.get("USERS_ADMISSION_CONTROL_ENABLED", "false") != "true":
+        return None
+    # Per execution environment, each one adapts to the throttling it observes
+    return users.AdaptiveTokenBucket(
+        max_rate=float(os.environ.get(max_rate_variable, "100")),
+        min_rate=float(os.environ.get("USERS_ADMISSION_MIN_RATE", "1")),
+        decrease_factor=float(os.environ.get("USERS_ADMISSION_DECREASE_FACTOR", "0.5")),
+        recovery_rate=float(os.environ.get("USERS_ADMISSION_RECOVERY_RATE", "1")),
+    )
+
+
+def init_users_repository() -> fan_out.FanOutUsersRepository:
+    users_repository = fan_out.FanOutUsersRepository(
+        database=init_database(),
+        read_budget=init_budget("USERS_ADMISSION_READ_MAX_RATE"),
+        write_budget=init_budget("USERS_ADMISSION_WRITE_MAX_RATE"),
+        # Up to the connection pool size of the shared client
+        max_concurrency=int(
+            os.environ.get(
+                "USERS_MAX_CONCURRENCY",
+                os.environ.get("DYNAMODB_MAX_POOL_CONNECTIONS", "10"),
+            )
+        ),
+    )
     return users_repository
+
+
+# Built once per execution environment and reused across invocations, so that
+# warm invocations skip client construction and reuse pooled connections
+@functools.lru_cache(maxsize=None)
+def get_users_repository() -> fan_out.FanOutUsersRepository:
+    return init_users_repository()
+
+
+@functools.lru_cache(maxsize=None)
+def get_stats_reader() -> Optional[stats.StatsReaderInterface]:
+    if os.environ.get("USERS_DATABASE", "dynamodb") == "in_memory":
+        # Local runs and benchmarks without AWS access
+        import in_memory  # pylint: disable=import-outside-toplevel
+
+        return in_memory.InMemoryStatsReader(
+            latency_seconds=float(os.environ.get("IN_MEMORY_DATABASE_LATENCY", "0"))
+        )
+    # Stacks without the stream aggregates have no stats table
+    if "STATS_TABLE_NAME" not in os.environ:
+        return None
+    return stats.StatsReader(
+        os.environ["STATS_TABLE_NAME"], dynamodb_config=init_dynamodb_config()
+    )
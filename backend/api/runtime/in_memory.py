@@ -0,0 +1,228 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import bisect
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import stats
+import users
+
+
+class InMemoryDatabase(users.DatabaseInterface):
+    def __init__(self, *, latency_seconds: float = 0):
+        super().__init__()
+        # Simulated round trip added to every call, 0 disables it
+        self._latency_seconds = latency_seconds
+        self._users: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def create_user(
+        self, username: str, user_attributes: Dict[str, str]
+    ) -> Dict[str, Any]:
+        self._wait()
+        user: Dict[str, Any] = {"username": username}
+        user.update(user_attributes)
+        user[users.VERSION_ATTRIBUTE] = 1
+        with self._lock:
+            if username in self._users:
+                raise users.UserAlreadyExistsError(username)
+            self._check_email_available(username, user)
+            self._users[username] = user
+        return dict(user)
+
+    def update_user(
+        self,
+        username: str,
+        user_attributes: Dict[str, str],
+        expected_version: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        return self.apply_user_update(
+            username,
+            users.UserUpdate(set_attributes=user_attributes),
+            expected_version,
+        )
+
+    def apply_user_update(
+        self,
+        username: str,
+        user_update: users.UserUpdate,
+        expected_version: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        user_update = users.with_version_increment(user_update)
+        self._wait()
+        with self._lock:
+            user = dict(self._get_expected_user(username, expected_version))
+            user.update(user_update.set_attributes)
+            for name, value in user_update.set_attributes_if_not_exists.items():
+                user.setdefault(name, value)
+            for name in user_update.remove_attributes:
+                user.pop(name, None)
+            for name, value in user_update.add_values.items():
+                user[name] = _add(user.get(name), value)
+            self._check_email_available(username, user)
+            self._users[username] = user
+            return dict(user)
+
+    def get_user(
+        self, username: str, fields: Optional[Sequence[str]] = None
+    ) -> Optional[Dict[str, Any]]:
+        self._wait()
+        with self._lock:
+            return _copy(users.project_user(self._users.get(username), fields))
+
+    def delete_user(
+        self, username: str, expected_version: Optional[int] = None
+    ) -> None:
+        self._wait()
+        with self._lock:
+            self._get_expected_user(username, expected_version)
+            del self._users[username]
+
+    def get_user_by_email(
+        self, email: str, fields: Optional[Sequence[str]] = None
+    ) -> Optional[Dict[str, Any]]:
+        found_users = self.find_users(email, fields)
+        return found_users[0] if found_users else None
+
+    def find_users(
+        self, email: str, fields: Optional[Sequence[str]] = None
+    ) -> List[Dict[str, Any]]:
+        self._wait()
+        with self._lock:
+            return [
+                users.project_user(dict(self._users[username]), fields)
+                for username in sorted(self._users)
+                if self._users[username].get(users.EMAIL_ATTRIBUTE) == email
+            ]
+
+    def batch_get_users(
+        self, usernames: Sequence[str], fields: Optional[Sequence[str]] = None
+    ) -> List[users.BatchItemResult]:
+        self._wait()
+        with self._lock:
+            return [
+                users.BatchItemResult.from_user(
+                    username,
+                    _copy(users.project_user(self._users.get(username), fields)),
+                )
+                for username in dict.fromkeys(usernames)
+            ]
+
+    def batch_write_users(
+        self,
+        users_to_put: Dict[str, Dict[str, str]],
+        usernames_to_delete: Sequence[str],
+    ) -> List[users.BatchItemResult]:
+        self._wait()
+        results = []
+        with self._lock:
+            for username, user_attributes in users_to_put.items():
+                results.append(self._put_batch_user(username, user_attributes))
+            for username in dict.fromkeys(usernames_to_delete):
+                self._users.pop(username, None)
+                results.append(
+                    users.BatchItemResult(username, users.BatchItemStatus.DELETED)
+                )
+        return results
+
+    def list_users(
+        self,
+        limit: int,
+        cursor: Optional[str] = None,
+        fields: Optional[Sequence[str]] = None,
+    ) -> users.UsersPage:
+        self._wait()
+        with self._lock:
+            usernames = sorted(self._users)
+            start = 0
+            if cursor is not None:
+                last_username = users.decode_cursor(cursor).get("username", "")
+                start = bisect.bisect_right(usernames, last_username)
+            page = [
+                users.project_user(dict(self._users[username]), fields)
+                for username in usernames[start:][:limit]
+            ]
+        next_cursor = None
+        if start + limit < len(usernames):
+            next_cursor = users.encode_cursor({"username": page[-1]["username"]})
+        return users.UsersPage(page, next_cursor)
+
+    def iter_users(self, total_segments: int = 1) -> Iterator[Dict[str, Any]]:
+        with self._lock:
+            snapshot = [dict(user) for user in self._users.values()]
+        yield from snapshot
+
+    def _get_expected_user(
+        self, username: str, expected_version: Optional[int]
+    ) -> Dict[str, Any]:
+        if username not in self._users:
+            raise users.UserNotFoundError(username)
+        user = self._users[username]
+        if expected_version is not None and users.get_version(user) != expected_version:
+            raise users.VersionConflictError(username, expected_version)
+        return user
+
+    def _put_batch_user(
+        self, username: str, user_attributes: Dict[str, Any]
+    ) -> users.BatchItemResult:
+        current_user = self._users.get(username, {})
+        user = dict(
+            users.with_next_version(user_attributes, current_user), username=username
+        )
+        try:
+            self._check_email_available(username, user)
+        except users.EmailAlreadyInUseError:
+            return users.BatchItemResult(username, users.BatchItemStatus.CONFLICT)
+        self._users[username] = user
+        return users.BatchItemResult(username, users.BatchItemStatus.PUT, dict(user))
+
+    def _check_email_available(self, username: str, user: Dict[str, Any]) -> None:
+        # A scan is fine in memory, DynamoDB claims emails in a second table
+        email = user.get(users.EMAIL_ATTRIBUTE)
+        if email is None:
+            return
+        for other_username, other_user in self._users.items():
+            if other_username != username and (
+                other_user.get(users.EMAIL_ATTRIBUTE) == email
+            ):
+                raise users.EmailAlreadyInUseError(email)
+
+    def _wait(self) -> None:
+        if self._latency_seconds > 0:
+            time.sleep(self._latency_seconds)
+
+
+def _copy(user: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    return None if user is None else dict(user)
+
+
+def _add(current_value: Any, value: Any) -> Any:
+    if isinstance(value, (set, frozenset)):
+        return set(current_value or set()) | value
+    return (current_value or 0) + value
+
+
+class InMemoryStatsReader(stats.StatsReaderInterface):
+    # Local runs have no table stream to aggregate, the stats stay empty
+    def __init__(self, *, latency_seconds: float = 0):
+        # Simulated round trip of the summary item read, 0 disables it
+        self._latency_seconds = latency_seconds
+
+    def get_stats(self) -> stats.UsersStats:
+        if self._latency_seconds > 0:
+            time.sleep(self._latency_seconds)
+        return stats.UsersStats()
@@ -0,0 +1,150 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import functools
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional, TypeVar, Union, cast
+
+from aws_lambda_powertools import metrics as powertools_metrics
+from aws_lambda_powertools.event_handler import api_gateway
+
+# Read once per execution environment, disabled instrumentation leaves the
+# decorated functions untouched and costs nothing per invocation
+METRICS_ENABLED = os.environ.get("USERS_METRICS_ENABLED", "false") == "true"
+TRACING_ENABLED = os.environ.get("USERS_TRACING_ENABLED", "false") == "true"
+
+_F = TypeVar("_F", bound=Callable[..., Any])
+
+metrics = powertools_metrics.Metrics(
+    namespace=os.environ.get("POWERTOOLS_METRICS_NAMESPACE", "UserManagement")
+)
+
+
+@functools.lru_cache(maxsize=None)
+def get_tracer() -> Any:
+    # Deferred, the X-Ray SDK is only imported when tracing is enabled
+    from aws_lambda_powertools import tracing  # pylint: disable=import-outside-toplevel
+
+    return tracing.Tracer()
+
+
+def instrument_handler(handler: _F) -> _F:
+    if TRACING_ENABLED:
+        handler = get_tracer().capture_lambda_handler(handler)
+    if METRICS_ENABLED:
+        handler = metrics.log_metrics(handler, capture_cold_start_metric=True)
+    return handler
+
+
+def timed(
+    metric_name: str, dimension_name: str, dimension_value: Optional[str] = None
+) -> Callable[[_F], _F]:
+    """Record the latency of every call in its own metric, dimensioned by
+    dimension_value or the function name."""
+
+    def decorator(function: _F) -> _F:
+        value = dimension_value or function.__name__
+        if TRACING_ENABLED:
+            function = get_tracer().capture_method(function)
+        if not METRICS_ENABLED:
+            return function
+
+        @functools.wraps(function)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                add_latency(metric_name, start, {dimension_name: value})
+
+        return cast(_F, wrapper)
+
+    return decorator
+
+
+def route_middleware(
+    app: api_gateway.ApiGatewayResolver,
+    next_middleware: Callable[[api_gateway.ApiGatewayResolver], api_gateway.Response],
+) -> api_gateway.Response:
+    # Route functions are named after the route, e.g. get_user
+    route = app.context["_route"].func.__name__
+    metrics.add_dimension(name="Route", value=route)
+    metrics.add_metric(
+        name="RouteRequests", unit=powertools_metrics.MetricUnit.Count, value=1
+    )
+    start = time.perf_counter()
+    try:
+        return next_middleware(app)
+    finally:
+        elapsed_milliseconds = (time.perf_counter() - start) * 1000
+        metrics.add_metric(
+            name="RouteLatency",
+            unit=powertools_metrics.MetricUnit.Milliseconds,
+            value=elapsed_milliseconds,
+        )
+
+
+def register_consumed_capacity(dynamodb: Any) -> None:
+    """Request and record the consumed capacity of every call of a client."""
+    if not METRICS_ENABLED:
+        return
+    dynamodb.meta.events.register(
+        "provide-client-params.dynamodb.*", _request_consumed_capacity
+    )
+    dynamodb.meta.events.register("after-call.dynamodb.*", _record_consumed_capacity)
+
+
+def add_count(metric_name: str, value: int = 1) -> None:
+    if METRICS_ENABLED:
+        metrics.add_metric(
+            name=metric_name, unit=powertools_metrics.MetricUnit.Count, value=value
+        )
+
+
+def add_latency(metric_name: str, start: float, dimensions: Dict[str, str]) -> None:
+    elapsed_milliseconds = (time.perf_counter() - start) * 1000
+    _add_single_metric(metric_name, "Milliseconds", elapsed_milliseconds, dimensions)
+
+
+def _request_consumed_capacity(params: Dict[str, Any], **_: Any) -> None:
+    params.setdefault("ReturnConsumedCapacity", "TOTAL")
+
+
+def _record_consumed_capacity(parsed: Dict[str, Any], **kwargs: Any) -> None:
+    consumed_capacity: Union[Dict[str, Any], List[Dict[str, Any]]] = parsed.get(
+        "ConsumedCapacity", []
+    )
+    # Batch operations report one entry per table
+    if isinstance(consumed_capacity, dict):
+        consumed_capacity = [consumed_capacity]
+    capacity_units = sum(entry.get("CapacityUnits", 0) for entry in consumed_capacity)
+    _add_single_metric(
+        "ConsumedCapacity", "Count", capacity_units, {"Operation": kwargs["model"].name}
+    )
+
+
+def _add_single_metric(
+    metric_name: str, unit: str, value: float, dimensions: Dict[str, str]
+) -> None:
+    # Own EMF blob, its dimensions differ from the per-invocation ones
+    with powertools_metrics.single_metric(
+        name=metric_name,
+        unit=powertools_metrics.MetricUnit(unit),
+        value=value,
+        namespace=metrics.namespace,
+        default_dimensions=dimensions,
+    ):
+        pass
@@ -13,64 +13,381 @@
 # IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-from typing import Any, Dict, Optional
+import dataclasses
+import decimal
+import hashlib
+import http
+import math
+import os
+from typing import Any, Dict, List, Optional
 
 from aws_lambda_powertools.event_handler import api_gateway
+from aws_lambda_powertools.event_handler import content_types
 from aws_lambda_powertools.event_handler import exceptions
+from aws_lambda_powertools.utilities.data_classes import api_gateway_proxy_event
 
+import fan_out  # isort: skip
 import helpers  # isort: skip
+import instrumentation  # isort: skip
+import serialization  # isort: skip
+import users  # isort: skip
 
-app = api_gateway.ApiGatewayResolver(
-    proxy_type=api_gateway.ProxyEventType.APIGatewayProxyEventV2
+BATCH_MAX_ITEMS = 1000
+LIST_DEFAULT_LIMIT = 25
+LIST_MAX_LIMIT = 100
+
+
+json_serializer: serialization.JsonSerializer = helpers.init_json_serializer()
+
+
+@instrumentation.timed("SerializationLatency", "Step")
+def serializer(value: Any) -> str:
+    return json_serializer.dumps(value)
+
+
+class Resolver(api_gateway.ApiGatewayResolver):
+    # Request bodies are parsed by json_body with the same serializer
+    def _to_proxy_event(
+        self, event: Dict[str, Any]
+    ) -> api_gateway_proxy_event.APIGatewayProxyEventV2:
+        return api_gateway_proxy_event.APIGatewayProxyEventV2(
+            event, json_deserializer=json_serializer.loads
+        )
+
+
+app = Resolver(
+    proxy_type=api_gateway.ProxyEventType.APIGatewayProxyEventV2,
+    serializer=serializer,
 )
+if instrumentation.METRICS_ENABLED:
+    app.use(middlewares=[instrumentation.route_middleware])
+
 
+# Build the repository during the init phase, which runs at full CPU and ahead
+# of the first request when concurrency is provisioned
+if "DYNAMODB_TABLE_NAME" in os.environ:
+    helpers.get_users_repository()
 
+
+@app.exception_handler(users.RateLimitExceededError)  # type: ignore
+def rate_limit_exceeded(
+    exception: users.RateLimitExceededError,
+) -> api_gateway.Response:
+    # Whole seconds, at least one so that clients back off
+    retry_after_seconds = max(1, math.ceil(exception.retry_after_seconds))
+    return api_gateway.Response(
+        status_code=http.HTTPStatus.TOO_MANY_REQUESTS,
+        content_type=content_types.APPLICATION_JSON,
+        body=serializer({"message": str(exception)}),
+        headers={"Retry-After": str(retry_after_seconds)},
+    )
+
+
+@instrumentation.instrument_handler
 def lambda_handler(event: Dict[str, Any], context: object) -> Dict[str, Any]:
     return app.resolve(event, context)
 
 
 @app.post("/users")  # type: ignore
-def create_user() -> Dict[str, Any]:
+def create_user() -> api_gateway.Response:
     user_attributes = app.current_event.json_body
     username = user_attributes["username"]
     del user_attributes["username"]
-    users_repository = helpers.init_users_repository()
-    user = users_repository.get_user(username)
-    if user is not None:
-        raise exceptions.BadRequestError(f"User {username} already exists")
-    created_user: Dict[str, Any] = users_repository.create_user(
-        username, user_attributes
-    )
-    return created_user
+    users_repository = helpers.get_users_repository()
+    try:
+        created_user: Dict[str, Any] = users_repository.create_user(
+            username, user_attributes
+        )
+    except (
+        ValueError,
+        users.UserAlreadyExistsError,
+        users.EmailAlreadyInUseError,
+    ) as exception:
+        raise exceptions.BadRequestError(str(exception)) from exception
+    return _user_response(created_user)
 
 
 @app.put("/users/<username>")  # type: ignore
-def update_user(username: str) -> Dict[str, Any]:
+def update_user(username: str) -> api_gateway.Response:
     user_attributes = app.current_event.json_body
-    users_repository = helpers.init_users_repository()
-    user = users_repository.get_user(username)
-    if user is None:
-        raise exceptions.NotFoundError(f"User {username} does not exist")
-    updated_user: Dict[str, Any] = users_repository.update_user(
-        username, user_attributes
-    )
-    return updated_user
+    expected_version = _get_expected_version()
+    users_repository = helpers.get_users_repository()
+    try:
+        updated_user: Dict[str, Any] = users_repository.update_user(
+            username, user_attributes, expected_version
+        )
+    except (ValueError, users.EmailAlreadyInUseError) as exception:
+        raise exceptions.BadRequestError(str(exception)) from exception
+    except users.UserNotFoundError as exception:
+        raise exceptions.NotFoundError(str(exception)) from exception
+    except users.VersionConflictError as exception:
+        raise _precondition_failed(exception) from exception
+    return _user_response(updated_user)
+
+
+@app.patch("/users/<username>")  # type: ignore
+def patch_user(username: str) -> api_gateway.Response:
+    user_update = _parse_user_update(app.current_event.json_body)
+    expected_version = _get_expected_version()
+    users_repository = helpers.get_users_repository()
+    try:
+        updated_user: Dict[str, Any] = users_repository.apply_user_update(
+            username, user_update, expected_version
+        )
+    except (ValueError, users.EmailAlreadyInUseError) as exception:
+        raise exceptions.BadRequestError(str(exception)) from exception
+    except users.UserNotFoundError as exception:
+        raise exceptions.NotFoundError(str(exception)) from exception
+    except users.VersionConflictError as exception:
+        raise _precondition_failed(exception) from exception
+    return _user_response(updated_user)
+
+
+@app.get("/stats/users")  # type: ignore
+def get_users_stats() -> Dict[str, Any]:
+    # Maintained from the table stream, a single read instead of a scan. Outside
+    # of /users, where it would shadow a user named stats
+    stats_reader = helpers.get_stats_reader()
+    if stats_reader is None:
+        raise exceptions.NotFoundError("User stats are not enabled")
+    return dataclasses.asdict(stats_reader.get_stats())
 
 
 @app.get("/users/<username>")  # type: ignore
-def get_user(username: str) -> Dict[str, Any]:
-    users_repository = helpers.init_users_repository()
-    user: Optional[Dict[str, Any]] = users_repository.get_user(username)
+def get_user(username: str) -> api_gateway.Response:
+    fields = _get_fields()
+    if fields is not None:
+        # The version is projected too, every response carries an ETag
+        fields.append(users.VERSION_ATTRIBUTE)
+    users_repository = helpers.get_users_repository()
+    user: Optional[Dict[str, Any]] = users_repository.get_user(username, fields)
     if user is None:
         raise exceptions.NotFoundError(f"User {username} does not exist")
-    return user
+    entity_tag = _entity_tag(user, fields)
+    if_none_match = app.current_event.get_header_value("If-None-Match")
+    if if_none_match is not None and _matches_entity_tag(if_none_match, entity_tag):
+        return api_gateway.Response(
+            status_code=http.HTTPStatus.NOT_MODIFIED, headers={"ETag": entity_tag}
+        )
+    return _user_response(user, fields)
+
+
+@app.get("/users")  # type: ignore
+def list_users() -> Dict[str, Any]:
+    email = app.current_event.get_query_string_value(name="email")
+    if email is not None:
+        return _find_users(email)
+    limit = _get_limit()
+    cursor = app.current_event.get_query_string_value(name="cursor")
+    users_repository = helpers.get_users_repository()
+    try:
+        users_page = users_repository.list_users(limit, cursor, _get_fields())
+    except users.InvalidCursorError as exception:
+        raise exceptions.BadRequestError(str(exception)) from exception
+    return dataclasses.asdict(users_page)
 
 
 @app.delete("/users/<username>")  # type: ignore
 def delete_user(username: str) -> Dict[str, Any]:
-    users_repository = helpers.init_users_repository()
-    user = users_repository.get_user(username)
-    if user is None:
-        raise exceptions.NotFoundError(f"User {username} does not exist")
-    users_repository.delete_user(username)
+    expected_version = _get_expected_version()
+    users_repository = helpers.get_users_repository()
+    try:
+        users_repository.delete_user(username, expected_version)
+    except users.UserNotFoundError as exception:
+        raise exceptions.NotFoundError(str(exception)) from exception
+    except users.VersionConflictError as exception:
+        raise _precondition_failed(exception) from exception
     return {"message": f"User {username} was deleted"}
+
+
+@app.post("/users:batchGet")  # type: ignore
+def batch_get_users() -> Dict[str, Any]:
+    batch = app.current_event.json_body
+    usernames: List[str] = batch["usernames"]
+    fields: Optional[List[str]] = batch.get("fields")
+    _validate_batch_size(len(usernames))
+    users_repository = helpers.get_users_repository()
+    results = users_repository.batch_get_users(usernames, fields)
+    return {"results": [dataclasses.asdict(result) for result in results]}
+
+
+@app.post("/users:batchWrite")  # type: ignore
+def batch_write_users() -> Dict[str, Any]:
+    batch = app.current_event.json_body
+    users_to_put_attributes: List[Dict[str, str]] = batch.get("put", [])
+    usernames_to_delete: List[str] = batch.get("delete", [])
+    _validate_batch_writes(
+        [user["username"] for user in users_to_put_attributes] + usernames_to_delete
+    )
+    users_to_put = {
+        user_attributes.pop("username"): user_attributes
+        for user_attributes in users_to_put_attributes
+    }
+    users_repository = helpers.get_users_repository()
+    try:
+        results = users_repository.batch_write_users(users_to_put, usernames_to_delete)
+    except ValueError as exception:
+        raise exceptions.BadRequestError(str(exception)) from exception
+    return {"results": [dataclasses.asdict(result) for result in results]}
+
+
+@app.post("/users:batchUpdate")  # type: ignore
+def batch_update_users() -> Dict[str, Any]:
+    batch = app.current_event.json_body
+    users_to_update: List[Dict[str, str]] = batch["users"]
+    expected_versions: Dict[str, int] = batch.get("expectedVersions", {})
+    _validate_batch_size(len(users_to_update))
+    users_attributes = {
+        user_attributes.pop("username"): user_attributes
+        for user_attributes in users_to_update
+    }
+    if len(users_attributes) != len(users_to_update):
+        raise exceptions.BadRequestError("Each user can be updated once per batch")
+    users_repository = helpers.get_users_repository()
+    results = users_repository.update_users_many(
+        users_attributes, expected_versions, deadline=_get_deadline()
+    )
+    return {"results": [_item_result(result) for result in results]}
+
+
+def _find_users(email: str) -> Dict[str, Any]:
+    # Emails are unique, the single page of an email lookup has no cursor
+    users_repository = helpers.get_users_repository()
+    found_users = users_repository.find_users(email, _get_fields())
+    return dataclasses.asdict(users.UsersPage(found_users))
+
+
+def _parse_user_update(update: Dict[str, Any]) -> users.UserUpdate:
+    user_update = users.UserUpdate(
+        set_attributes=update.get("set", {}),
+        set_attributes_if_not_exists=update.get("setIfNotExists", {}),
+        remove_attributes=tuple(update.get("remove", [])),
+        add_values={
+            name: _parse_add_value(name, value)
+            for name, value in update.get("add", {}).items()
+        },
+    )
+    attribute_names = {
+        *user_update.set_attributes,
+        *user_update.set_attributes_if_not_exists,
+        *user_update.remove_attributes,
+        *user_update.add_values,
+    }
+    # The key identifies the user, renaming one is a delete and a create
+    if "username" in attribute_names:
+        raise exceptions.BadRequestError("Attribute username cannot be updated")
+    return user_update
+
+
+def _parse_add_value(name: str, value: Any) -> Any:
+    # JSON has no sets, lists are appended to DynamoDB string or number sets
+    if not isinstance(value, list):
+        return value
+    if not value:
+        raise exceptions.BadRequestError(f"Attribute {name} cannot add an empty set")
+    if not _has_one_element_type(value):
+        raise exceptions.BadRequestError(
+            f"Attribute {name} can only add strings or numbers of one type"
+        )
+    return set(value)
+
+
+def _has_one_element_type(values: List[Any]) -> bool:
+    return all(isinstance(value, str) for value in values) or all(
+        _is_number(value) for value in values
+    )
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float, decimal.Decimal)) and not isinstance(
+        value, bool
+    )
+
+
+def _validate_batch_size(batch_size: int) -> None:
+    if batch_size > BATCH_MAX_ITEMS:
+        raise exceptions.BadRequestError(
+            f"Batch size {batch_size} exceeds the maximum of {BATCH_MAX_ITEMS}"
+        )
+
+
+def _validate_batch_writes(usernames: List[str]) -> None:
+    _validate_batch_size(len(usernames))
+    if len(set(usernames)) != len(usernames):
+        raise exceptions.BadRequestError("Each user can be written once per batch")
+
+
+def _get_deadline() -> Optional[float]:
+    # Local runs have no Lambda context, nor a deadline
+    if app.lambda_context is None:
+        return None
+    return fan_out.deadline_from_context(app.lambda_context)
+
+
+def _item_result(result: fan_out.ItemResult) -> Dict[str, Any]:
+    if result.error is not None:
+        return {"username": result.username, "error": str(result.error)}
+    return {"username": result.username, "user": result.user}
+
+
+def _get_limit() -> int:
+    limit = app.current_event.get_query_string_value(name="limit") or str(
+        LIST_DEFAULT_LIMIT
+    )
+    if not limit.isdigit() or not 0 < int(limit) <= LIST_MAX_LIMIT:
+        raise exceptions.BadRequestError(
+            f"Limit must be an integer between 1 and {LIST_MAX_LIMIT}"
+        )
+    return int(limit)
+
+
+def _get_fields() -> Optional[List[str]]:
+    # Comma-separated attribute names, e.g. ?fields=email,country
+    fields = app.current_event.get_query_string_value(name="fields")
+    if fields is None:
+        return None
+    return [field for field in fields.split(",") if field]
+
+
+def _get_expected_version() -> Optional[int]:
+    # A single strong ETag, e.g. If-Match: "3", or * for any version. The ETag of
+    # a projection matches the version it was read at, e.g. "3-1a2b3c4d5e6f7a8b"
+    if_match = app.current_event.get_header_value("If-Match")
+    if if_match is None or if_match.strip() == "*":
+        return None
+    version = if_match.strip().strip('"').partition("-")[0]
+    if not version.isdigit():
+        raise exceptions.BadRequestError(f"Invalid If-Match header {if_match}")
+    return int(version)
+
+
+def _matches_entity_tag(if_none_match: str, entity_tag: str) -> bool:
+    # Weak comparison, as for GET requests
+    entity_tags = {
+        value.strip().removeprefix("W/") for value in if_none_match.split(",")
+    }
+    return "*" in entity_tags or entity_tag in entity_tags
+
+
+def _entity_tag(user: Dict[str, Any], fields: Optional[List[str]] = None) -> str:
+    version = users.get_version(user)
+    if fields is None:
+        return f'"{version}"'
+    # Each projection is a representation of its own, e.g. "3-1a2b3c4d5e6f7a8b"
+    fields_hash = hashlib.sha256(",".join(sorted(set(fields))).encode()).hexdigest()
+    return f'"{version}-{fields_hash[:16]}"'
+
+
+def _user_response(
+    user: Dict[str, Any], fields: Optional[List[str]] = None
+) -> api_gateway.Response:
+    return api_gateway.Response(
+        status_code=http.HTTPStatus.OK,
+        content_type=content_types.APPLICATION_JSON,
+        body=serializer(user),
+        headers={"ETag": _entity_tag(user, fields)},
+    )
+
+
+def _precondition_failed(exception: Exception) -> exceptions.ServiceError:
+    return exceptions.ServiceError(http.HTTPStatus.PRECONDITION_FAILED, str(exception))
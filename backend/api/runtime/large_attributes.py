@@ -0,0 +1,169 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import hashlib
+import json
+import zlib
+from typing import Any, Dict, FrozenSet, List, Mapping, Optional
+
+import boto3
+from boto3.dynamodb import types
+from botocore import config
+
+# Values whose DynamoDB JSON reaches the compression threshold are stored
+# zlib-compressed, and those still reaching the offload threshold in an S3
+# object. The attribute then holds a map with one of these keys, which reads
+# unwrap, fetching offloaded values only for the attributes a read returns.
+# The keys map to Binary values, which JSON request bodies cannot hold
+COMPRESSED_KEY = "$zlib"
+OFFLOADED_KEY = "$s3"
+
+_serializer = types.TypeSerializer()
+_deserializer = types.TypeDeserializer()
+
+
+class LargeAttributes:
+    def __init__(
+        self,
+        *,
+        compression_threshold_bytes: int,
+        offload_threshold_bytes: int,
+        bucket_name: Optional[str] = None,
+        plain_attributes: FrozenSet[str] = frozenset(),
+        s3_config: Optional[config.Config] = None,
+    ):
+        self._compression_threshold_bytes = compression_threshold_bytes
+        self._offload_threshold_bytes = offload_threshold_bytes
+        self._bucket_name = bucket_name
+        # Keys, and attributes read by conditions or indexes, are never encoded
+        self._plain_attributes = plain_attributes
+        self._s3 = None if bucket_name is None else boto3.client("s3", config=s3_config)
+
+    @property
+    def offloads(self) -> bool:
+        return self._s3 is not None
+
+    def encode_attributes(
+        self, username: str, attributes: Mapping[str, Any]
+    ) -> Dict[str, Any]:
+        for name, value in attributes.items():
+            if isinstance(value, dict) and not value.keys().isdisjoint(
+                {COMPRESSED_KEY, OFFLOADED_KEY}
+            ):
+                raise ValueError(
+                    f"Attribute {name} cannot hold {COMPRESSED_KEY} or {OFFLOADED_KEY}"
+                )
+        return {
+            name: self._encode(username, name, value)
+            for name, value in attributes.items()
+        }
+
+    def decode_item(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        if not any(_is_encoded(value) for value in item.values()):
+            return item
+        return {
+            name: self._decode(item.get("username"), name, value)
+            for name, value in item.items()
+        }
+
+    def delete_offloaded(
+        self,
+        item: Mapping[str, Any],
+        replacement: Optional[Mapping[str, Any]] = None,
+    ) -> None:
+        keys = replaced_keys(item, replacement or {})
+        if keys and self._s3 is not None:
+            self._s3.delete_objects(
+                Bucket=self._bucket_name,
+                Delete={"Objects": [{"Key": key} for key in keys], "Quiet": True},
+            )
+
+    def _encode(self, username: str, name: str, value: Any) -> Any:
+        if self._is_plain(name, value):
+            return value
+        document = json.dumps(_serializer.serialize(value), separators=(",", ":"))
+        if len(document) < self._compression_threshold_bytes:
+            return value
+        compressed = zlib.compress(document.encode())
+        if len(compressed) < self._offload_threshold_bytes or self._s3 is None:
+            return {COMPRESSED_KEY: compressed}
+        key = self._offload(username, name, compressed)
+        return {OFFLOADED_KEY: key.encode()}
+
+    def _is_plain(self, name: str, value: Any) -> bool:
+        # Most values are short strings, they skip the serialization
+        if isinstance(value, str) and len(value) < self._compression_threshold_bytes:
+            return True
+        return name in self._plain_attributes
+
+    def _offload(self, username: str, name: str, compressed: bytes) -> str:
+        # Content addressed, a retried write puts the same object
+        key = _key_prefix(username, name) + hashlib.sha256(compressed).hexdigest()
+        if self._s3 is not None:
+            self._s3.put_object(Bucket=self._bucket_name, Key=key, Body=compressed)
+        return key
+
+    def _decode(self, username: Optional[str], name: str, value: Any) -> Any:
+        if not _is_encoded(value):
+            return value
+        if COMPRESSED_KEY in value:
+            return _decompress(bytes(value[COMPRESSED_KEY]))
+        key = bytes(value[OFFLOADED_KEY]).decode()
+        if not _is_owned(key, username, name):
+            raise ValueError(f"Offloaded value {key} of another attribute")
+        if self._s3 is None:
+            raise ValueError(f"Offloaded value {key} without bucket")
+        response = self._s3.get_object(Bucket=self._bucket_name, Key=key)
+        return _decompress(response["Body"].read())
+
+
+def offloaded_keys(item: Mapping[str, Any]) -> List[str]:
+    username = item.get("username")
+    keys = [_offloaded_key(username, name, value) for name, value in item.items()]
+    return [key for key in keys if key is not None]
+
+
+def replaced_keys(item: Mapping[str, Any], replacement: Mapping[str, Any]) -> List[str]:
+    # Content addressed, an unchanged value of the replacing item still
+    # references the object it had
+    kept_keys = set(offloaded_keys(replacement))
+    return [key for key in offloaded_keys(item) if key not in kept_keys]
+
+
+def _offloaded_key(username: Optional[str], name: str, value: Any) -> Optional[str]:
+    if not _is_encoded(value) or OFFLOADED_KEY not in value:
+        return None
+    key = bytes(value[OFFLOADED_KEY]).decode()
+    # Only the objects of the item's own attributes
+    return key if _is_owned(key, username, name) else None
+
+
+def _is_encoded(value: Any) -> bool:
+    if not isinstance(value, dict) or len(value) != 1:
+        return False
+    encoded = value.get(COMPRESSED_KEY, value.get(OFFLOADED_KEY))
+    return isinstance(encoded, (bytes, types.Binary))
+
+
+def _key_prefix(username: str, name: str) -> str:
+    return f"{username}/{name}/"
+
+
+def _is_owned(key: str, username: Optional[str], name: str) -> bool:
+    return username is not None and key.startswith(_key_prefix(username, name))
+
+
+def _decompress(data: bytes) -> Any:
+    return _deserializer.deserialize(json.loads(zlib.decompress(data)))
@@ -0,0 +1,40 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+from typing import Any, Callable, Dict, Mapping
+
+from boto3.dynamodb import types
+
+_serializer = types.TypeSerializer()
+_deserializer = types.TypeDeserializer()
+
+
+def serialize_item(item: Mapping[str, Any]) -> Dict[str, Any]:
+    return {key: _serializer.serialize(value) for key, value in item.items()}
+
+
+def deserialize_item(item: Mapping[str, Any]) -> Dict[str, Any]:
+    return {key: _deserializer.deserialize(value) for key, value in item.items()}
+
+
+def convert_write_request(
+    write_request: Mapping[str, Any],
+    convert_item: Callable[[Mapping[str, Any]], Dict[str, Any]],
+) -> Dict[str, Any]:
+    if "PutRequest" in write_request:
+        item = convert_item(write_request["PutRequest"]["Item"])
+        return {"PutRequest": {"Item": item}}
+    key = convert_item(write_request["DeleteRequest"]["Key"])
+    return {"DeleteRequest": {"Key": key}}
@@ -0,0 +1,84 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import queue
+import threading
+from concurrent import futures
+from typing import Callable, Iterator, List, Optional, Sequence, TypeVar
+
+# Batches buffered per producer before parallel workers wait for the consumer
+BUFFERED_BATCHES_PER_PRODUCER = 2
+
+_T = TypeVar("_T")
+
+
+def iter_parallel(
+    producers: Sequence[Callable[[], Iterator[List[_T]]]]
+) -> Iterator[_T]:
+    # Producers run in worker threads and hand batches over through a bounded
+    # queue, None marks an exhausted producer
+    batches: queue.Queue[Optional[List[_T]]] = queue.Queue(
+        maxsize=len(producers) * BUFFERED_BATCHES_PER_PRODUCER
+    )
+    stopped = threading.Event()
+    with futures.ThreadPoolExecutor(max_workers=len(producers)) as executor:
+        running = [
+            executor.submit(_produce, producer, batches, stopped)
+            for producer in producers
+        ]
+        try:
+            yield from _drain(batches, len(producers))
+        finally:
+            stopped.set()
+    for future in running:
+        future.result()
+
+
+def _produce(
+    producer: Callable[[], Iterator[List[_T]]],
+    batches: "queue.Queue[Optional[List[_T]]]",
+    stopped: threading.Event,
+) -> None:
+    try:
+        for batch in producer():
+            if not _put_unless_stopped(batches, batch, stopped):
+                return
+    finally:
+        _put_unless_stopped(batches, None, stopped)
+
+
+def _put_unless_stopped(
+    batches: "queue.Queue[Optional[List[_T]]]",
+    batch: Optional[List[_T]],
+    stopped: threading.Event,
+) -> bool:
+    while not stopped.is_set():
+        try:
+            batches.put(batch, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _drain(
+    batches: "queue.Queue[Optional[List[_T]]]", producers_count: int
+) -> Iterator[_T]:
+    while producers_count > 0:
+        batch = batches.get()
+        if batch is None:
+            producers_count -= 1
+        else:
+            yield from batch
@@ -0,0 +1,82 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import abc
+import decimal
+import json
+from typing import Any
+
+
+class JsonSerializer(abc.ABC):
+    """Encodes responses and decodes request bodies.
+
+    DynamoDB returns numbers as Decimal and string and number sets as sets,
+    they are encoded as JSON numbers and sorted arrays. Fractional numbers are
+    decoded to Decimal, which DynamoDB accepts where it rejects floats.
+    """
+
+    @abc.abstractmethod
+    def dumps(self, value: Any) -> str:
+        pass
+
+    @abc.abstractmethod
+    def loads(self, document: str) -> Any:
+        pass
+
+
+class StandardJsonSerializer(JsonSerializer):
+    def dumps(self, value: Any) -> str:
+        return json.dumps(value, separators=(",", ":"), default=encode_default)
+
+    def loads(self, document: str) -> Any:
+        return json.loads(document, parse_float=decimal.Decimal)
+
+
+class OrjsonSerializer(StandardJsonSerializer):
+    # Encodes only, decoding to Decimal takes a walk over the decoded document
+    # that is slower than json parsing fractional numbers to Decimal directly
+    def __init__(self) -> None:
+        # Deferred, raises ImportError where the package isn't bundled
+        import orjson  # pylint: disable=import-outside-toplevel
+
+        self._orjson = orjson
+
+    def dumps(self, value: Any) -> str:
+        try:
+            return str(self._orjson.dumps(value, default=encode_default), "utf_8")
+        except TypeError:
+            # orjson only encodes 64-bit integers, DynamoDB numbers have up to
+            # 38 digits
+            return super().dumps(value)
+
+
+def create_serializer(name: str) -> JsonSerializer:
+    if name == "orjson":
+        try:
+            return OrjsonSerializer()
+        except ImportError:
+            pass
+    return StandardJsonSerializer()
+
+
+def encode_default(value: Any) -> Any:
+    if isinstance(value, decimal.Decimal):
+        # Integral numbers stay exact, e.g. versions and counters
+        if value == value.to_integral_value():
+            return int(value)
+        return float(value)
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
@@ -0,0 +1,253 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import abc
+import collections
+import dataclasses
+import functools
+import json
+import os
+import time
+from typing import (
+    Any,
+    Callable,
+    Collection,
+    Counter,
+    Dict,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+)
+
+import boto3
+import marshalling
+from botocore import config
+from botocore import exceptions
+
+# The stream handler adds the changes of each batch of stream records to the
+# counters of a summary item, in a transaction that also puts a marker item per
+# record. Retried batches skip the records with markers, each counts once
+SUMMARY_ID = "users"
+USER_COUNT_ATTRIBUTE = "userCount"
+# Counter of the users with a value of a counted attribute, e.g. count#country#US
+COUNT_PREFIX = "count#"
+# Counts the values outside of the allowlist of an attribute together, clients
+# can't grow the summary item with a counter per value they make up
+OTHER_VALUE = "*"
+EVENT_MARKER_PREFIX = "event#"
+EXPIRES_AT_ATTRIBUTE = "expiresAt"
+# Streams keep records for 24 hours, no retry replays an older record
+EVENT_MARKER_TTL_SECONDS = 2 * 24 * 60 * 60
+# TransactWriteItems limit of 100 items, one of them the summary item
+MAX_TRANSACTION_RECORDS = 99
+
+
+@dataclasses.dataclass(frozen=True)
+class UsersStats:
+    user_count: int = 0
+    # Users by value of every counted attribute, e.g. {"country": {"US": 3, "*": 1}}
+    counts: Dict[str, Dict[str, int]] = dataclasses.field(default_factory=dict)
+
+
+class StatsAggregator:
+    def __init__(
+        self,
+        table_name: str,
+        *,
+        counted_values: Mapping[str, Collection[str]],
+        dynamodb_config: Optional[config.Config] = None,
+        clock: Callable[[], float] = time.time,
+    ):
+        self._table_name = table_name
+        self._counted_values = counted_values
+        self._dynamodb = boto3.client("dynamodb", config=dynamodb_config)
+        self._clock = clock
+
+    def apply(self, records: Sequence[Mapping[str, Any]]) -> None:
+        """Add the changes of a batch of stream records to the counters."""
+        changes = self._record_changes(records)
+        pending = list(changes)
+        for start in range(0, len(pending), MAX_TRANSACTION_RECORDS):
+            self._apply_changes(
+                {
+                    event_id: changes[event_id]
+                    for event_id in pending[start : start + MAX_TRANSACTION_RECORDS]
+                }
+            )
+
+    def _record_changes(
+        self, records: Sequence[Mapping[str, Any]]
+    ) -> Dict[str, Counter[str]]:
+        # Records that change no counter, e.g. updates of other attributes, are
+        # neither marked nor counted
+        changes = {
+            record["eventID"]: record_deltas(record, self._counted_values)
+            for record in records
+        }
+        return {event_id: deltas for event_id, deltas in changes.items() if deltas}
+
+    def _apply_changes(self, changes: Dict[str, Counter[str]]) -> None:
+        while changes:
+            remaining = self._apply_chunk(changes)
+            changes = {event_id: changes[event_id] for event_id in remaining}
+
+    def _apply_chunk(self, changes: Dict[str, Counter[str]]) -> List[str]:
+        # Returns the records still to apply, those not counted before
+        try:
+            self._dynamodb.transact_write_items(
+                TransactItems=self._build_transact_items(changes)
+            )
+            return []
+        except exceptions.ClientError as exception:
+            counted = _counted_event_ids(exception, list(changes))
+            if not counted:
+                raise
+            return [event_id for event_id in changes if event_id not in counted]
+
+    def _build_transact_items(
+        self, changes: Dict[str, Counter[str]]
+    ) -> List[Dict[str, Any]]:
+        expires_at = int(self._clock()) + EVENT_MARKER_TTL_SECONDS
+        transact_items = [
+            {
+                "Put": {
+                    "TableName": self._table_name,
+                    "Item": marshalling.serialize_item(
+                        {
+                            "id": EVENT_MARKER_PREFIX + event_id,
+                            EXPIRES_AT_ATTRIBUTE: expires_at,
+                        }
+                    ),
+                    "ConditionExpression": "attribute_not_exists(id)",
+                }
+            }
+            for event_id in changes
+        ]
+        deltas: Counter[str] = collections.Counter()
+        for record_deltas_ in changes.values():
+            deltas.update(record_deltas_)
+        # Changes may cancel out, e.g. a user created and deleted in a batch
+        deltas = _non_zero(deltas)
+        if deltas:
+            transact_items.append(self._build_summary_update(deltas))
+        return transact_items
+
+    def _build_summary_update(self, deltas: Counter[str]) -> Dict[str, Any]:
+        names = {f"#n{index}": name for index, name in enumerate(deltas)}
+        values = {f":v{index}": delta for index, delta in enumerate(deltas.values())}
+        actions = [f"{name} {value}" for name, value in zip(names, values)]
+        return {
+            "Update": {
+                "TableName": self._table_name,
+                "Key": marshalling.serialize_item({"id": SUMMARY_ID}),
+                "UpdateExpression": "ADD " + ", ".join(actions),
+                "ExpressionAttributeNames": names,
+                "ExpressionAttributeValues": marshalling.serialize_item(values),
+            }
+        }
+
+
+class StatsReaderInterface(abc.ABC):
+    @abc.abstractmethod
+    def get_stats(self) -> UsersStats:
+        pass
+
+
+class StatsReader(StatsReaderInterface):
+    def __init__(
+        self, table_name: str, *, dynamodb_config: Optional[config.Config] = None
+    ):
+        self._table_name = table_name
+        self._dynamodb = boto3.client("dynamodb", config=dynamodb_config)
+
+    def get_stats(self) -> UsersStats:
+        response = self._dynamodb.get_item(
+            TableName=self._table_name,
+            Key=marshalling.serialize_item({"id": SUMMARY_ID}),
+        )
+        return parse_summary(marshalling.deserialize_item(response.get("Item", {})))
+
+
+def record_deltas(
+    record: Mapping[str, Any], counted_values: Mapping[str, Collection[str]]
+) -> Counter[str]:
+    images = record["dynamodb"]
+    old_user = marshalling.deserialize_item(images.get("OldImage", {}))
+    new_user = marshalling.deserialize_item(images.get("NewImage", {}))
+    deltas: Counter[str] = collections.Counter()
+    # Inserts have no old image and removals no new one
+    deltas[USER_COUNT_ATTRIBUTE] = bool(new_user) - bool(old_user)
+    for attribute, allowed_values in counted_values.items():
+        old_value, new_value = old_user.get(attribute), new_user.get(attribute)
+        if old_value == new_value:
+            continue
+        # Strings only, other types are not counted at all
+        if isinstance(old_value, str):
+            deltas[counter_name(attribute, old_value, allowed_values)] -= 1
+        if isinstance(new_value, str):
+            deltas[counter_name(attribute, new_value, allowed_values)] += 1
+    return _non_zero(deltas)
+
+
+def counter_name(attribute: str, value: str, allowed_values: Collection[str]) -> str:
+    counted_value = value if value in allowed_values else OTHER_VALUE
+    return f"{COUNT_PREFIX}{attribute}#{counted_value}"
+
+
+def parse_summary(summary: Mapping[str, Any]) -> UsersStats:
+    counts: Dict[str, Dict[str, int]] = {}
+    for name, count in summary.items():
+        # Counters of values no user has anymore stay at 0
+        if not name.startswith(COUNT_PREFIX) or not count:
+            continue
+        attribute, value = name[len(COUNT_PREFIX) :].split("#", 1)
+        counts.setdefault(attribute, {})[value] = int(count)
+    return UsersStats(int(summary.get(USER_COUNT_ATTRIBUTE, 0)), counts)
+
+
+def _non_zero(deltas: Counter[str]) -> Counter[str]:
+    return collections.Counter({name: delta for name, delta in deltas.items() if delta})
+
+
+def _counted_event_ids(
+    exception: exceptions.ClientError, event_ids: Sequence[str]
+) -> List[str]:
+    # Markers come first in the transaction, in the order of the event IDs
+    reasons = exception.response.get("CancellationReasons", [])
+    return [
+        event_id
+        for event_id, reason in zip(event_ids, reasons)
+        if reason.get("Code") == "ConditionalCheckFailed"
+    ]
+
+
+@functools.lru_cache(maxsize=None)
+def get_aggregator() -> StatsAggregator:
+    return StatsAggregator(
+        os.environ["STATS_TABLE_NAME"],
+        # e.g. {"plan": ["free", "pro"]}
+        counted_values={
+            attribute: frozenset(values)
+            for attribute, values in json.loads(
+                os.environ.get("STATS_COUNTED_VALUES", "{}")
+            ).items()
+        },
+    )
+
+
+def stream_handler(event: Dict[str, Any], context: object) -> None:
+    # Raising fails the batch, Lambda retries it and counted records are skipped
+    get_aggregator().apply(event["Records"])
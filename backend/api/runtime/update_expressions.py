@@ -0,0 +1,130 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import dataclasses
+import functools
+from typing import Any, Dict, List, Mapping, Sequence, Tuple
+
+# Attribute names of the SET, SET if_not_exists, REMOVE and ADD actions
+UpdateShape = Tuple[Tuple[str, ...], Tuple[str, ...], Tuple[str, ...], Tuple[str, ...]]
+
+
+@dataclasses.dataclass(frozen=True)
+class CompiledUpdate:
+    update_expression: str
+    expression_attribute_names: Dict[str, str]
+    value_placeholders: Tuple[str, ...]
+
+
+@dataclasses.dataclass(frozen=True)
+class UpdateExpression:
+    update_expression: str
+    expression_attribute_names: Dict[str, str]
+    expression_attribute_values: Dict[str, Any]
+
+
+def build_update_expression(
+    *,
+    set_attributes: Mapping[str, Any],
+    set_attributes_if_not_exists: Mapping[str, Any],
+    remove_attributes: Sequence[str],
+    add_values: Mapping[str, Any],
+) -> UpdateExpression:
+    compiled_update = compile_update(
+        (
+            tuple(set_attributes),
+            tuple(set_attributes_if_not_exists),
+            tuple(remove_attributes),
+            tuple(add_values),
+        )
+    )
+    values = [
+        *set_attributes.values(),
+        *set_attributes_if_not_exists.values(),
+        *add_values.values(),
+    ]
+    return UpdateExpression(
+        compiled_update.update_expression,
+        compiled_update.expression_attribute_names,
+        dict(zip(compiled_update.value_placeholders, values)),
+    )
+
+
+# Updates of the same shape share the expression and attribute names, only the
+# values are bound per call. Callers must not mutate the returned names
+@functools.lru_cache(maxsize=256)
+def compile_update(shape: UpdateShape) -> CompiledUpdate:
+    _validate_shape(shape)
+    placeholders = _Placeholders()
+    set_names, set_if_not_exists_names, remove_names, add_names = shape
+    set_actions = [
+        f"{placeholders.name(name)} = {placeholders.value()}" for name in set_names
+    ]
+    set_actions += [
+        placeholders.if_not_exists(name) for name in set_if_not_exists_names
+    ]
+    remove_actions = [placeholders.name(name) for name in remove_names]
+    add_actions = [
+        f"{placeholders.name(name)} {placeholders.value()}" for name in add_names
+    ]
+    clauses = _join_clauses(
+        {"SET": set_actions, "REMOVE": remove_actions, "ADD": add_actions}
+    )
+    return CompiledUpdate(
+        clauses,
+        placeholders.expression_attribute_names,
+        tuple(placeholders.value_placeholders),
+    )
+
+
+def _validate_shape(shape: UpdateShape) -> None:
+    names = sum(shape, ())
+    if not names:
+        raise ValueError("Update must change at least one attribute")
+    if len(set(names)) != len(names):
+        raise ValueError("Update can change each attribute only once")
+
+
+class _Placeholders:
+    def __init__(self) -> None:
+        # The key is always named, conditions refer to it
+        self.expression_attribute_names = {"#username": "username"}
+        self.value_placeholders: List[str] = []
+
+    def name(self, name: str) -> str:
+        placeholder = f"#n{len(self.expression_attribute_names) - 1}"
+        self.expression_attribute_names[placeholder] = name
+        return placeholder
+
+    def value(self) -> str:
+        placeholder = f":v{len(self.value_placeholders)}"
+        self.value_placeholders.append(placeholder)
+        return placeholder
+
+    def if_not_exists(self, name: str) -> str:
+        name_placeholder = self.name(name)
+        value_placeholder = self.value()
+        return (
+            f"{name_placeholder} = "
+            f"if_not_exists({name_placeholder}, {value_placeholder})"
+        )
+
+
+def _join_clauses(actions_by_keyword: Dict[str, List[str]]) -> str:
+    return " ".join(
+        f"{keyword} {', '.join(actions)}"
+        for keyword, actions in actions_by_keyword.items()
+        if actions
+    )
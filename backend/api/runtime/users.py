@@ -14,9 +14,160 @@
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 import abc
-from typing import Any, Dict, Optional
+import base64
+import binascii
+import contextlib
+import dataclasses
+import enum
+import functools
+import itertools
+import json
+import random
+import threading
+import time
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    TypeVar,
+    overload,
+)
 
 import boto3
+import instrumentation
+import large_attributes
+import marshalling
+import parallel
+import update_expressions
+from botocore import config
+from botocore import exceptions
+
+# DynamoDB limits for a single BatchGetItem and BatchWriteItem request
+BATCH_GET_MAX_KEYS = 100
+BATCH_WRITE_MAX_REQUESTS = 25
+BATCH_MAX_ATTEMPTS = 5
+BATCH_BACKOFF_BASE_SECONDS = 0.05
+BATCH_BACKOFF_MAX_SECONDS = 1.0
+# Incremented on every conditional write, exposed to clients as the ETag
+VERSION_ATTRIBUTE = "version"
+# Partition key of the email global secondary index and of the email claims
+EMAIL_ATTRIBUTE = "email"
+# Errors of requests rejected for exceeding the table's or account's
+# throughput, and the cancellation reason of a throttled transaction item
+THROTTLING_ERROR_CODES = frozenset(
+    {
+        "ProvisionedThroughputExceededException",
+        "RequestLimitExceeded",
+        "ThrottlingException",
+    }
+)
+THROTTLING_CANCELLATION_REASON = "ThrottlingError"
+
+_T = TypeVar("_T")
+_random = random.SystemRandom()
+
+
+class UserAlreadyExistsError(Exception):
+    def __init__(self, username: str):
+        super().__init__(f"User {username} already exists")
+        self.username = username
+
+
+class UserNotFoundError(Exception):
+    def __init__(self, username: str):
+        super().__init__(f"User {username} does not exist")
+        self.username = username
+
+
+class VersionConflictError(Exception):
+    def __init__(self, username: str, expected_version: int):
+        super().__init__(f"User {username} is no longer at version {expected_version}")
+        self.username = username
+        self.expected_version = expected_version
+
+
+class EmailAlreadyInUseError(Exception):
+    def __init__(self, email: str):
+        super().__init__(f"Email {email} is already in use")
+        self.email = email
+
+
+class InvalidCursorError(ValueError):
+    def __init__(self, cursor: str):
+        super().__init__(f"Invalid cursor {cursor}")
+        self.cursor = cursor
+
+
+class RateLimitExceededError(Exception):
+    def __init__(self, retry_after_seconds: float):
+        super().__init__("Too many requests, retry later")
+        self.retry_after_seconds = retry_after_seconds
+
+
+class BatchItemStatus(str, enum.Enum):
+    FOUND = "found"
+    NOT_FOUND = "not_found"
+    PUT = "put"
+    DELETED = "deleted"
+    UNPROCESSED = "unprocessed"
+    # Changed concurrently, or its email is claimed by another user
+    CONFLICT = "conflict"
+
+
+@dataclasses.dataclass(frozen=True)
+class BatchItemResult:
+    username: str
+    status: BatchItemStatus
+    user: Optional[Dict[str, Any]] = None
+
+    @classmethod
+    def from_user(
+        cls, username: str, user: Optional[Dict[str, Any]]
+    ) -> "BatchItemResult":
+        if user is None:
+            return cls(username, BatchItemStatus.NOT_FOUND)
+        return cls(username, BatchItemStatus.FOUND, user)
+
+
+@dataclasses.dataclass(frozen=True)
+class UserUpdate:
+    set_attributes: Dict[str, Any] = dataclasses.field(default_factory=dict)
+    set_attributes_if_not_exists: Dict[str, Any] = dataclasses.field(
+        default_factory=dict
+    )
+    remove_attributes: Tuple[str, ...] = ()
+    # Numbers are added to counters (missing counts as 0), sets are appended to
+    add_values: Dict[str, Any] = dataclasses.field(default_factory=dict)
+
+
+@dataclasses.dataclass(frozen=True)
+class EmailIndex:
+    index_name: str = "email"
+    # Non-key attributes the index projects, None when it projects all of them
+    projected_attributes: Optional[FrozenSet[str]] = None
+    # Table claiming each email for a single user, uniqueness is not enforced
+    # without it
+    claims_table_name: Optional[str] = None
+
+    def projects(self, fields: Optional[Sequence[str]]) -> bool:
+        if self.projected_attributes is None:
+            return True
+        if fields is None:
+            return False
+        return set(fields) <= {"username", EMAIL_ATTRIBUTE, *self.projected_attributes}
+
+
+@dataclasses.dataclass(frozen=True)
+class UsersPage:
+    users: List[Dict[str, Any]]
+    cursor: Optional[str] = None
 
 
 class DatabaseInterface(abc.ABC):
@@ -28,76 +179,1134 @@ class DatabaseInterface(abc.ABC):
 
     @abc.abstractmethod
     def update_user(
-        self, username: str, user_attributes: Dict[str, str]
+        self,
+        username: str,
+        user_attributes: Dict[str, str],
+        expected_version: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        pass
+
+    @abc.abstractmethod
+    def apply_user_update(
+        self,
+        username: str,
+        user_update: UserUpdate,
+        expected_version: Optional[int] = None,
     ) -> Dict[str, Any]:
         pass
 
     @abc.abstractmethod
-    def get_user(self, username: str) -> Optional[Dict[str, Any]]:
+    def get_user(
+        self, username: str, fields: Optional[Sequence[str]] = None
+    ) -> Optional[Dict[str, Any]]:
+        pass
+
+    @abc.abstractmethod
+    def delete_user(
+        self, username: str, expected_version: Optional[int] = None
+    ) -> None:
+        pass
+
+    @abc.abstractmethod
+    def get_user_by_email(
+        self, email: str, fields: Optional[Sequence[str]] = None
+    ) -> Optional[Dict[str, Any]]:
+        pass
+
+    @abc.abstractmethod
+    def find_users(
+        self, email: str, fields: Optional[Sequence[str]] = None
+    ) -> List[Dict[str, Any]]:
+        pass
+
+    @abc.abstractmethod
+    def batch_get_users(
+        self, usernames: Sequence[str], fields: Optional[Sequence[str]] = None
+    ) -> List[BatchItemResult]:
+        pass
+
+    @abc.abstractmethod
+    def batch_write_users(
+        self,
+        users_to_put: Dict[str, Dict[str, str]],
+        usernames_to_delete: Sequence[str],
+    ) -> List[BatchItemResult]:
+        pass
+
+    @abc.abstractmethod
+    def list_users(
+        self,
+        limit: int,
+        cursor: Optional[str] = None,
+        fields: Optional[Sequence[str]] = None,
+    ) -> UsersPage:
         pass
 
     @abc.abstractmethod
-    def delete_user(self, username: str) -> None:
+    def iter_users(self, total_segments: int = 1) -> Iterator[Dict[str, Any]]:
         pass
 
 
+class AdaptiveTokenBucket:
+    """Admits requests up to a rate that adapts to throttling.
+
+    The rate starts at max_rate. Every throttled request multiplies it by
+    decrease_factor, down to min_rate, and it recovers by recovery_rate per
+    second without throttling. Up to a second of the rate is admitted at once.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_rate: float,
+        min_rate: float = 1.0,
+        decrease_factor: float = 0.5,
+        recovery_rate: float = 1.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.rate = max_rate
+        self._max_rate = max_rate
+        self._min_rate = min_rate
+        self._decrease_factor = decrease_factor
+        self._recovery_rate = recovery_rate
+        self._clock = clock
+        self._tokens = max_rate
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> float:
+        """Take a token and return 0, or the seconds until one is available."""
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def record_throttle(self) -> float:
+        """Slow down and return the seconds until the next token."""
+        with self._lock:
+            self._refill()
+            self.rate = max(self._min_rate, self.rate * self._decrease_factor)
+            # Requests in flight already spent their tokens, shed the next ones
+            self._tokens = 0.0
+            return 1 / self.rate
+
+    def _refill(self) -> None:
+        now = self._clock()
+        elapsed_seconds = now - self._updated
+        self._updated = now
+        self.rate = min(
+            self._max_rate, self.rate + elapsed_seconds * self._recovery_rate
+        )
+        self._tokens = min(
+            max(self.rate, 1.0), self._tokens + elapsed_seconds * self.rate
+        )
+
+
 class UsersRepository:
-    def __init__(self, *, database: DatabaseInterface):
+    """Users operations, optionally behind admission control.
+
+    Reads and writes are admitted from their own budgets. Once a budget is
+    exhausted, or the table throttles, calls fail fast with
+    RateLimitExceededError instead of adding load to a throttling table.
+    """
+
+    def __init__(
+        self,
+        *,
+        database: DatabaseInterface,
+        read_budget: Optional[AdaptiveTokenBucket] = None,
+        write_budget: Optional[AdaptiveTokenBucket] = None,
+    ):
         self._database = database
+        self._read_budget = read_budget
+        self._write_budget = write_budget
 
     def create_user(
         self, username: str, user_attributes: Dict[str, str]
     ) -> Dict[str, Any]:
-        return self._database.create_user(username, user_attributes)
+        with _admitted(self._write_budget):
+            return self._database.create_user(username, user_attributes)
 
     def update_user(
-        self, username: str, user_attributes: Dict[str, str]
+        self,
+        username: str,
+        user_attributes: Dict[str, str],
+        expected_version: Optional[int] = None,
     ) -> Dict[str, Any]:
-        return self._database.update_user(username, user_attributes)
+        with _admitted(self._write_budget):
+            return self._database.update_user(
+                username, user_attributes, expected_version
+            )
 
-    def get_user(self, username: str) -> Optional[Dict[str, Any]]:
-        return self._database.get_user(username)
+    def apply_user_update(
+        self,
+        username: str,
+        user_update: UserUpdate,
+        expected_version: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        with _admitted(self._write_budget):
+            return self._database.apply_user_update(
+                username, user_update, expected_version
+            )
 
-    def delete_user(self, username: str) -> None:
-        self._database.delete_user(username)
+    def get_user(
+        self, username: str, fields: Optional[Sequence[str]] = None
+    ) -> Optional[Dict[str, Any]]:
+        with _admitted(self._read_budget):
+            return self._database.get_user(username, fields)
 
+    def delete_user(
+        self, username: str, expected_version: Optional[int] = None
+    ) -> None:
+        with _admitted(self._write_budget):
+            self._database.delete_user(username, expected_version)
 
-class DynamoDBDatabase(DatabaseInterface):
-    _dynamodb = boto3.resource("dynamodb")
+    def get_user_by_email(
+        self, email: str, fields: Optional[Sequence[str]] = None
+    ) -> Optional[Dict[str, Any]]:
+        with _admitted(self._read_budget):
+            return self._database.get_user_by_email(email, fields)
+
+    def find_users(
+        self, email: str, fields: Optional[Sequence[str]] = None
+    ) -> List[Dict[str, Any]]:
+        with _admitted(self._read_budget):
+            return self._database.find_users(email, fields)
+
+    def batch_get_users(
+        self, usernames: Sequence[str], fields: Optional[Sequence[str]] = None
+    ) -> List[BatchItemResult]:
+        with _admitted(self._read_budget):
+            return self._database.batch_get_users(usernames, fields)
+
+    def batch_write_users(
+        self,
+        users_to_put: Dict[str, Dict[str, str]],
+        usernames_to_delete: Sequence[str],
+    ) -> List[BatchItemResult]:
+        with _admitted(self._write_budget):
+            return self._database.batch_write_users(users_to_put, usernames_to_delete)
+
+    def list_users(
+        self,
+        limit: int,
+        cursor: Optional[str] = None,
+        fields: Optional[Sequence[str]] = None,
+    ) -> UsersPage:
+        with _admitted(self._read_budget):
+            return self._database.list_users(limit, cursor, fields)
+
+    def iter_users(self, total_segments: int = 1) -> Iterator[Dict[str, Any]]:
+        return self._database.iter_users(total_segments)
 
-    def __init__(self, table_name: str):
+
+class DynamoDBDatabase(DatabaseInterface):
+    def __init__(
+        self,
+        table_name: str,
+        *,
+        dynamodb_config: Optional[config.Config] = None,
+        email_index: EmailIndex = EmailIndex(),
+        large_attribute_store: Optional[large_attributes.LargeAttributes] = None,
+    ):
         super().__init__()
-        self._table = DynamoDBDatabase._dynamodb.Table(table_name)
+        # Low-level client with explicit marshalling, loading the resource model
+        # would add to every cold start
+        self._dynamodb = boto3.client("dynamodb", config=dynamodb_config)
+        instrumentation.register_consumed_capacity(self._dynamodb)
+        # Scans and index queries always read the table, never an item cache in
+        # front of it
+        self._scan_dynamodb = self._dynamodb
+        self._table_name = table_name
+        self._email_index = email_index
+        self._large_attributes = large_attribute_store
 
+    @instrumentation.timed("DynamoDBLatency", "Method")
     def create_user(
         self, username: str, user_attributes: Dict[str, str]
     ) -> Dict[str, Any]:
-        user = {"username": username}
+        user: Dict[str, Any] = {"username": username}
         user.update(user_attributes)
-        self._table.put_item(Item=user)
+        user[VERSION_ATTRIBUTE] = 1
+        put = {
+            "TableName": self._table_name,
+            "Item": marshalling.serialize_item(self._encode_user(username, user)),
+            "ConditionExpression": "attribute_not_exists(username)",
+        }
+        email = user.get(EMAIL_ATTRIBUTE)
+        if email is not None and self._claims_emails():
+            self._transact_write(
+                [
+                    ({"Put": put}, UserAlreadyExistsError(username)),
+                    (self._claim_email(email, username), EmailAlreadyInUseError(email)),
+                ]
+            )
+            return user
+        try:
+            self._dynamodb.put_item(**put)
+        except exceptions.ClientError as exception:
+            if _is_conditional_check_failed(exception):
+                raise UserAlreadyExistsError(username) from exception
+            raise
         return user
 
     def update_user(
-        self, username: str, user_attributes: Dict[str, str]
+        self,
+        username: str,
+        user_attributes: Dict[str, str],
+        expected_version: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        return self.apply_user_update(
+            username, UserUpdate(set_attributes=user_attributes), expected_version
+        )
+
+    @instrumentation.timed("DynamoDBLatency", "Method")
+    def apply_user_update(
+        self,
+        username: str,
+        user_update: UserUpdate,
+        expected_version: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        user_update = self._encode_update(username, with_version_increment(user_update))
+        if self._claims_emails() and _changes_email(user_update):
+            return self._apply_email_update(username, user_update, expected_version)
+        try:
+            response = self._dynamodb.update_item(
+                **self._build_update_request(username, user_update, expected_version),
+                **self._return_values_on_update(),
+                **_return_values_on_condition_check_failure(expected_version),
+            )
+        except exceptions.ClientError as exception:
+            if _is_conditional_check_failed(exception):
+                raise _conditional_write_error(
+                    username, expected_version, exception
+                ) from exception
+            raise
+        return self._updated_user(username, response)
+
+    @instrumentation.timed("DynamoDBLatency", "Method")
+    def get_user(
+        self, username: str, fields: Optional[Sequence[str]] = None
+    ) -> Optional[Dict[str, Any]]:
+        response = self._dynamodb.get_item(
+            TableName=self._table_name,
+            Key=_serialize_key(username),
+            **build_projection(fields),
+        )
+        if "Item" not in response:
+            return None
+        return self._deserialize_user(response["Item"])
+
+    @instrumentation.timed("DynamoDBLatency", "Method")
+    def delete_user(
+        self, username: str, expected_version: Optional[int] = None
+    ) -> None:
+        if self._claims_emails():
+            self._delete_user_and_email(username, expected_version)
+            return
+        try:
+            response = self._dynamodb.delete_item(
+                **self._build_delete_request(username, expected_version),
+                **_return_values_on_condition_check_failure(expected_version),
+                **self._return_values_on_delete(),
+            )
+        except exceptions.ClientError as exception:
+            if _is_conditional_check_failed(exception):
+                raise _conditional_write_error(
+                    username, expected_version, exception
+                ) from exception
+            raise
+        if "Attributes" in response:
+            self._delete_offloaded(marshalling.deserialize_item(response["Attributes"]))
+
+    @instrumentation.timed("DynamoDBLatency", "Method")
+    def get_user_by_email(
+        self, email: str, fields: Optional[Sequence[str]] = None
+    ) -> Optional[Dict[str, Any]]:
+        found_users = self._query_email_index(email, fields, limit=1)
+        return found_users[0] if found_users else None
+
+    @instrumentation.timed("DynamoDBLatency", "Method")
+    def find_users(
+        self, email: str, fields: Optional[Sequence[str]] = None
+    ) -> List[Dict[str, Any]]:
+        return self._query_email_index(email, fields)
+
+    @instrumentation.timed("DynamoDBLatency", "Method")
+    def batch_get_users(
+        self, usernames: Sequence[str], fields: Optional[Sequence[str]] = None
+    ) -> List[BatchItemResult]:
+        unique_usernames = list(dict.fromkeys(usernames))
+        found_users: Dict[str, Dict[str, Any]] = {}
+        unprocessed_keys: List[Dict[str, Any]] = []
+        for chunk in _chunks(unique_usernames, BATCH_GET_MAX_KEYS):
+            keys = [{"username": username} for username in chunk]
+            unprocessed_keys += _retry_unprocessed(
+                functools.partial(
+                    self._batch_get, fields=fields, found_users=found_users
+                ),
+                keys,
+            )
+        unprocessed_usernames = {key["username"] for key in unprocessed_keys}
+        return [
+            _batch_get_result(username, found_users, unprocessed_usernames)
+            for username in unique_usernames
+        ]
+
+    @instrumentation.timed("DynamoDBLatency", "Method")
+    def batch_write_users(
+        self,
+        users_to_put: Dict[str, Dict[str, str]],
+        usernames_to_delete: Sequence[str],
+    ) -> List[BatchItemResult]:
+        users_to_put = {
+            username: self._encode_user(username, user_attributes)
+            for username, user_attributes in users_to_put.items()
+        }
+        if self._claims_emails():
+            return self._write_users_and_emails(users_to_put, usernames_to_delete)
+        # Batch writes cannot condition, each user is put at the version after
+        # the one read, on the condition it is still there
+        results = [
+            self._put_batch_user(username, user_attributes)
+            for username, user_attributes in users_to_put.items()
+        ]
+        return results + self._delete_batch_users(usernames_to_delete)
+
+    def _delete_batch_users(
+        self, usernames_to_delete: Sequence[str]
+    ) -> List[BatchItemResult]:
+        if not self._offloads():
+            return self._batch_delete_users(usernames_to_delete)
+        return [
+            self._delete_user_replacing_offloaded(username)
+            for username in dict.fromkeys(usernames_to_delete)
+        ]
+
+    def _batch_delete_users(
+        self, usernames_to_delete: Sequence[str]
+    ) -> List[BatchItemResult]:
+        unique_usernames = list(dict.fromkeys(usernames_to_delete))
+        delete_requests = [
+            {"DeleteRequest": {"Key": {"username": username}}}
+            for username in unique_usernames
+        ]
+        unprocessed_requests: List[Dict[str, Any]] = []
+        for chunk in _chunks(delete_requests, BATCH_WRITE_MAX_REQUESTS):
+            unprocessed_requests += _retry_unprocessed(self._batch_write, chunk)
+        unprocessed_usernames = {
+            delete_request["DeleteRequest"]["Key"]["username"]
+            for delete_request in unprocessed_requests
+        }
+        return [
+            _batch_delete_result(username, unprocessed_usernames)
+            for username in unique_usernames
+        ]
+
+    def _put_batch_user(
+        self, username: str, user_attributes: Dict[str, Any]
+    ) -> BatchItemResult:
+        try:
+            current_user = self._get_current_user(username)
+            user = dict(
+                with_next_version(user_attributes, current_user), username=username
+            )
+            self._dynamodb.put_item(**self._build_put_request(user, current_user))
+        except exceptions.ClientError as exception:
+            if is_throttling_error(exception):
+                return BatchItemResult(username, BatchItemStatus.UNPROCESSED)
+            if _is_conditional_check_failed(exception):
+                return BatchItemResult(username, BatchItemStatus.CONFLICT)
+            raise
+        self._delete_offloaded(current_user, user)
+        return BatchItemResult(username, BatchItemStatus.PUT, user)
+
+    def _delete_user_replacing_offloaded(self, username: str) -> BatchItemResult:
+        # Batch writes cannot return the items they delete, each user is
+        # deleted on its own to delete the objects its item referenced
+        try:
+            response = self._dynamodb.delete_item(
+                TableName=self._table_name,
+                Key=_serialize_key(username),
+                ReturnValues="ALL_OLD",
+            )
+        except exceptions.ClientError as exception:
+            if not is_throttling_error(exception):
+                raise
+            return BatchItemResult(username, BatchItemStatus.UNPROCESSED)
+        if "Attributes" in response:
+            self._delete_offloaded(marshalling.deserialize_item(response["Attributes"]))
+        return BatchItemResult(username, BatchItemStatus.DELETED)
+
+    @instrumentation.timed("DynamoDBLatency", "Method")
+    def list_users(
+        self,
+        limit: int,
+        cursor: Optional[str] = None,
+        fields: Optional[Sequence[str]] = None,
+    ) -> UsersPage:
+        scan_kwargs: Dict[str, Any] = {
+            "TableName": self._table_name,
+            "Limit": limit,
+            **build_projection(fields),
+        }
+        if cursor is not None:
+            exclusive_start_key = decode_cursor(cursor)
+            scan_kwargs["ExclusiveStartKey"] = marshalling.serialize_item(
+                exclusive_start_key
+            )
+        response = self._scan_dynamodb.scan(**scan_kwargs)
+        found_users = [self._deserialize_user(item) for item in response["Items"]]
+        next_cursor = None
+        if "LastEvaluatedKey" in response:
+            last_evaluated_key = response["LastEvaluatedKey"]
+            next_cursor = encode_cursor(
+                marshalling.deserialize_item(last_evaluated_key)
+            )
+        return UsersPage(found_users, next_cursor)
+
+    def iter_users(self, total_segments: int = 1) -> Iterator[Dict[str, Any]]:
+        segment_scans = [
+            functools.partial(self._scan_segment, segment, total_segments)
+            for segment in range(total_segments)
+        ]
+        return parallel.iter_parallel(segment_scans)
+
+    def _scan_segment(
+        self, segment: int, total_segments: int
+    ) -> Iterator[List[Dict[str, Any]]]:
+        paginator = self._scan_dynamodb.get_paginator("scan")
+        pages = paginator.paginate(
+            TableName=self._table_name, Segment=segment, TotalSegments=total_segments
+        )
+        for page in pages:
+            yield [self._deserialize_user(item) for item in page["Items"]]
+
+    def _batch_get(
+        self,
+        keys: List[Dict[str, Any]],
+        *,
+        fields: Optional[Sequence[str]],
+        found_users: Dict[str, Dict[str, Any]],
+    ) -> List[Dict[str, Any]]:
+        table_name = self._table_name
+        serialized_keys = [marshalling.serialize_item(key) for key in keys]
+        keys_and_attributes = {"Keys": serialized_keys, **build_projection(fields)}
+        response = self._dynamodb.batch_get_item(
+            RequestItems={table_name: keys_and_attributes}
+        )
+        for item in response["Responses"].get(table_name, []):
+            user = self._deserialize_user(item)
+            found_users[user["username"]] = user
+        unprocessed_keys = (
+            response.get("UnprocessedKeys", {}).get(table_name, {}).get("Keys", [])
+        )
+        return [marshalling.deserialize_item(key) for key in unprocessed_keys]
+
+    def _batch_write(
+        self, write_requests: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        table_name = self._table_name
+        serialized_write_requests = [
+            marshalling.convert_write_request(write_request, marshalling.serialize_item)
+            for write_request in write_requests
+        ]
+        response = self._dynamodb.batch_write_item(
+            RequestItems={table_name: serialized_write_requests}
+        )
+        unprocessed_requests = response.get("UnprocessedItems", {}).get(table_name, [])
+        return [
+            marshalling.convert_write_request(
+                write_request, marshalling.deserialize_item
+            )
+            for write_request in unprocessed_requests
+        ]
+
+    def _build_update_request(
+        self, username: str, user_update: UserUpdate, expected_version: Optional[int]
+    ) -> Dict[str, Any]:
+        update_expression = update_expressions.build_update_expression(
+            set_attributes=user_update.set_attributes,
+            set_attributes_if_not_exists=user_update.set_attributes_if_not_exists,
+            remove_attributes=user_update.remove_attributes,
+            add_values=user_update.add_values,
+        )
+        condition_expression, names, values = _version_condition(
+            "attribute_exists(#username)", expected_version
+        )
+        return {
+            "TableName": self._table_name,
+            "Key": _serialize_key(username),
+            "UpdateExpression": update_expression.update_expression,
+            "ConditionExpression": condition_expression,
+            "ExpressionAttributeNames": {
+                **update_expression.expression_attribute_names,
+                **names,
+            },
+            "ExpressionAttributeValues": marshalling.serialize_item(
+                {**update_expression.expression_attribute_values, **values}
+            ),
+        }
+
+    def _build_delete_request(
+        self, username: str, expected_version: Optional[int]
     ) -> Dict[str, Any]:
-        update_expression_pairs = [f"#{key} = :{key}" for key in user_attributes]
-        update_expression = "SET " + ", ".join(update_expression_pairs)
-        expression_attribute_names = {f"#{key}": key for key in user_attributes}
-        expression_attribute_values = {
-            f":{key}": value for key, value in user_attributes.items()
+        return {
+            "TableName": self._table_name,
+            "Key": _serialize_key(username),
+            **_build_condition("attribute_exists(username)", expected_version),
         }
-        updated_item: Dict[str, Dict[str, Any]] = self._table.update_item(
-            Key={"username": username},
-            UpdateExpression=update_expression,
-            ExpressionAttributeNames=expression_attribute_names,
-            ExpressionAttributeValues=expression_attribute_values,
-            ReturnValues="ALL_NEW",
+
+    def _build_put_request(
+        self, user: Dict[str, Any], current_user: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        # Replaces the user as read, or creates it if there was none
+        if not current_user:
+            condition = _build_condition("attribute_not_exists(username)", None)
+        else:
+            condition = _build_condition(
+                "attribute_exists(username)", get_version(current_user)
+            )
+        return {
+            "TableName": self._table_name,
+            "Item": marshalling.serialize_item(user),
+            **condition,
+        }
+
+    def _claims_emails(self) -> bool:
+        return self._email_index.claims_table_name is not None
+
+    def _apply_email_update(
+        self, username: str, user_update: UserUpdate, expected_version: Optional[int]
+    ) -> Dict[str, Any]:
+        current_user = self._get_expected_user(username, expected_version)
+        current_version = get_version(current_user)
+        current_email = current_user.get(EMAIL_ATTRIBUTE)
+        new_email = _updated_email(current_email, user_update)
+        # Conditioning on the version read keeps the released email current,
+        # every conditional write increments it
+        update_request = self._build_update_request(
+            username, user_update, current_version
         )
-        return updated_item["Attributes"]
+        self._transact_write(
+            [
+                (
+                    {"Update": update_request},
+                    VersionConflictError(username, current_version),
+                ),
+                *self._change_email_claims(username, current_email, new_email),
+            ]
+        )
+        return self._replace_offloaded(current_user)
+
+    def _delete_user_and_email(
+        self, username: str, expected_version: Optional[int]
+    ) -> None:
+        current_user = self._get_expected_user(username, expected_version)
+        current_version = get_version(current_user)
+        current_email = current_user.get(EMAIL_ATTRIBUTE)
+        self._transact_write(
+            [
+                (
+                    {"Delete": self._build_delete_request(username, current_version)},
+                    VersionConflictError(username, current_version),
+                ),
+                *self._change_email_claims(username, current_email, None),
+            ]
+        )
+        self._delete_offloaded(current_user)
+
+    def _write_users_and_emails(
+        self,
+        users_to_put: Dict[str, Dict[str, Any]],
+        usernames_to_delete: Sequence[str],
+    ) -> List[BatchItemResult]:
+        # Batch writes cannot condition nor claim, each user is written with
+        # its email claims in a transaction of its own
+        results = [
+            self._put_user_and_email(username, user_attributes)
+            for username, user_attributes in users_to_put.items()
+        ]
+        results += [
+            self._delete_user_and_email_item(username)
+            for username in dict.fromkeys(usernames_to_delete)
+        ]
+        return results
+
+    def _put_user_and_email(
+        self, username: str, user_attributes: Dict[str, Any]
+    ) -> BatchItemResult:
+        current_user = self._get_current_user(username)
+        user = dict(with_next_version(user_attributes, current_user), username=username)
+        try:
+            self._transact_write(
+                [
+                    (
+                        {"Put": self._build_put_request(user, current_user)},
+                        VersionConflictError(username, get_version(current_user)),
+                    ),
+                    *self._change_email_claims(
+                        username,
+                        current_user.get(EMAIL_ATTRIBUTE),
+                        user.get(EMAIL_ATTRIBUTE),
+                    ),
+                ]
+            )
+        except (VersionConflictError, EmailAlreadyInUseError):
+            return BatchItemResult(username, BatchItemStatus.CONFLICT)
+        self._delete_offloaded(current_user, user)
+        return BatchItemResult(username, BatchItemStatus.PUT, user)
+
+    def _get_current_user(self, username: str) -> Dict[str, Any]:
+        # Empty when the user does not exist yet
+        try:
+            return self._get_expected_user(username, None)
+        except UserNotFoundError:
+            return {}
+
+    def _delete_user_and_email_item(self, username: str) -> BatchItemResult:
+        # Deleting a missing user succeeds, as with batch writes
+        with contextlib.suppress(UserNotFoundError):
+            try:
+                self._delete_user_and_email(username, None)
+            except VersionConflictError:
+                return BatchItemResult(username, BatchItemStatus.CONFLICT)
+        return BatchItemResult(username, BatchItemStatus.DELETED)
+
+    def _get_expected_user(
+        self, username: str, expected_version: Optional[int]
+    ) -> Dict[str, Any]:
+        response = self._dynamodb.get_item(
+            TableName=self._table_name,
+            Key=_serialize_key(username),
+            ConsistentRead=True,
+        )
+        if "Item" not in response:
+            raise UserNotFoundError(username)
+        user = marshalling.deserialize_item(response["Item"])
+        if expected_version is not None and get_version(user) != expected_version:
+            raise VersionConflictError(username, expected_version)
+        return user
+
+    def _change_email_claims(
+        self, username: str, current_email: Optional[str], new_email: Optional[str]
+    ) -> List[Tuple[Dict[str, Any], Optional[Exception]]]:
+        if new_email == current_email:
+            return []
+        changes: List[Tuple[Dict[str, Any], Optional[Exception]]] = []
+        if new_email is not None:
+            changes.append(
+                (
+                    self._claim_email(new_email, username),
+                    EmailAlreadyInUseError(new_email),
+                )
+            )
+        if current_email is not None:
+            changes.append((self._release_email(current_email, username), None))
+        return changes
+
+    def _claim_email(self, email: str, username: str) -> Dict[str, Any]:
+        return {
+            "Put": {
+                "TableName": self._email_index.claims_table_name,
+                "Item": marshalling.serialize_item(
+                    {EMAIL_ATTRIBUTE: email, "username": username}
+                ),
+                **_email_claim_condition(username),
+            }
+        }
+
+    def _release_email(self, email: str, username: str) -> Dict[str, Any]:
+        return {
+            "Delete": {
+                "TableName": self._email_index.claims_table_name,
+                "Key": marshalling.serialize_item({EMAIL_ATTRIBUTE: email}),
+                **_email_claim_condition(username),
+            }
+        }
+
+    def _transact_write(
+        self, transact_items: Sequence[Tuple[Dict[str, Any], Optional[Exception]]]
+    ) -> None:
+        # Each item is paired with the error its failed condition stands for
+        try:
+            self._dynamodb.transact_write_items(
+                TransactItems=[transact_item for transact_item, _ in transact_items]
+            )
+        except exceptions.ClientError as exception:
+            error = _transaction_error(exception, transact_items)
+            if error is not None:
+                raise error from exception
+            raise
+
+    def _query_email_index(
+        self, email: str, fields: Optional[Sequence[str]], limit: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        projected = self._email_index.projects(fields)
+        # Without the fields in the index, the query only finds the usernames
+        index_fields = fields if projected else []
+        found_users = list(
+            itertools.islice(self._iter_email_index(email, index_fields, limit), limit)
+        )
+        if projected:
+            return found_users
+        return self._get_users([user["username"] for user in found_users], fields)
+
+    def _get_users(
+        self, usernames: List[str], fields: Optional[Sequence[str]]
+    ) -> List[Dict[str, Any]]:
+        results = self.batch_get_users(usernames, fields)
+        return [result.user for result in results if result.user is not None]
+
+    def _iter_email_index(
+        self, email: str, fields: Optional[Sequence[str]], limit: Optional[int]
+    ) -> Iterator[Dict[str, Any]]:
+        projection = build_projection(fields)
+        query_kwargs: Dict[str, Any] = {
+            "TableName": self._table_name,
+            "IndexName": self._email_index.index_name,
+            "KeyConditionExpression": "#email = :email",
+            **projection,
+            "ExpressionAttributeNames": {
+                "#email": EMAIL_ATTRIBUTE,
+                **projection.get("ExpressionAttributeNames", {}),
+            },
+            "ExpressionAttributeValues": marshalling.serialize_item({":email": email}),
+        }
+        if limit is not None:
+            query_kwargs["Limit"] = limit
+        paginator = self._scan_dynamodb.get_paginator("query")
+        for page in paginator.paginate(**query_kwargs):
+            for item in page["Items"]:
+                yield self._deserialize_user(item)
+
+    def _encode_user(self, username: str, user: Dict[str, Any]) -> Dict[str, Any]:
+        if self._large_attributes is None:
+            return user
+        return self._large_attributes.encode_attributes(username, user)
+
+    def _encode_update(self, username: str, user_update: UserUpdate) -> UserUpdate:
+        if self._large_attributes is None:
+            return user_update
+        return dataclasses.replace(
+            user_update,
+            set_attributes=self._large_attributes.encode_attributes(
+                username, user_update.set_attributes
+            ),
+            set_attributes_if_not_exists=self._large_attributes.encode_attributes(
+                username, user_update.set_attributes_if_not_exists
+            ),
+        )
+
+    def _deserialize_user(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        return self._decode_user(marshalling.deserialize_item(item))
+
+    def _decode_user(self, user: Dict[str, Any]) -> Dict[str, Any]:
+        # Projections skip the attributes not asked for, offloaded values are
+        # only fetched for the attributes a read returns
+        if self._large_attributes is None:
+            return user
+        return self._large_attributes.decode_item(user)
+
+    def _offloads(self) -> bool:
+        return self._large_attributes is not None and self._large_attributes.offloads
+
+    def _return_values_on_update(self) -> Dict[str, Any]:
+        # With offloading, the replaced values name the objects to clean up and
+        # the updated user is read back
+        if self._offloads():
+            return {"ReturnValues": "UPDATED_OLD"}
+        return {"ReturnValues": "ALL_NEW"}
+
+    def _updated_user(self, username: str, response: Dict[str, Any]) -> Dict[str, Any]:
+        if not self._offloads():
+            return self._deserialize_user(response["Attributes"])
+        # The attributes that had a value before the update
+        replaced_attributes = marshalling.deserialize_item(
+            response.get("Attributes", {})
+        )
+        return self._replace_offloaded(dict(replaced_attributes, username=username))
+
+    def _replace_offloaded(self, replaced_user: Dict[str, Any]) -> Dict[str, Any]:
+        # Reads the updated user, deleting the objects it no longer references
+        user = self._get_expected_user(replaced_user["username"], None)
+        self._delete_offloaded(replaced_user, user)
+        return self._decode_user(user)
+
+    def _return_values_on_delete(self) -> Dict[str, Any]:
+        # The deleted item names the offloaded values to clean up
+        if self._large_attributes is None:
+            return {}
+        return {"ReturnValues": "ALL_OLD"}
+
+    def _delete_offloaded(
+        self, user: Dict[str, Any], replacement: Optional[Dict[str, Any]] = None
+    ) -> None:
+        # Deletes the objects of a deleted user, or those its replacement no
+        # longer references
+        if self._large_attributes is None:
+            return
+        # Best effort, the user is written whether or not the objects are deleted
+        with contextlib.suppress(exceptions.ClientError):
+            self._large_attributes.delete_offloaded(user, replacement)
+
+
+def with_version_increment(user_update: UserUpdate) -> UserUpdate:
+    attribute_names = {
+        *user_update.set_attributes,
+        *user_update.set_attributes_if_not_exists,
+        *user_update.remove_attributes,
+        *user_update.add_values,
+    }
+    if not attribute_names:
+        raise ValueError("Update must change at least one attribute")
+    if VERSION_ATTRIBUTE in attribute_names:
+        raise ValueError(f"Attribute {VERSION_ATTRIBUTE} cannot be updated")
+    return dataclasses.replace(
+        user_update, add_values={**user_update.add_values, VERSION_ATTRIBUTE: 1}
+    )
+
+
+def with_next_version(
+    user_attributes: Dict[str, Any], current_user: Dict[str, Any]
+) -> Dict[str, Any]:
+    # Replacing a user counts its version up as updates do, a new user starts
+    # at version 1 as when created
+    return dict(user_attributes, **{VERSION_ATTRIBUTE: get_version(current_user) + 1})
+
+
+def get_version(user: Dict[str, Any]) -> int:
+    # Users written before versioning have no version yet
+    return int(user.get(VERSION_ATTRIBUTE, 0))
+
+
+def build_projection(fields: Optional[Sequence[str]]) -> Dict[str, Any]:
+    if fields is None:
+        return {}
+    # The key is always projected, results are matched to requests by username.
+    # Placeholders keep reserved words and special characters in field names safe
+    names = list(dict.fromkeys(["username", *fields]))
+    placeholders = {f"#p{index}": name for index, name in enumerate(names)}
+    return {
+        "ProjectionExpression": ", ".join(placeholders),
+        "ExpressionAttributeNames": placeholders,
+    }
+
+
+@overload
+def project_user(
+    user: Dict[str, Any], fields: Optional[Sequence[str]]
+) -> Dict[str, Any]:
+    ...
+
+
+@overload
+def project_user(user: None, fields: Optional[Sequence[str]]) -> None:
+    ...
+
+
+@overload
+def project_user(
+    user: Optional[Dict[str, Any]], fields: Optional[Sequence[str]]
+) -> Optional[Dict[str, Any]]:
+    ...
+
+
+def project_user(
+    user: Optional[Dict[str, Any]], fields: Optional[Sequence[str]]
+) -> Optional[Dict[str, Any]]:
+    if user is None or fields is None:
+        return user
+    return {
+        name: user[name]
+        for name in dict.fromkeys(["username", *fields])
+        if name in user
+    }
+
+
+def encode_cursor(last_evaluated_key: Dict[str, Any]) -> str:
+    return base64.urlsafe_b64encode(json.dumps(last_evaluated_key).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    try:
+        exclusive_start_key = json.loads(base64.urlsafe_b64decode(cursor))
+    except (binascii.Error, ValueError) as exception:
+        raise InvalidCursorError(cursor) from exception
+    # Only the table's key may be passed on as ExclusiveStartKey
+    if not isinstance(exclusive_start_key, dict):
+        raise InvalidCursorError(cursor)
+    username = exclusive_start_key.get("username")
+    if set(exclusive_start_key) != {"username"} or not isinstance(username, str):
+        raise InvalidCursorError(cursor)
+    return {"username": username}
+
+
+def _chunks(values: Sequence[_T], size: int) -> Iterator[List[_T]]:
+    for start in range(0, len(values), size):
+        yield list(values[start : start + size])
+
+
+def _retry_unprocessed(
+    send: Callable[[List[_T]], List[_T]], requests: List[_T]
+) -> List[_T]:
+    for attempt in range(BATCH_MAX_ATTEMPTS):
+        if attempt > 0:
+            # Exponential backoff with full jitter
+            backoff_seconds = BATCH_BACKOFF_BASE_SECONDS * 2**attempt
+            time.sleep(
+                _random.uniform(0, min(BATCH_BACKOFF_MAX_SECONDS, backoff_seconds))
+            )
+        requests = send(requests)
+        if not requests:
+            break
+    return requests
+
+
+def _batch_get_result(
+    username: str,
+    found_users: Dict[str, Dict[str, Any]],
+    unprocessed_usernames: Set[str],
+) -> BatchItemResult:
+    if username in found_users:
+        return BatchItemResult(username, BatchItemStatus.FOUND, found_users[username])
+    if username in unprocessed_usernames:
+        return BatchItemResult(username, BatchItemStatus.UNPROCESSED)
+    return BatchItemResult(username, BatchItemStatus.NOT_FOUND)
+
+
+def _batch_delete_result(
+    username: str, unprocessed_usernames: Set[str]
+) -> BatchItemResult:
+    if username in unprocessed_usernames:
+        return BatchItemResult(username, BatchItemStatus.UNPROCESSED)
+    return BatchItemResult(username, BatchItemStatus.DELETED)
+
+
+def _serialize_key(username: str) -> Dict[str, Any]:
+    return marshalling.serialize_item({"username": username})
+
+
+def _version_condition(
+    key_condition: str, expected_version: Optional[int]
+) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+    if expected_version is None:
+        return key_condition, {}, {}
+    names = {"#version": VERSION_ATTRIBUTE}
+    if expected_version == 0:
+        return f"{key_condition} AND attribute_not_exists(#version)", names, {}
+    return (
+        f"{key_condition} AND #version = :expected_version",
+        names,
+        {":expected_version": expected_version},
+    )
+
+
+def _return_values_on_condition_check_failure(
+    expected_version: Optional[int],
+) -> Dict[str, str]:
+    # The old item tells a version conflict apart from a missing user
+    if expected_version is None:
+        return {}
+    return {"ReturnValuesOnConditionCheckFailure": "ALL_OLD"}
+
+
+def _conditional_write_error(
+    username: str, expected_version: Optional[int], exception: exceptions.ClientError
+) -> Exception:
+    if expected_version is not None and "Item" in exception.response:
+        return VersionConflictError(username, expected_version)
+    return UserNotFoundError(username)
+
+
+def _changes_email(user_update: UserUpdate) -> bool:
+    return EMAIL_ATTRIBUTE in {
+        *user_update.set_attributes,
+        *user_update.set_attributes_if_not_exists,
+        *user_update.remove_attributes,
+    }
+
+
+def _updated_email(
+    current_email: Optional[str], user_update: UserUpdate
+) -> Optional[str]:
+    if EMAIL_ATTRIBUTE in user_update.set_attributes:
+        return str(user_update.set_attributes[EMAIL_ATTRIBUTE])
+    if EMAIL_ATTRIBUTE in user_update.remove_attributes:
+        return None
+    if current_email is None:
+        return user_update.set_attributes_if_not_exists.get(EMAIL_ATTRIBUTE)
+    return current_email
+
+
+def _transaction_error(
+    exception: exceptions.ClientError,
+    transact_items: Sequence[Tuple[Dict[str, Any], Optional[Exception]]],
+) -> Optional[Exception]:
+    reasons = exception.response.get("CancellationReasons", [])
+    for reason, (_, error) in zip(reasons, transact_items):
+        if reason.get("Code") == "ConditionalCheckFailed":
+            return error
+    return None
+
+
+def _build_condition(
+    key_condition: str, expected_version: Optional[int]
+) -> Dict[str, Any]:
+    condition_expression, names, values = _version_condition(
+        key_condition, expected_version
+    )
+    condition: Dict[str, Any] = {"ConditionExpression": condition_expression}
+    if names:
+        condition["ExpressionAttributeNames"] = names
+    # DynamoDB rejects an empty map, expecting version 0 has no values
+    if values:
+        condition["ExpressionAttributeValues"] = marshalling.serialize_item(values)
+    return condition
+
+
+def _email_claim_condition(username: str) -> Dict[str, Any]:
+    # A user may rewrite or release its own claim, a missing claim is released
+    # already
+    return {
+        "ConditionExpression": "attribute_not_exists(#email) OR username = :username",
+        "ExpressionAttributeNames": {"#email": EMAIL_ATTRIBUTE},
+        "ExpressionAttributeValues": marshalling.serialize_item(
+            {":username": username}
+        ),
+    }
+
+
+@contextlib.contextmanager
+def _admitted(budget: Optional[AdaptiveTokenBucket]) -> Iterator[None]:
+    if budget is None:
+        yield
+        return
+    retry_after_seconds = budget.try_acquire()
+    if retry_after_seconds > 0:
+        instrumentation.add_count("ShedRequests")
+        raise RateLimitExceededError(retry_after_seconds)
+    try:
+        yield
+    except exceptions.ClientError as exception:
+        if not is_throttling_error(exception):
+            raise
+        instrumentation.add_count("ThrottledRequests")
+        raise RateLimitExceededError(budget.record_throttle()) from exception
+
+
+def is_throttling_error(exception: exceptions.ClientError) -> bool:
+    error_code = exception.response.get("Error", {}).get("Code")
+    if error_code in THROTTLING_ERROR_CODES:
+        return True
+    reasons = exception.response.get("CancellationReasons", [])
+    return any(
+        reason.get("Code") == THROTTLING_CANCELLATION_REASON for reason in reasons
+    )
 
-    def get_user(self, username: str) -> Optional[Dict[str, Any]]:
-        response = self._table.get_item(Key={"username": username})
-        return response["Item"] if "Item" in response else None
 
-    def delete_user(self, username: str) -> None:
-        self._table.delete_item(Key={"username": username})
+def _is_conditional_check_failed(exception: exceptions.ClientError) -> bool:
+    error_code = exception.response.get("Error", {}).get("Code")
+    return error_code == "ConditionalCheckFailedException"
@@ -13,15 +13,28 @@
 # IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
+import dataclasses
 from typing import Any
 
 import aws_cdk as cdk
-import aws_cdk.aws_dynamodb as dynamodb
 from constructs import Construct
 
 from backend.api.infrastructure import API
+from backend.api.infrastructure import APISettings
 from backend.database.infrastructure import Database
+from backend.database.infrastructure import DatabaseSettings
+from backend.monitoring.infrastructure import AlarmSettings
 from backend.monitoring.infrastructure import Monitoring
+from backend.stats.infrastructure import Stats
+from backend.stats.infrastructure import StatsSettings
+
+
+@dataclasses.dataclass(frozen=True)
+class BackendSettings:
+    api: APISettings
+    database: DatabaseSettings
+    alarms: AlarmSettings = AlarmSettings()
+    stats: StatsSettings = StatsSettings()
 
 
 class Backend(cdk.Stack):
@@ -30,26 +43,25 @@ class Backend(cdk.Stack):
         scope: Construct,
         id_: str,
         *,
-        database_dynamodb_billing_mode: dynamodb.BillingMode,
-        api_lambda_reserved_concurrency: int,
+        settings: BackendSettings,
         **kwargs: Any,
     ):
         super().__init__(scope, id_, **kwargs)
 
-        database = Database(
-            self,
-            "Database",
-            dynamodb_billing_mode=database_dynamodb_billing_mode,
+        database = Database(self, "Database", settings=settings.database)
+        api = API(self, "API", database=database, settings=settings.api)
+        Monitoring(self, "Monitoring", database=database, api=api).add_alarms(
+            settings.alarms
         )
-        api = API(
-            self,
-            "API",
-            dynamodb_table_name=database.dynamodb_table.table_name,
-            lambda_reserved_concurrency=api_lambda_reserved_concurrency,
-        )
-        Monitoring(self, "Monitoring", database=database, api=api)
 
-        database.dynamodb_table.grant_read_write_data(api.lambda_function)
+        # Replicated writes reach the primary region's stream too, its stats
+        # table replicas serve the counts of every region
+        if database.owns_tables:
+            Stats(self, "Stats", database=database, settings=settings.stats)
+
+        database.grant_read_write_data(api.lambda_function)
+        if database.dax_cluster is not None:
+            database.grant_dax_access(api.lambda_function)
 
         self.api_endpoint = cdk.CfnOutput(
             self,
@@ -13,24 +13,551 @@
 # IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
+import dataclasses
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
 import aws_cdk as cdk
+import aws_cdk.aws_applicationautoscaling as applicationautoscaling
+import aws_cdk.aws_dax as dax
 import aws_cdk.aws_dynamodb as dynamodb
+import aws_cdk.aws_ec2 as ec2
+import aws_cdk.aws_iam as iam
+import aws_cdk.aws_lambda as lambda_
+import aws_cdk.aws_s3 as s3
+import aws_cdk.aws_ssm as ssm
+from aws_cdk import custom_resources
 from constructs import Construct
 
+# Port of the TLS-encrypted cluster endpoint
+DAX_PORT = 9111
+DAX_DATA_ACTIONS = [
+    "dax:BatchGetItem",
+    "dax:BatchWriteItem",
+    "dax:ConditionCheckItem",
+    "dax:DeleteItem",
+    "dax:GetItem",
+    "dax:PutItem",
+    "dax:Query",
+    "dax:Scan",
+    "dax:UpdateItem",
+]
+# Users, email and stats table names, then the attributes bucket name
+GLOBAL_TABLE_NAMES_SEPARATOR = ","
+GLOBAL_TABLE_NAMES_COUNT = 4
+
+
+@dataclasses.dataclass(frozen=True)
+class DaxSettings:
+    node_type: str = "dax.t3.small"
+    # One primary and read replicas, 3 or more spreads them across zones
+    node_count: int = 3
+    # Without a VPC, one with isolated subnets and a DynamoDB endpoint is created
+    vpc: Optional[ec2.IVpc] = None
+    subnet_type: Optional[ec2.SubnetType] = None
+    security_groups: Sequence[ec2.ISecurityGroup] = ()
+
+
+@dataclasses.dataclass(frozen=True)
+class EmailIndexSettings:
+    index_name: str = "email"
+    # KEYS_ONLY or INCLUDE keep the index small, lookups of attributes outside
+    # the projection fetch the users from the table
+    projection_type: dynamodb.ProjectionType = dynamodb.ProjectionType.ALL
+    non_key_attributes: Sequence[str] = ()
+
+    def to_environment(self) -> Dict[str, str]:
+        projected_attributes = (
+            "*"
+            if self.projection_type == dynamodb.ProjectionType.ALL
+            else ",".join(self.non_key_attributes)
+        )
+        return {
+            "DYNAMODB_EMAIL_INDEX_NAME": self.index_name,
+            "DYNAMODB_EMAIL_INDEX_ATTRIBUTES": projected_attributes,
+        }
+
+
+@dataclasses.dataclass(frozen=True)
+class LargeAttributeSettings:
+    # DynamoDB JSON size from which values are compressed, 0 disables both
+    compression_threshold_bytes: int = 4096
+    # Compressed size from which values are offloaded to the attributes bucket
+    offload_threshold_bytes: int = 65536
+
+    def to_environment(self) -> Dict[str, str]:
+        return {
+            "DYNAMODB_COMPRESSION_THRESHOLD": str(self.compression_threshold_bytes),
+            "DYNAMODB_OFFLOAD_THRESHOLD": str(self.offload_threshold_bytes),
+        }
+
+
+@dataclasses.dataclass(frozen=True)
+class GlobalTableSettings:
+    # Its stack keeps the tables and the attributes bucket and adds the
+    # replicas, the stacks of the other regions import them
+    primary_region: str
+    # Parameter of the primary region with the generated table and bucket
+    # names, e.g. /UserManagementBackendProduction/GlobalTableNames
+    parameter_name: str
+    replica_regions: Sequence[str] = ()
+
+
+@dataclasses.dataclass(frozen=True)
+class ScheduledCapacity:
+    # Raises (or lowers) the scaling floor ahead of known peaks, e.g.
+    # applicationautoscaling.Schedule.cron(hour="7", minute="45")
+    name: str
+    schedule: applicationautoscaling.Schedule
+    min_read_capacity: int
+    min_write_capacity: int
+
+
+@dataclasses.dataclass(frozen=True)
+class CapacityProfile:
+    # Only applies to the provisioned billing mode
+    min_read_capacity: int = 5
+    max_read_capacity: int = 100
+    min_write_capacity: int = 5
+    max_write_capacity: int = 50
+    target_utilization_percent: int = 70
+    scheduled_capacities: Sequence[ScheduledCapacity] = ()
+
+
+@dataclasses.dataclass(frozen=True)
+class DatabaseSettings:
+    dynamodb_billing_mode: dynamodb.BillingMode
+    dax: Optional[DaxSettings] = None
+    capacity_profile: CapacityProfile = CapacityProfile()
+    email_index: EmailIndexSettings = EmailIndexSettings()
+    large_attributes: LargeAttributeSettings = LargeAttributeSettings()
+    global_table: Optional[GlobalTableSettings] = None
+
+
+@dataclasses.dataclass(frozen=True)
+class DaxCluster:
+    cluster: dax.CfnCluster
+    security_group: ec2.SecurityGroup
+    # Functions reach the cluster from these subnets
+    vpc: ec2.IVpc
+    vpc_subnets: ec2.SubnetSelection
+
+    @property
+    def endpoint(self) -> str:
+        return self.cluster.attr_cluster_discovery_endpoint_url
+
 
 class Database(Construct):
-    def __init__(
-        self, scope: Construct, id_: str, *, dynamodb_billing_mode: dynamodb.BillingMode
-    ):
+    def __init__(self, scope: Construct, id_: str, *, settings: DatabaseSettings):
         super().__init__(scope, id_)
 
-        partition_key = dynamodb.Attribute(
-            name="username", type=dynamodb.AttributeType.STRING
+        self.settings = settings
+        if settings.global_table is None or self.owns_tables:
+            (
+                self.dynamodb_table,
+                self.dynamodb_email_table,
+                self.dynamodb_stats_table,
+            ) = self._create_tables(settings)
+            # Attribute values too large for an item even compressed, keyed by
+            # username, attribute and content hash
+            self.attributes_bucket: s3.IBucket = s3.Bucket(
+                self,
+                "AttributesBucket",
+                encryption=s3.BucketEncryption.S3_MANAGED,
+                block_public_access=s3.BlockPublicAccess.BLOCK_ALL,
+                enforce_ssl=True,
+                removal_policy=cdk.RemovalPolicy.DESTROY,
+                auto_delete_objects=True,
+            )
+            if settings.global_table is not None:
+                self._publish_global_table_names(settings.global_table)
+            self._primary_tables: List[dynamodb.ITable] = []
+        else:
+            (
+                self.dynamodb_table,
+                self.dynamodb_email_table,
+                self.dynamodb_stats_table,
+                self.attributes_bucket,
+            ) = self._import_global_tables(settings.global_table, settings.email_index)
+            self._primary_tables = self._import_primary_tables(
+                settings.global_table.primary_region
+            )
+
+        self.dax_cluster: Optional[DaxCluster] = None
+        if settings.dax is not None:
+            self.dax_cluster = self._create_dax_cluster(settings.dax)
+
+    @property
+    def owns_tables(self) -> bool:
+        # In the replica regions the stacks import the tables, the users table
+        # stream is aggregated in the primary region
+        if self.settings.global_table is None:
+            return True
+        return self.settings.global_table.primary_region == _get_region(self)
+
+    @property
+    def attributes_bucket_region(self) -> Optional[str]:
+        # Objects aren't replicated, the replica regions use the bucket of the
+        # primary region
+        if self.owns_tables:
+            return None
+        return self.attributes_bucket.env.region
+
+    @property
+    def write_region(self) -> Optional[str]:
+        # Conditions are checked in the replica written to only, the replica
+        # regions write the tables of the primary region
+        global_table_settings = self.settings.global_table
+        if global_table_settings is None or self.owns_tables:
+            return None
+        return global_table_settings.primary_region
+
+    def grant_read_write_data(self, grantee: iam.IGrantable) -> None:
+        self._grant_tables_read_write_data(grantee)
+        self.attributes_bucket.grant_read_write(grantee)
+
+    def grant_dax_access(self, function: lambda_.IFunction) -> None:
+        if self.dax_cluster is None:
+            raise ValueError("Database has no DAX cluster")
+        iam.Grant.add_to_principal(
+            grantee=function,
+            actions=DAX_DATA_ACTIONS,
+            resource_arns=[self.dax_cluster.cluster.attr_arn],
         )
-        self.dynamodb_table = dynamodb.Table(
+        self.dax_cluster.security_group.connections.allow_from(
+            function, ec2.Port.tcp(DAX_PORT)
+        )
+
+    def _grant_tables_read_write_data(self, grantee: iam.IGrantable) -> None:
+        self.dynamodb_table.grant_read_write_data(grantee)
+        self.dynamodb_email_table.grant_read_write_data(grantee)
+        self.dynamodb_stats_table.grant_read_write_data(grantee)
+        for primary_table in self._primary_tables:
+            primary_table.grant_read_write_data(grantee)
+
+    def _create_tables(
+        self, settings: DatabaseSettings
+    ) -> Tuple[dynamodb.ITable, dynamodb.ITable, dynamodb.ITable]:
+        capacity_profile = settings.capacity_profile
+        provisioned = settings.dynamodb_billing_mode == dynamodb.BillingMode.PROVISIONED
+        table = dynamodb.Table(
             self,
             "DynamoDBTable",
-            billing_mode=dynamodb_billing_mode,
-            partition_key=partition_key,
+            billing_mode=settings.dynamodb_billing_mode,
+            partition_key=dynamodb.Attribute(
+                name="username", type=dynamodb.AttributeType.STRING
+            ),
+            read_capacity=capacity_profile.min_read_capacity if provisioned else None,
+            write_capacity=capacity_profile.min_write_capacity if provisioned else None,
+            removal_policy=cdk.RemovalPolicy.DESTROY,
+            # Both images, aggregates count the attribute values a change removes
+            stream=dynamodb.StreamViewType.NEW_AND_OLD_IMAGES,
+            **_replication(settings.global_table),
+        )
+        self._add_email_index(
+            table, settings.email_index, capacity_profile, provisioned
+        )
+        # One item per email claimed by a user, conditional puts keep emails
+        # unique without scanning the index. Claims only change with emails, so
+        # the table is billed per request in either mode
+        email_table = dynamodb.Table(
+            self,
+            "DynamoDBEmailTable",
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            partition_key=dynamodb.Attribute(
+                name="email", type=dynamodb.AttributeType.STRING
+            ),
             removal_policy=cdk.RemovalPolicy.DESTROY,
+            **_replication(settings.global_table),
         )
+        # Aggregates of the users table stream, a summary item and a marker per
+        # counted stream record that expires once no retry can replay it
+        stats_table = dynamodb.Table(
+            self,
+            "DynamoDBStatsTable",
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            partition_key=dynamodb.Attribute(
+                name="id", type=dynamodb.AttributeType.STRING
+            ),
+            time_to_live_attribute="expiresAt",
+            removal_policy=cdk.RemovalPolicy.DESTROY,
+            **_replication(settings.global_table),
+        )
+        if provisioned:
+            self._configure_auto_scaling(
+                table, capacity_profile, [settings.email_index.index_name]
+            )
+        return table, email_table, stats_table
+
+    def _publish_global_table_names(
+        self, global_table_settings: GlobalTableSettings
+    ) -> None:
+        # The tables keep their generated names, the replica regions look them
+        # up in this parameter
+        ssm.StringParameter(
+            self,
+            "GlobalTableNames",
+            parameter_name=global_table_settings.parameter_name,
+            string_value=cdk.Fn.join(
+                GLOBAL_TABLE_NAMES_SEPARATOR,
+                [
+                    self.dynamodb_table.table_name,
+                    self.dynamodb_email_table.table_name,
+                    self.dynamodb_stats_table.table_name,
+                    self.attributes_bucket.bucket_name,
+                ],
+            ),
+        )
+
+    def _import_global_tables(
+        self,
+        global_table_settings: GlobalTableSettings,
+        email_index_settings: EmailIndexSettings,
+    ) -> Tuple[dynamodb.ITable, dynamodb.ITable, dynamodb.ITable, s3.IBucket]:
+        # The replicas of this region, capacity and scaling follow the primary
+        (
+            table_name,
+            email_table_name,
+            stats_table_name,
+            bucket_name,
+        ) = self._read_global_table_names(global_table_settings)
+        table = dynamodb.Table.from_table_attributes(
+            self,
+            "DynamoDBTable",
+            table_name=table_name,
+            global_indexes=[email_index_settings.index_name],
+        )
+        email_table = dynamodb.Table.from_table_name(
+            self, "DynamoDBEmailTable", email_table_name
+        )
+        stats_table = dynamodb.Table.from_table_name(
+            self, "DynamoDBStatsTable", stats_table_name
+        )
+        bucket = s3.Bucket.from_bucket_attributes(
+            self,
+            "AttributesBucket",
+            bucket_name=bucket_name,
+            region=global_table_settings.primary_region,
+        )
+        return table, email_table, stats_table, bucket
+
+    def _import_primary_tables(self, primary_region: str) -> List[dynamodb.ITable]:
+        # The users and email claims tables, as written by the replica regions
+        return [
+            dynamodb.Table.from_table_arn(
+                self,
+                "Primary" + table.node.id,
+                cdk.Stack.of(self).format_arn(
+                    service="dynamodb",
+                    region=primary_region,
+                    resource="table",
+                    resource_name=table.table_name,
+                ),
+            )
+            for table in [self.dynamodb_table, self.dynamodb_email_table]
+        ]
+
+    def _read_global_table_names(
+        self, global_table_settings: GlobalTableSettings
+    ) -> List[str]:
+        # Parameters are regional, the value is read from the primary region
+        parameter_arn = cdk.Stack.of(self).format_arn(
+            service="ssm",
+            region=global_table_settings.primary_region,
+            resource="parameter",
+            resource_name=global_table_settings.parameter_name.lstrip("/"),
+        )
+        get_parameter = custom_resources.AwsSdkCall(
+            service="SSM",
+            action="getParameter",
+            parameters={"Name": global_table_settings.parameter_name},
+            region=global_table_settings.primary_region,
+            physical_resource_id=custom_resources.PhysicalResourceId.of(
+                global_table_settings.parameter_name
+            ),
+        )
+        global_table_names = custom_resources.AwsCustomResource(
+            self,
+            "GlobalTableNames",
+            on_create=get_parameter,
+            on_update=get_parameter,
+            policy=custom_resources.AwsCustomResourcePolicy.from_sdk_calls(
+                resources=[parameter_arn]
+            ),
+            install_latest_aws_sdk=False,
+        ).get_response_field("Parameter.Value")
+        return [
+            cdk.Fn.select(
+                index,
+                cdk.Fn.split(
+                    GLOBAL_TABLE_NAMES_SEPARATOR,
+                    global_table_names,
+                    GLOBAL_TABLE_NAMES_COUNT,
+                ),
+            )
+            for index in range(GLOBAL_TABLE_NAMES_COUNT)
+        ]
+
+    def _add_email_index(
+        self,
+        table: dynamodb.Table,
+        email_index_settings: EmailIndexSettings,
+        capacity_profile: CapacityProfile,
+        provisioned: bool,
+    ) -> None:
+        table.add_global_secondary_index(
+            index_name=email_index_settings.index_name,
+            partition_key=dynamodb.Attribute(
+                name="email", type=dynamodb.AttributeType.STRING
+            ),
+            projection_type=email_index_settings.projection_type,
+            non_key_attributes=list(email_index_settings.non_key_attributes) or None,
+            read_capacity=capacity_profile.min_read_capacity if provisioned else None,
+            write_capacity=capacity_profile.min_write_capacity if provisioned else None,
+        )
+
+    def _configure_auto_scaling(
+        self,
+        table: dynamodb.Table,
+        capacity_profile: CapacityProfile,
+        index_names: Sequence[str],
+    ) -> None:
+        # Target tracking for the table and every index, which scale separately
+        for index_name in [None, *index_names]:
+            read_scaling = self._auto_scale_read_capacity(
+                table,
+                index_name,
+                min_capacity=capacity_profile.min_read_capacity,
+                max_capacity=capacity_profile.max_read_capacity,
+            )
+            write_scaling = self._auto_scale_write_capacity(
+                table,
+                index_name,
+                min_capacity=capacity_profile.min_write_capacity,
+                max_capacity=capacity_profile.max_write_capacity,
+            )
+            for scaling in [read_scaling, write_scaling]:
+                scaling.scale_on_utilization(
+                    target_utilization_percent=(
+                        capacity_profile.target_utilization_percent
+                    )
+                )
+            for scheduled_capacity in capacity_profile.scheduled_capacities:
+                read_scaling.scale_on_schedule(
+                    scheduled_capacity.name + "Read",
+                    schedule=scheduled_capacity.schedule,
+                    min_capacity=scheduled_capacity.min_read_capacity,
+                )
+                write_scaling.scale_on_schedule(
+                    scheduled_capacity.name + "Write",
+                    schedule=scheduled_capacity.schedule,
+                    min_capacity=scheduled_capacity.min_write_capacity,
+                )
+
+    def _auto_scale_read_capacity(
+        self,
+        table: dynamodb.Table,
+        index_name: Optional[str],
+        *,
+        min_capacity: int,
+        max_capacity: int,
+    ) -> dynamodb.IScalableTableAttribute:
+        if index_name is None:
+            return table.auto_scale_read_capacity(
+                min_capacity=min_capacity, max_capacity=max_capacity
+            )
+        return table.auto_scale_global_secondary_index_read_capacity(
+            index_name, min_capacity=min_capacity, max_capacity=max_capacity
+        )
+
+    def _auto_scale_write_capacity(
+        self,
+        table: dynamodb.Table,
+        index_name: Optional[str],
+        *,
+        min_capacity: int,
+        max_capacity: int,
+    ) -> dynamodb.IScalableTableAttribute:
+        if index_name is None:
+            return table.auto_scale_write_capacity(
+                min_capacity=min_capacity, max_capacity=max_capacity
+            )
+        return table.auto_scale_global_secondary_index_write_capacity(
+            index_name, min_capacity=min_capacity, max_capacity=max_capacity
+        )
+
+    def _create_dax_cluster(self, dax_settings: DaxSettings) -> DaxCluster:
+        vpc = dax_settings.vpc or ec2.Vpc(
+            self,
+            "VPC",
+            nat_gateways=0,
+            subnet_configuration=[
+                ec2.SubnetConfiguration(
+                    name="Isolated", subnet_type=ec2.SubnetType.PRIVATE_ISOLATED
+                )
+            ],
+            gateway_endpoints={
+                "DynamoDB": ec2.GatewayVpcEndpointOptions(
+                    service=ec2.GatewayVpcEndpointAwsService.DYNAMODB
+                ),
+                # Offloaded attribute values
+                "S3": ec2.GatewayVpcEndpointOptions(
+                    service=ec2.GatewayVpcEndpointAwsService.S3
+                ),
+            },
+        )
+        subnet_type = dax_settings.subnet_type or (
+            ec2.SubnetType.PRIVATE_ISOLATED
+            if dax_settings.vpc is None
+            else ec2.SubnetType.PRIVATE_WITH_EGRESS
+        )
+        dax_role = iam.Role(
+            self,
+            "DAXRole",
+            assumed_by=iam.ServicePrincipal("dax.amazonaws.com"),
+        )
+        # Transactions through the cluster also write the email claims
+        self._grant_tables_read_write_data(dax_role)
+        dax_subnet_group = dax.CfnSubnetGroup(
+            self,
+            "DAXSubnetGroup",
+            subnet_ids=vpc.select_subnets(subnet_type=subnet_type).subnet_ids,
+        )
+        security_group = ec2.SecurityGroup(
+            self, "DAXSecurityGroup", vpc=vpc, allow_all_outbound=False
+        )
+        security_groups = [security_group, *dax_settings.security_groups]
+        cluster = dax.CfnCluster(
+            self,
+            "DAXCluster",
+            iam_role_arn=dax_role.role_arn,
+            node_type=dax_settings.node_type,
+            replication_factor=dax_settings.node_count,
+            subnet_group_name=dax_subnet_group.ref,
+            security_group_ids=[
+                security_group.security_group_id for security_group in security_groups
+            ],
+            cluster_endpoint_encryption_type="TLS",
+            sse_specification=dax.CfnCluster.SSESpecificationProperty(sse_enabled=True),
+        )
+        return DaxCluster(
+            cluster=cluster,
+            security_group=security_group,
+            vpc=vpc,
+            vpc_subnets=ec2.SubnetSelection(subnet_type=subnet_type),
+        )
+
+
+def _replication(
+    global_table_settings: Optional[GlobalTableSettings],
+) -> Dict[str, Any]:
+    # The tables keep their generated names, renaming would replace them
+    if global_table_settings is None:
+        return {}
+    return {"replication_regions": list(global_table_settings.replica_regions)}
+
+
+def _get_region(scope: Construct) -> str:
+    region = cdk.Stack.of(scope).region
+    if cdk.Token.is_unresolved(region):
+        raise ValueError("Global tables need a stack with an explicit region")
+    return region
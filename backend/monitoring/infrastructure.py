@@ -13,23 +13,261 @@
 # IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
+import dataclasses
+from typing import Dict, List, Tuple
+
+import aws_cdk as cdk
 import aws_cdk.aws_cloudwatch as cloudwatch
 from constructs import Construct
 
 from backend.api.infrastructure import API
 from backend.database.infrastructure import Database
 
+# Operations the API runtime sends to the users table
+DYNAMODB_OPERATIONS = [
+    "GetItem",
+    "PutItem",
+    "UpdateItem",
+    "DeleteItem",
+    "BatchGetItem",
+    "BatchWriteItem",
+    "Scan",
+    "Query",
+    "TransactWriteItems",
+]
+LATENCY_STATISTICS = ["p50", "p90", "p99"]
+
+
+@dataclasses.dataclass(frozen=True)
+class AlarmSettings:
+    api_p99_latency_threshold_ms: float = 1000
+    api_error_rate_threshold_percent: float = 1
+    lambda_throttles_threshold: float = 1
+    dynamodb_throttles_threshold: float = 1
+    period_seconds: int = 60
+    evaluation_periods: int = 5
+    datapoints_to_alarm: int = 3
+
 
 class Monitoring(Construct):
     def __init__(self, scope: Construct, id_: str, *, database: Database, api: API):
         super().__init__(scope, id_)
 
-        widgets = [
-            cloudwatch.SingleValueWidget(
-                metrics=[api.api_gateway_http_api.metric_count()]
+        self._database = database
+        self._api = api
+        self.dashboard = cloudwatch.Dashboard(
+            self,
+            "CloudWatchDashboard",
+            widgets=[
+                self._api_widgets(),
+                self._lambda_widgets(),
+                self._dynamodb_capacity_widgets(),
+                self._dynamodb_request_widgets(),
+            ],
+        )
+
+    def _api_widgets(self) -> List[cloudwatch.IWidget]:
+        http_api = self._api.api_gateway_http_api
+        return [
+            cloudwatch.GraphWidget(
+                title="API latency (ms)",
+                left=[
+                    http_api.metric_latency(statistic=statistic, label=statistic)
+                    for statistic in LATENCY_STATISTICS
+                ],
+            ),
+            cloudwatch.GraphWidget(
+                title="API integration latency (ms)",
+                left=[
+                    http_api.metric_integration_latency(
+                        statistic=statistic, label=statistic
+                    )
+                    for statistic in LATENCY_STATISTICS
+                ],
+            ),
+            cloudwatch.GraphWidget(
+                title="API error rates (%)",
+                left=[
+                    self._api_error_rate(http_api.metric_client_error(), "4xx"),
+                    self._api_error_rate(http_api.metric_server_error(), "5xx"),
+                ],
+                right=[http_api.metric_count(label="Requests")],
+            ),
+        ]
+
+    def _lambda_widgets(self) -> List[cloudwatch.IWidget]:
+        lambda_function = self._api.lambda_function
+        return [
+            cloudwatch.GraphWidget(
+                title="Lambda duration (ms)",
+                left=[
+                    lambda_function.metric_duration(
+                        statistic=statistic, label=statistic
+                    )
+                    for statistic in LATENCY_STATISTICS
+                ],
+            ),
+            # Init duration is only reported in the REPORT log line of cold starts
+            cloudwatch.LogQueryWidget(
+                title="Lambda cold starts",
+                log_group_names=[lambda_function.log_group.log_group_name],
+                query_lines=[
+                    "filter @type = 'REPORT' and ispresent(@initDuration)",
+                    "stats count(*) as coldStarts, pct(@initDuration, 50) as p50InitMs,"
+                    " pct(@initDuration, 99) as p99InitMs by bin(5m)",
+                ],
+                view=cloudwatch.LogQueryVisualizationType.LINE,
             ),
-            cloudwatch.SingleValueWidget(
-                metrics=[database.dynamodb_table.metric_consumed_read_capacity_units()]
+            cloudwatch.GraphWidget(
+                title="Lambda concurrency",
+                left=[
+                    lambda_function.metric(
+                        "ConcurrentExecutions",
+                        statistic="Maximum",
+                        label="Concurrent executions",
+                    )
+                ],
+                right=[
+                    self._api.lambda_alias.metric(
+                        "ProvisionedConcurrencyUtilization",
+                        statistic="Maximum",
+                        label="Provisioned concurrency utilization",
+                    )
+                ],
             ),
+            cloudwatch.GraphWidget(
+                title="Lambda throttles and errors",
+                left=[
+                    lambda_function.metric_throttles(label="Throttles"),
+                    lambda_function.metric_errors(label="Errors"),
+                ],
+            ),
+        ]
+
+    def _dynamodb_capacity_widgets(self) -> List[cloudwatch.IWidget]:
+        dynamodb_table = self._database.dynamodb_table
+        return [
+            cloudwatch.GraphWidget(
+                title=f"DynamoDB {capacity} capacity units per second",
+                left=[
+                    # Consumed capacity is a sum, per second it compares with
+                    # provisioned capacity
+                    cloudwatch.MathExpression(
+                        expression="consumed / PERIOD(consumed)",
+                        using_metrics={
+                            "consumed": dynamodb_table.metric(
+                                f"Consumed{capacity}CapacityUnits", statistic="Sum"
+                            )
+                        },
+                        label="Consumed",
+                    ),
+                    dynamodb_table.metric(
+                        f"Provisioned{capacity}CapacityUnits",
+                        statistic="Average",
+                        label="Provisioned",
+                    ),
+                ],
+            )
+            for capacity in ["Read", "Write"]
         ]
-        cloudwatch.Dashboard(self, "CloudWatchDashboard", widgets=[widgets])
+
+    def _dynamodb_request_widgets(self) -> List[cloudwatch.IWidget]:
+        return [
+            cloudwatch.GraphWidget(
+                title="DynamoDB throttled requests",
+                left=[
+                    self._dynamodb_operation_metric(
+                        "ThrottledRequests", operation, "Sum"
+                    )
+                    for operation in DYNAMODB_OPERATIONS
+                ],
+            ),
+            cloudwatch.GraphWidget(
+                title="DynamoDB successful request latency (ms)",
+                left=[
+                    self._dynamodb_operation_metric(
+                        "SuccessfulRequestLatency", operation, "Average"
+                    )
+                    for operation in DYNAMODB_OPERATIONS
+                ],
+            ),
+        ]
+
+    def add_alarms(
+        self, alarm_settings: AlarmSettings = AlarmSettings()
+    ) -> List[cloudwatch.Alarm]:
+        period = cdk.Duration.seconds(alarm_settings.period_seconds)
+        http_api = self._api.api_gateway_http_api
+        dynamodb_throttles = cloudwatch.MathExpression(
+            expression=" + ".join(
+                f"FILL(m{index}, 0)" for index in range(len(DYNAMODB_OPERATIONS))
+            ),
+            using_metrics={
+                f"m{index}": self._dynamodb_operation_metric(
+                    "ThrottledRequests", operation, "Sum"
+                )
+                for index, operation in enumerate(DYNAMODB_OPERATIONS)
+            },
+            period=period,
+        )
+        thresholds: Dict[str, Tuple[cloudwatch.IMetric, float]] = {
+            "APIP99Latency": (
+                http_api.metric_latency(statistic="p99", period=period),
+                alarm_settings.api_p99_latency_threshold_ms,
+            ),
+            "APIErrorRate": (
+                self._api_error_rate(
+                    http_api.metric_server_error(period=period), "5xx"
+                ),
+                alarm_settings.api_error_rate_threshold_percent,
+            ),
+            "LambdaThrottles": (
+                self._api.lambda_function.metric_throttles(period=period),
+                alarm_settings.lambda_throttles_threshold,
+            ),
+            "DynamoDBThrottles": (
+                dynamodb_throttles,
+                alarm_settings.dynamodb_throttles_threshold,
+            ),
+        }
+        return [
+            cloudwatch.Alarm(
+                self,
+                f"{name}Alarm",
+                metric=metric,
+                threshold=threshold,
+                comparison_operator=(
+                    cloudwatch.ComparisonOperator.GREATER_THAN_OR_EQUAL_TO_THRESHOLD
+                ),
+                evaluation_periods=alarm_settings.evaluation_periods,
+                datapoints_to_alarm=alarm_settings.datapoints_to_alarm,
+                treat_missing_data=cloudwatch.TreatMissingData.NOT_BREACHING,
+            )
+            for name, (metric, threshold) in thresholds.items()
+        ]
+
+    def _api_error_rate(
+        self, errors: cloudwatch.Metric, label: str
+    ) -> cloudwatch.MathExpression:
+        requests = self._api.api_gateway_http_api.metric_count(period=errors.period)
+        # Metric ids must be unique within a graph showing several rates
+        return cloudwatch.MathExpression(
+            expression=f"100 * errors{label} / requests{label}",
+            using_metrics={f"errors{label}": errors, f"requests{label}": requests},
+            label=label,
+            period=errors.period,
+        )
+
+    def _dynamodb_operation_metric(
+        self, metric_name: str, operation: str, statistic: str
+    ) -> cloudwatch.Metric:
+        dynamodb_table = self._database.dynamodb_table
+        return dynamodb_table.metric(
+            metric_name,
+            dimensions_map={
+                "TableName": dynamodb_table.table_name,
+                "Operation": operation,
+            },
+            statistic=statistic,
+            label=operation,
+        )
@@ -0,0 +1,85 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import dataclasses
+import json
+from typing import Mapping, Sequence
+
+import aws_cdk as cdk
+import aws_cdk.aws_lambda as lambda_
+import aws_cdk.aws_lambda_event_sources as lambda_event_sources
+from constructs import Construct
+
+from backend.api.infrastructure import build_runtime_code
+from backend.database.infrastructure import Database
+
+
+@dataclasses.dataclass(frozen=True)
+class StatsSettings:
+    # Allowlist of the values counted by attribute, e.g. country codes. The
+    # summary item holds a counter per value, limited to 400 KB, other values
+    # are counted together
+    counted_values: Mapping[str, Sequence[str]] = dataclasses.field(
+        default_factory=lambda: {"plan": ("free", "pro", "enterprise")}
+    )
+    # Stream records per transaction, at most 99
+    batch_size: int = 99
+    max_batching_window_seconds: int = 1
+    # Graviton, dependencies are bundled for the matching platform
+    architecture: lambda_.Architecture = lambda_.Architecture.ARM_64
+
+
+class Stats(Construct):
+    def __init__(
+        self,
+        scope: Construct,
+        id_: str,
+        *,
+        database: Database,
+        settings: StatsSettings = StatsSettings(),
+    ):
+        super().__init__(scope, id_)
+
+        self.lambda_function = lambda_.Function(
+            self,
+            "StreamLambdaFunction",
+            runtime=lambda_.Runtime.PYTHON_3_11,
+            architecture=settings.architecture,
+            code=build_runtime_code(self, settings.architecture),
+            handler="stats.stream_handler",
+            environment={
+                "STATS_TABLE_NAME": database.dynamodb_stats_table.table_name,
+                "STATS_COUNTED_VALUES": json.dumps(
+                    {
+                        attribute: list(values)
+                        for attribute, values in settings.counted_values.items()
+                    }
+                ),
+            },
+            timeout=cdk.Duration.seconds(30),
+        )
+        database.dynamodb_stats_table.grant_write_data(self.lambda_function)
+        # Failed batches are retried until they succeed or the records expire,
+        # records already counted are skipped
+        self.lambda_function.add_event_source(
+            lambda_event_sources.DynamoEventSource(
+                database.dynamodb_table,
+                starting_position=lambda_.StartingPosition.TRIM_HORIZON,
+                batch_size=settings.batch_size,
+                max_batching_window=cdk.Duration.seconds(
+                    settings.max_batching_window_seconds
+                ),
+            )
+        )
@@ -0,0 +1,45 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import json
+from typing import Any, Dict, Optional
+
+
+def build_event(
+    method: str,
+    path: str,
+    body: Optional[Dict[str, Any]] = None,
+    query_string_parameters: Optional[Dict[str, str]] = None,
+    headers: Optional[Dict[str, str]] = None,
+) -> Dict[str, Any]:
+    """Build an API Gateway HTTP API (payload version 2.0) proxy event."""
+    event: Dict[str, Any] = {
+        "rawPath": path,
+        "requestContext": {
+            "http": {"method": method, "path": path},
+            "stage": "$default",
+        },
+        "headers": {"content-type": "application/json"},
+    }
+    if headers is not None:
+        # HTTP APIs deliver header names in lower case
+        event["headers"].update(
+            {name.lower(): value for name, value in headers.items()}
+        )
+    if body is not None:
+        event["body"] = json.dumps(body)
+    if query_string_parameters is not None:
+        event["queryStringParameters"] = query_string_parameters
+    return event
@@ -0,0 +1,145 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Measure API Lambda function cold start in fresh Python interpreters.
+
+Each run imports lambda_function (the Lambda init phase) and handles a first
+and a second GET /users/<username> request. DynamoDB is served by a local
+HTTP stub, so no AWS account is needed. Exits with non-zero status if a
+median exceeds its threshold.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import pathlib
+import statistics
+import subprocess  # nosec
+import sys
+import threading
+from http import server
+from typing import Any, Dict, Iterator, List
+
+RUNTIME_PATH = pathlib.Path(__file__).parent.parent.joinpath(
+    "backend", "api", "runtime"
+)
+
+# Runs in a child interpreter, prints the measured phases in milliseconds
+CHILD_SOURCE = """
+import json
+import time
+
+started = time.perf_counter()
+import lambda_function
+initialized = time.perf_counter()
+
+event = {
+    "rawPath": "/users/john",
+    "requestContext": {
+        "http": {"method": "GET", "path": "/users/john"},
+        "stage": "$default",
+    },
+}
+lambda_function.lambda_handler(event, None)
+first_invoked = time.perf_counter()
+lambda_function.lambda_handler(event, None)
+warm_invoked = time.perf_counter()
+print(json.dumps({
+    "init": (initialized - started) * 1000,
+    "first_invocation": (first_invoked - initialized) * 1000,
+    "warm_invocation": (warm_invoked - first_invoked) * 1000,
+}))
+"""
+
+
+class DynamoDBStubHandler(server.BaseHTTPRequestHandler):
+    def do_POST(self) -> None:  # pylint: disable=invalid-name
+        self.rfile.read(int(self.headers["Content-Length"]))
+        body = json.dumps({"Item": {"username": {"S": "john"}}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-amz-json-1.0")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+
+@contextlib.contextmanager
+def serve_dynamodb_stub() -> Iterator[str]:
+    http_server = server.ThreadingHTTPServer(("127.0.0.1", 0), DynamoDBStubHandler)
+    thread = threading.Thread(target=http_server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{http_server.server_port}"
+    finally:
+        http_server.shutdown()
+
+
+def measure_run(endpoint_url: str) -> Dict[str, float]:
+    environment = dict(
+        os.environ,
+        PYTHONPATH=str(RUNTIME_PATH),
+        AWS_ACCESS_KEY_ID="testing",
+        AWS_SECRET_ACCESS_KEY="testing",  # nosec
+        AWS_DEFAULT_REGION="eu-west-1",
+        AWS_ENDPOINT_URL_DYNAMODB=endpoint_url,
+        DYNAMODB_TABLE_NAME="ColdStartBenchmark",
+    )
+    completed_process = subprocess.run(  # nosec
+        [sys.executable, "-c", CHILD_SOURCE],
+        env=environment,
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    measurements: Dict[str, float] = json.loads(completed_process.stdout)
+    return measurements
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-init-ms", type=float, default=1500)
+    parser.add_argument("--max-first-invocation-ms", type=float, default=500)
+    args = parser.parse_args()
+
+    with serve_dynamodb_stub() as endpoint_url:
+        runs: List[Dict[str, float]] = [
+            measure_run(endpoint_url) for _ in range(args.runs)
+        ]
+    thresholds = {
+        "init": args.max_init_ms,
+        "first_invocation": args.max_first_invocation_ms,
+    }
+    medians = {
+        phase: statistics.median(run[phase] for run in runs) for phase in runs[0]
+    }
+    for phase, median in medians.items():
+        print(f"{phase}: median {median:.1f} ms over {args.runs} runs")
+    return check_thresholds(medians, thresholds)
+
+
+def check_thresholds(medians: Dict[str, float], thresholds: Dict[str, float]) -> int:
+    exceeded = [phase for phase, limit in thresholds.items() if medians[phase] > limit]
+    for phase in exceeded:
+        print(f"{phase} median exceeds {thresholds[phase]} ms", file=sys.stderr)
+    return 1 if exceeded else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
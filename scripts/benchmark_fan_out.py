@@ -0,0 +1,122 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Benchmark multi-user operations fanned out at increasing concurrency.
+
+Runs get_users_many and update_users_many of FanOutUsersRepository against the
+in-memory database with a simulated round trip per call, and reports the best
+time per batch and the speedup over a single worker. Runs offline.
+
+Usage: python -m scripts.benchmark_fan_out --users 100 --latency-ms 10
+"""
+
+import argparse
+import importlib
+import sys
+import time
+from typing import Any, Callable, Dict, List, Sequence
+
+from scripts.benchmark_routes import RUNTIME_PATH
+
+CONCURRENCY_LEVELS = [1, 2, 4, 8, 16, 32]
+
+
+def benchmark(
+    users_count: int,
+    latency_ms: float,
+    concurrency_levels: Sequence[int],
+    repeats: int,
+) -> Dict[int, Dict[str, float]]:
+    """Return the best milliseconds per batch by concurrency and operation."""
+    sys.path.insert(0, str(RUNTIME_PATH))
+    fan_out = importlib.import_module("fan_out")
+    usernames = [f"user{index}" for index in range(users_count)]
+    database = create_database(usernames, latency_ms)
+    operations = build_operations(usernames)
+    results: Dict[int, Dict[str, float]] = {}
+    for concurrency in concurrency_levels:
+        repository = fan_out.FanOutUsersRepository(
+            database=database, max_concurrency=concurrency
+        )
+        results[concurrency] = {
+            name: min(time_ms(operation, repository) for _ in range(repeats))
+            for name, operation in operations.items()
+        }
+    return results
+
+
+def create_database(usernames: List[str], latency_ms: float) -> Any:
+    in_memory = importlib.import_module("in_memory")
+    database = in_memory.InMemoryDatabase(latency_seconds=latency_ms / 1000)
+    # A single call, however many users
+    database.batch_write_users(
+        {username: {"plan": "free"} for username in usernames}, []
+    )
+    return database
+
+
+def build_operations(usernames: List[str]) -> Dict[str, Callable[[Any], List[Any]]]:
+    users_attributes = {username: {"plan": "pro"} for username in usernames}
+    return {
+        "get_users_many": lambda repository: repository.get_users_many(usernames),
+        "update_users_many": lambda repository: repository.update_users_many(
+            users_attributes
+        ),
+    }
+
+
+def time_ms(operation: Callable[[Any], List[Any]], repository: Any) -> float:
+    started = time.perf_counter()
+    results = operation(repository)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    if any(result.error is not None for result in results):
+        raise RuntimeError("Benchmark operation failed")
+    return elapsed_ms
+
+
+def print_results(results: Dict[int, Dict[str, float]]) -> None:
+    operations = list(next(iter(results.values())))
+    print(f"{'concurrency':<12}" + "".join(f"{name:>28}" for name in operations))
+    baseline = results[min(results)]
+    for concurrency, timings in results.items():
+        columns = [
+            f"{timings[name]:>16.1f}ms{baseline[name] / timings[name]:>9.1f}x"
+            for name in operations
+        ]
+        print(f"{concurrency:<12}" + "".join(columns))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument(
+        "--latency-ms",
+        type=float,
+        default=10,
+        help="simulated database round trip per call",
+    )
+    parser.add_argument(
+        "--concurrency", type=int, nargs="+", default=CONCURRENCY_LEVELS
+    )
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    print_results(
+        benchmark(args.users, args.latency_ms, args.concurrency, args.repeats)
+    )
+
+
+if __name__ == "__main__":
+    main()
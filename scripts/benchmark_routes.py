@@ -0,0 +1,216 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Benchmark every API route in process against the in-memory database.
+
+Drives lambda_function.lambda_handler with API Gateway HTTP API events and
+reports throughput and latency percentiles per route. Runs offline. Results can
+be saved as JSON and compared with a baseline saved from another commit.
+
+Usage: python -m scripts.benchmark_routes --output results.json
+"""
+
+import argparse
+import importlib
+import json
+import os
+import pathlib
+import statistics
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from scripts.api_events import build_event
+
+RUNTIME_PATH = pathlib.Path(__file__).parent.parent.joinpath(
+    "backend", "api", "runtime"
+)
+BATCH_SIZE = 25
+LIST_LIMIT = "25"
+
+EventBuilder = Callable[[int], Dict[str, Any]]
+
+
+def build_route_events(iterations: int) -> Dict[str, EventBuilder]:
+    # Ordered so that every route finds the users created by the previous ones,
+    # at the versions the conditional requests expect. Named by method and path
+    # as the resolver keys its routes, then the variant of the request
+    return {
+        "POST /users": lambda index: build_event(
+            "POST",
+            "/users",
+            {"username": f"user{index}", "email": f"user{index}@example.com"},
+        ),
+        "GET /users/<username>": lambda index: build_event(
+            "GET", f"/users/user{index}"
+        ),
+        "GET /users/<username> If-None-Match": lambda index: build_event(
+            "GET", f"/users/user{index}", headers={"If-None-Match": '"1"'}
+        ),
+        "GET /users/<username> fields": lambda index: build_event(
+            "GET", f"/users/user{index}", query_string_parameters={"fields": "email"}
+        ),
+        "PUT /users/<username>": lambda index: build_event(
+            "PUT", f"/users/user{index}", {"country": "US", "state": "WA"}
+        ),
+        "PUT /users/<username> If-Match": lambda index: build_event(
+            "PUT", f"/users/user{index}", {"state": "OR"}, headers={"If-Match": '"2"'}
+        ),
+        "PATCH /users/<username>": lambda index: build_event(
+            "PATCH", f"/users/user{index}", {"add": {"logins": 1}}
+        ),
+        "PATCH /users/<username> If-Match": lambda index: build_event(
+            "PATCH",
+            f"/users/user{index}",
+            {"set": {"plan": "pro"}, "add": {"tags": ["benchmark"]}},
+            headers={"If-Match": '"4"'},
+        ),
+        "GET /users": lambda index: build_event(
+            "GET", "/users", query_string_parameters={"limit": LIST_LIMIT}
+        ),
+        "GET /users email": lambda index: build_event(
+            "GET",
+            "/users",
+            query_string_parameters={"email": f"user{index}@example.com"},
+        ),
+        "GET /stats/users": lambda index: build_event("GET", "/stats/users"),
+        "POST /users:batchGet": lambda index: build_event(
+            "POST",
+            "/users:batchGet",
+            {
+                "usernames": [
+                    f"user{(index * BATCH_SIZE + offset) % iterations}"
+                    for offset in range(BATCH_SIZE)
+                ]
+            },
+        ),
+        "POST /users:batchWrite": lambda index: build_event(
+            "POST",
+            "/users:batchWrite",
+            {
+                "put": [
+                    {"username": f"batch{index}-{offset}"}
+                    for offset in range(BATCH_SIZE)
+                ]
+            },
+        ),
+        # Fanned out to concurrent updates of the users
+        "POST /users:batchUpdate": lambda index: build_event(
+            "POST",
+            "/users:batchUpdate",
+            {
+                "users": [
+                    {"username": f"batch{index}-{offset}", "country": "US"}
+                    for offset in range(BATCH_SIZE)
+                ]
+            },
+        ),
+        "DELETE /users/<username>": lambda index: build_event(
+            "DELETE", f"/users/batch{index}-0"
+        ),
+        "DELETE /users/<username> If-Match": lambda index: build_event(
+            "DELETE", f"/users/user{index}", headers={"If-Match": '"5"'}
+        ),
+    }
+
+
+def benchmark_route(
+    handler: Callable[[Dict[str, Any], object], Dict[str, Any]],
+    build: EventBuilder,
+    iterations: int,
+) -> Dict[str, float]:
+    events = [build(index) for index in range(iterations)]
+    latencies_ms: List[float] = []
+    failed_requests = 0
+    started = time.perf_counter()
+    for event in events:
+        request_started = time.perf_counter()
+        response = handler(event, None)
+        latencies_ms.append((time.perf_counter() - request_started) * 1000)
+        failed_requests += response["statusCode"] >= 400
+    elapsed_seconds = time.perf_counter() - started
+    return summarize(latencies_ms, elapsed_seconds, failed_requests)
+
+
+def summarize(
+    latencies_ms: List[float], elapsed_seconds: float, failed_requests: int
+) -> Dict[str, float]:
+    percentiles = statistics.quantiles(latencies_ms, n=100, method="inclusive")
+    return {
+        "requests": len(latencies_ms),
+        "failed_requests": failed_requests,
+        "throughput_rps": len(latencies_ms) / elapsed_seconds,
+        "p50_ms": percentiles[49],
+        "p95_ms": percentiles[94],
+        "p99_ms": percentiles[98],
+    }
+
+
+def print_results(
+    results: Dict[str, Dict[str, float]],
+    baseline: Optional[Dict[str, Dict[str, float]]],
+) -> None:
+    print(
+        f"{'route':<36}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+        f"{'failed':>8}"
+    )
+    for route, result in results.items():
+        print(
+            f"{route:<36}{result['throughput_rps']:>10.0f}{result['p50_ms']:>10.3f}"
+            f"{result['p95_ms']:>10.3f}{result['p99_ms']:>10.3f}"
+            f"{result['failed_requests']:>8.0f}"
+        )
+        if baseline is not None and route in baseline:
+            p99_change = result["p99_ms"] / baseline[route]["p99_ms"] - 1
+            print(f"{'':<36}p99 {p99_change:+.1%} compared to baseline")
+
+
+def load_handler(latency_ms: float) -> Callable[[Dict[str, Any], object], Any]:
+    os.environ["USERS_DATABASE"] = "in_memory"
+    os.environ["IN_MEMORY_DATABASE_LATENCY"] = str(latency_ms / 1000)
+    sys.path.insert(0, str(RUNTIME_PATH))
+    lambda_function = importlib.import_module("lambda_function")
+    handler: Callable[[Dict[str, Any], object], Any] = lambda_function.lambda_handler
+    return handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument(
+        "--latency-ms",
+        type=float,
+        default=0,
+        help="simulated database round trip per call",
+    )
+    parser.add_argument("--output", type=pathlib.Path, help="save results as JSON")
+    parser.add_argument("--baseline", type=pathlib.Path, help="compare with JSON")
+    args = parser.parse_args()
+
+    handler = load_handler(args.latency_ms)
+    results = {
+        route: benchmark_route(handler, build, args.iterations)
+        for route, build in build_route_events(args.iterations).items()
+    }
+    baseline = None
+    if args.baseline is not None:
+        baseline = json.loads(args.baseline.read_text(encoding="utf_8"))
+    print_results(results, baseline)
+    if args.output is not None:
+        args.output.write_text(json.dumps(results, indent=2), encoding="utf_8")
+
+
+if __name__ == "__main__":
+    main()
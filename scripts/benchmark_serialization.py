@@ -0,0 +1,101 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Benchmark JSON encoding of responses and decoding of request bodies.
+
+Compares the json and orjson serializers of the Lambda function on user
+payloads as returned by DynamoDB, with Decimal numbers and string sets, and
+reports the mean time per call. Runs offline.
+
+Usage: python -m scripts.benchmark_serialization --iterations 2000
+"""
+
+import argparse
+import decimal
+import timeit
+from typing import Any, Dict
+
+from backend.api.runtime import serialization
+
+SERIALIZERS = {
+    "json": serialization.StandardJsonSerializer(),
+    "orjson": serialization.OrjsonSerializer(),
+}
+
+
+def build_user(index: int) -> Dict[str, Any]:
+    return {
+        "username": f"user{index}",
+        "email": f"user{index}@example.com",
+        "country": "US",
+        "state": "WA",
+        "version": decimal.Decimal(index % 7 + 1),
+        "score": decimal.Decimal(f"{index}.25"),
+        "tags": {"beta", "newsletter", f"cohort{index % 10}"},
+        "address": {"street": f"{index} Main St", "zip": decimal.Decimal(98101)},
+    }
+
+
+def build_payloads() -> Dict[str, Any]:
+    return {
+        "user": build_user(0),
+        "users page (25)": {
+            "users": [build_user(index) for index in range(25)],
+            "cursor": "eyJ1c2VybmFtZSI6ICJ1c2VyMjQifQ==",
+        },
+        "batch get (100)": {
+            "results": [
+                {
+                    "username": f"user{index}",
+                    "status": "found",
+                    "user": build_user(index),
+                }
+                for index in range(100)
+            ]
+        },
+    }
+
+
+def benchmark(iterations: int) -> Dict[str, Dict[str, float]]:
+    """Return the mean microseconds per call by serializer, for every payload
+    and operation."""
+    results: Dict[str, Dict[str, float]] = {}
+    for payload_name, payload in build_payloads().items():
+        document = SERIALIZERS["json"].dumps(payload)
+        for serializer_name, serializer in SERIALIZERS.items():
+            calls = {
+                "encode": lambda s=serializer, p=payload: s.dumps(p),
+                "decode": lambda s=serializer, d=document: s.loads(d),
+            }
+            for operation, call in calls.items():
+                mean_us = timeit.timeit(call, number=iterations) / iterations * 1e6
+                results.setdefault(f"{payload_name} {operation}", {})[
+                    serializer_name
+                ] = mean_us
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'payload':<24}" + "".join(f"{name:>12}" for name in SERIALIZERS))
+    for name, means in benchmark(args.iterations).items():
+        print(f"{name:<24}" + "".join(f"{mean:>10.1f}us" for mean in means.values()))
+
+
+if __name__ == "__main__":
+    main()
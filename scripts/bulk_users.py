@@ -0,0 +1,432 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Import users into the users table from CSV or JSONL, export them to JSONL.
+
+Imports stream the input, so files of millions of users never sit in memory.
+Batch writes of 25 users run in parallel workers, throttled by a token bucket
+to a write capacity unit budget that leaves headroom for the API. Progress is
+checkpointed, an interrupted import resumes where it stopped. Exports use a
+parallel segmented scan. As with the batch write route, each user is read and
+put at the next version on the condition it did not change meanwhile. With
+--email-table-name, the put is a transaction that also claims the email, at
+several times the write capacity units. Large values are compressed and offloaded to the attributes
+bucket as the API does, and exports read them back.
+
+Set AWS_ENDPOINT_URL_DYNAMODB to target DynamoDB local or another stand-in.
+
+Usage:
+    python -m scripts.bulk_users import --table-name Users --input users.csv \
+        --email-table-name Emails --attributes-bucket-name attributes \
+        --write-capacity-units 100 --checkpoint users.checkpoint
+    python -m scripts.bulk_users export --table-name Users \
+        --attributes-bucket-name attributes --output users.jsonl
+"""
+
+import argparse
+import csv
+import dataclasses
+import decimal
+import importlib
+import itertools
+import json
+import math
+import os
+import pathlib
+import sys
+import time
+from concurrent import futures
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Protocol,
+    Sequence,
+    TextIO,
+    Tuple,
+)
+
+RUNTIME_PATH = pathlib.Path(__file__).parent.parent.joinpath(
+    "backend", "api", "runtime"
+)
+# As the API compresses attributes by default
+COMPRESSION_THRESHOLD_BYTES = 4096
+# Users per batch write
+CHUNK_SIZE = 25
+# Chunks submitted ahead of the workers, bounding memory use
+CHUNKS_IN_FLIGHT_PER_WORKER = 2
+WRITE_CAPACITY_UNIT_BYTES = 1024
+
+
+class UsersDatabase(Protocol):
+    # The subset of users.DatabaseInterface the tool relies on
+    def batch_write_users(
+        self,
+        users_to_put: Dict[str, Dict[str, Any]],
+        usernames_to_delete: Sequence[str],
+    ) -> List[Any]:
+        ...
+
+    def iter_users(self, total_segments: int = 1) -> Iterator[Dict[str, Any]]:
+        ...
+
+
+class UnwrittenUsersError(Exception):
+    def __init__(self, statuses: Dict[str, str]):
+        username, status = next(iter(statuses.items()))
+        super().__init__(
+            f"{len(statuses)} users were not written, e.g. {username} ({status})"
+        )
+        self.statuses = statuses
+
+    @property
+    def unprocessed(self) -> bool:
+        # Unprocessed after retries, the table lacks capacity for more chunks
+        return "unprocessed" in self.statuses.values()
+
+
+class BulkImportError(Exception):
+    def __init__(self, imported_records: int, failed_usernames: List[str]):
+        super().__init__(
+            f"Import stopped after {imported_records} records, "
+            f"{len(failed_usernames)} users known not written"
+        )
+        self.imported_records = imported_records
+        self.failed_usernames = failed_usernames
+
+
+class TokenBucket:
+    """Admits up to rate tokens per second, with bursts up to capacity.
+
+    Not thread-safe, a single thread acquires tokens ahead of submitting work.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        *,
+        capacity: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self._rate = rate
+        self._capacity = capacity or rate
+        self._tokens = self._capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+
+    def available(self) -> float:
+        self._refill()
+        return self._tokens
+
+    def acquire(self, tokens: float) -> None:
+        # Acquisitions above capacity wait for a full bucket and go into debt
+        required_tokens = min(tokens, self._capacity)
+        self._refill()
+        while self._tokens < required_tokens:
+            self._sleep((required_tokens - self._tokens) / self._rate)
+            self._refill()
+        self._tokens -= tokens
+
+    def _refill(self) -> None:
+        now = self._clock()
+        elapsed_seconds = now - self._updated
+        self._tokens = min(self._capacity, self._tokens + elapsed_seconds * self._rate)
+        self._updated = now
+
+
+@dataclasses.dataclass
+class Checkpoint:
+    """Number of input records imported, saved atomically after each advance."""
+
+    path: pathlib.Path
+
+    def load(self) -> int:
+        if not self.path.exists():
+            return 0
+        return int(json.loads(self.path.read_text(encoding="utf_8"))["records"])
+
+    def save(self, records: int) -> None:
+        temporary_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        temporary_path.write_text(json.dumps({"records": records}), encoding="utf_8")
+        os.replace(temporary_path, self.path)
+
+
+class _ImportRun:
+    """Chunks written by the executor and the records imported so far.
+
+    Chunks complete out of order, the imported records only move past a chunk
+    once every chunk before it was written in full. A chunk with conflicting
+    users never completes, so a resumed import starts again from it.
+    """
+
+    def __init__(self, checkpoint: Optional[Checkpoint]):
+        self.records = checkpoint.load() if checkpoint is not None else 0
+        self.stopped = False
+        self.failed_usernames: List[str] = []
+        self._checkpoint = checkpoint
+        # Maps futures to their chunk index and number of records
+        self._pending: Dict["futures.Future[None]", Tuple[int, int]] = {}
+        self._completed: Dict[int, int] = {}
+        self._next_chunk = 0
+
+    def track(
+        self, future: "futures.Future[None]", chunk_index: int, chunk_records: int
+    ) -> None:
+        self._pending[future] = (chunk_index, chunk_records)
+
+    def wait_below(self, max_in_flight: int) -> None:
+        while len(self._pending) >= max_in_flight:
+            self.collect()
+
+    def collect(self) -> None:
+        done, _ = futures.wait(self._pending, return_when=futures.FIRST_COMPLETED)
+        for future in done:
+            chunk_index, chunk_records = self._pending.pop(future)
+            exception = future.exception()
+            if exception is None:
+                self._completed[chunk_index] = chunk_records
+                continue
+            print(f"Chunk {chunk_index} failed: {exception}", file=sys.stderr)
+            if isinstance(exception, UnwrittenUsersError):
+                self.failed_usernames.extend(exception.statuses)
+                # Conflicts are specific to their users, later chunks go on
+                self.stopped = self.stopped or exception.unprocessed
+            else:
+                self.stopped = True
+        self._advance()
+
+    @property
+    def failed(self) -> bool:
+        return self.stopped or bool(self.failed_usernames)
+
+    def drain(self) -> None:
+        while self._pending:
+            self.collect()
+
+    def _advance(self) -> None:
+        records = self.records
+        while self._next_chunk in self._completed:
+            self.records += self._completed.pop(self._next_chunk)
+            self._next_chunk += 1
+        if self.records != records and self._checkpoint is not None:
+            self._checkpoint.save(self.records)
+
+
+def read_records(input_file: TextIO, input_format: str) -> Iterator[Dict[str, Any]]:
+    if input_format == "csv":
+        return _read_csv(input_file)
+    return _read_jsonl(input_file)
+
+
+def estimate_write_capacity_units(record: Dict[str, Any]) -> int:
+    # Close to the DynamoDB item size, names and values in their JSON form
+    size_bytes = len(json.dumps(record, default=_to_json).encode())
+    return max(1, math.ceil(size_bytes / WRITE_CAPACITY_UNIT_BYTES))
+
+
+def import_users(
+    database: UsersDatabase,
+    records: Iterable[Dict[str, Any]],
+    *,
+    token_bucket: TokenBucket,
+    workers: int = 4,
+    checkpoint: Optional[Checkpoint] = None,
+) -> int:
+    """Write the records and return the number of records imported in total.
+
+    Raises BulkImportError once every chunk submitted completed, if any user
+    was not written. Users that conflict, such as those claiming an email
+    another user holds, do not stop the import.
+    """
+    run = _ImportRun(checkpoint)
+    with futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        chunks = _chunks(itertools.islice(records, run.records, None))
+        for chunk_index, chunk in enumerate(chunks):
+            run.wait_below(workers * CHUNKS_IN_FLIGHT_PER_WORKER)
+            if run.stopped:
+                break
+            token_bucket.acquire(sum(map(estimate_write_capacity_units, chunk)))
+            future = executor.submit(_write_chunk, database, chunk)
+            run.track(future, chunk_index, len(chunk))
+        run.drain()
+    if run.failed:
+        raise BulkImportError(run.records, run.failed_usernames)
+    return run.records
+
+
+def export_users(
+    database: UsersDatabase, output_file: TextIO, *, total_segments: int = 1
+) -> int:
+    """Write every user as a JSONL line and return the number of users."""
+    exported_users = 0
+    for user in database.iter_users(total_segments):
+        output_file.write(json.dumps(user, default=_to_json, separators=(",", ":")))
+        output_file.write("\n")
+        exported_users += 1
+    return exported_users
+
+
+def _read_csv(input_file: TextIO) -> Iterator[Dict[str, Any]]:
+    # Empty cells are missing attributes, DynamoDB rejects empty index keys
+    for row in csv.DictReader(input_file):
+        yield {name: value for name, value in row.items() if value}
+
+
+def _read_jsonl(input_file: TextIO) -> Iterator[Dict[str, Any]]:
+    # DynamoDB numbers are decimals, floats would lose precision
+    lines = (line for line in input_file if line.strip())
+    return (json.loads(line, parse_float=decimal.Decimal) for line in lines)
+
+
+def _chunks(records: Iterable[Dict[str, Any]]) -> Iterator[List[Dict[str, Any]]]:
+    iterator = iter(records)
+    while chunk := list(itertools.islice(iterator, CHUNK_SIZE)):
+        yield chunk
+
+
+def _write_chunk(database: UsersDatabase, chunk: List[Dict[str, Any]]) -> None:
+    results = database.batch_write_users(_users_to_put(chunk), [])
+    # Still unprocessed after the retries with backoff of the database, or
+    # conflicting with the users already stored
+    statuses = {
+        result.username: result.status.value
+        for result in results
+        if result.status != "put"
+    }
+    if statuses:
+        raise UnwrittenUsersError(statuses)
+
+
+def _users_to_put(chunk: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    # Later records of the same user win, a batch writes each key once
+    return {
+        str(record["username"]): {
+            name: value for name, value in record.items() if name != "username"
+        }
+        for record in chunk
+    }
+
+
+def _to_json(value: Any) -> Any:
+    if isinstance(value, decimal.Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def load_database(
+    table_name: str,
+    email_table_name: Optional[str] = None,
+    attributes_bucket_name: Optional[str] = None,
+    compression_threshold_bytes: int = COMPRESSION_THRESHOLD_BYTES,
+) -> UsersDatabase:
+    sys.path.insert(0, str(RUNTIME_PATH))
+    users = importlib.import_module("users")
+    helpers = importlib.import_module("helpers")
+    # Without the claims table, imported emails are not checked for uniqueness
+    database: UsersDatabase = users.DynamoDBDatabase(
+        table_name,
+        email_index=users.EmailIndex(claims_table_name=email_table_name),
+        large_attribute_store=helpers.create_large_attributes(
+            compression_threshold_bytes=compression_threshold_bytes,
+            bucket_name=attributes_bucket_name,
+        ),
+    )
+    return database
+
+
+def _import_file(database: UsersDatabase, args: argparse.Namespace) -> None:
+    input_format = args.format or args.input.suffix.lstrip(".")
+    with args.input.open(encoding="utf_8", newline="") as input_file:
+        try:
+            imported_records = import_users(
+                database,
+                read_records(input_file, input_format),
+                token_bucket=TokenBucket(args.write_capacity_units),
+                workers=args.workers,
+                checkpoint=Checkpoint(args.checkpoint) if args.checkpoint else None,
+            )
+        except BulkImportError as error:
+            for username in error.failed_usernames:
+                print(f"Not written: {username}", file=sys.stderr)
+            # Exits with status 1, the checkpoint is before the unwritten users
+            sys.exit(str(error))
+    print(f"Imported {imported_records} records")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    table_parser = argparse.ArgumentParser(add_help=False)
+    table_parser.add_argument("--table-name", required=True)
+    table_parser.add_argument("--email-table-name", help="table claiming emails")
+    table_parser.add_argument(
+        "--attributes-bucket-name", help="bucket of the offloaded attributes"
+    )
+    table_parser.add_argument(
+        "--compression-threshold",
+        type=int,
+        default=COMPRESSION_THRESHOLD_BYTES,
+        help="bytes from which values are compressed, 0 to write them as is",
+    )
+    import_parser = subparsers.add_parser(
+        "import", parents=[table_parser], help="import users"
+    )
+    import_parser.add_argument("--input", type=pathlib.Path, required=True)
+    import_parser.add_argument(
+        "--format", choices=["csv", "jsonl"], help="defaults to the input suffix"
+    )
+    import_parser.add_argument(
+        "--write-capacity-units",
+        type=float,
+        required=True,
+        help="write capacity units per second to consume at most",
+    )
+    import_parser.add_argument("--workers", type=int, default=4)
+    import_parser.add_argument("--checkpoint", type=pathlib.Path)
+    export_parser = subparsers.add_parser(
+        "export", parents=[table_parser], help="export users"
+    )
+    export_parser.add_argument("--output", type=pathlib.Path, required=True)
+    export_parser.add_argument("--segments", type=int, default=4)
+    args = parser.parse_args()
+
+    database = load_database(
+        args.table_name,
+        args.email_table_name,
+        args.attributes_bucket_name,
+        args.compression_threshold,
+    )
+    if args.command == "import":
+        _import_file(database, args)
+    else:
+        with args.output.open("w", encoding="utf_8") as output_file:
+            exported_users = export_users(
+                database, output_file, total_segments=args.segments
+            )
+        print(f"Exported {exported_users} users")
+
+
+if __name__ == "__main__":
+    main()
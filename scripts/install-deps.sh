@@ -22,4 +22,5 @@ set -o verbose
 npm install
 
 # Install project dependencies
-pip install -r backend/api/runtime/requirements.txt -r requirements.txt -r requirements-dev.txt
+pip install -r backend/api/runtime/requirements.txt -r backend/api/runtime/requirements-dax.txt \
+  -r requirements.txt -r requirements-dev.txt
@@ -0,0 +1,233 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Generate load against the users API and check latency and error thresholds.
+
+Virtual users loop over creating, reading, updating and deleting users of
+their own until the duration elapses. Runs against a deployed API endpoint or,
+with --local, the in-process handler and the in-memory database. Prints p50,
+p99 and the error rate per operation and exits with status 1 when the totals
+exceed their thresholds.
+
+Usage: python -m scripts.load_test --endpoint https://... --duration 60
+"""
+
+import argparse
+import dataclasses
+import json
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent import futures
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from scripts.api_events import build_event
+from scripts.benchmark_routes import load_handler
+from scripts.benchmark_routes import summarize
+
+# Sends a request and returns the status code, 0 when no response arrived
+Send = Callable[[str, str, Optional[Dict[str, Any]]], int]
+# Operation name, method, path and body
+Request = Tuple[str, str, str, Optional[Dict[str, Any]]]
+
+
+@dataclasses.dataclass(frozen=True)
+class Sample:
+    operation: str
+    latency_ms: float
+    failed: bool
+
+
+@dataclasses.dataclass(frozen=True)
+class Thresholds:
+    max_p50_ms: float
+    max_p99_ms: float
+    max_error_rate: float
+
+    def check(self, total: Dict[str, float]) -> List[str]:
+        violations = []
+        error_rate = total["failed_requests"] / total["requests"]
+        if total["p50_ms"] > self.max_p50_ms:
+            violations.append(f"p50 {total['p50_ms']:.1f} ms > {self.max_p50_ms} ms")
+        if total["p99_ms"] > self.max_p99_ms:
+            violations.append(f"p99 {total['p99_ms']:.1f} ms > {self.max_p99_ms} ms")
+        if error_rate > self.max_error_rate:
+            violations.append(
+                f"error rate {error_rate:.2%} > {self.max_error_rate:.2%}"
+            )
+        return violations
+
+
+def build_scenario(username: str) -> List[Request]:
+    return [
+        (
+            "POST /users",
+            "POST",
+            "/users",
+            {"username": username, "email": f"{username}@example.com"},
+        ),
+        ("GET /users/<username>", "GET", f"/users/{username}", None),
+        (
+            "PUT /users/<username>",
+            "PUT",
+            f"/users/{username}",
+            {"country": "US", "state": "WA"},
+        ),
+        ("DELETE /users/<username>", "DELETE", f"/users/{username}", None),
+    ]
+
+
+def run_virtual_user(send: Send, user_prefix: str, deadline: float) -> List[Sample]:
+    samples = []
+    iteration = 0
+    while time.monotonic() < deadline:
+        for operation, method, path, body in build_scenario(
+            f"{user_prefix}-{iteration}"
+        ):
+            started = time.perf_counter()
+            status_code = send(method, path, body)
+            latency_ms = (time.perf_counter() - started) * 1000
+            samples.append(Sample(operation, latency_ms, not 200 <= status_code < 400))
+        iteration += 1
+    return samples
+
+
+def run_load_test(
+    send: Send, *, concurrency: int, duration_seconds: float
+) -> Dict[str, Dict[str, float]]:
+    """Return the summary of every operation and of all of them as "total"."""
+    # Unique per run, runs never collide on usernames or emails
+    run_id = uuid.uuid4().hex[:8]
+    started = time.monotonic()
+    deadline = started + duration_seconds
+    with futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        running = [
+            executor.submit(run_virtual_user, send, f"load-{run_id}-{user}", deadline)
+            for user in range(concurrency)
+        ]
+        samples = [sample for future in running for sample in future.result()]
+    return summarize_samples(samples, time.monotonic() - started)
+
+
+def summarize_samples(
+    samples: List[Sample], elapsed_seconds: float
+) -> Dict[str, Dict[str, float]]:
+    samples_by_operation: Dict[str, List[Sample]] = {"total": samples}
+    for sample in samples:
+        samples_by_operation.setdefault(sample.operation, []).append(sample)
+    return {
+        operation: summarize(
+            [sample.latency_ms for sample in operation_samples],
+            elapsed_seconds,
+            sum(sample.failed for sample in operation_samples),
+        )
+        for operation, operation_samples in samples_by_operation.items()
+    }
+
+
+def http_sender(endpoint: str, timeout_seconds: float) -> Send:
+    if not endpoint.startswith("https://"):
+        raise ValueError(f"Endpoint {endpoint} is not an HTTPS URL")
+
+    def send(method: str, path: str, body: Optional[Dict[str, Any]]) -> int:
+        request = urllib.request.Request(
+            endpoint.rstrip("/") + path,
+            data=None if body is None else json.dumps(body).encode(),
+            headers={"Content-Type": "application/json"},
+            method=method,
+        )
+        try:
+            with urllib.request.urlopen(  # nosec
+                request, timeout=timeout_seconds
+            ) as response:
+                response.read()
+                return int(response.status)
+        except urllib.error.HTTPError as error:
+            return error.code
+        except OSError:
+            return 0
+
+    return send
+
+
+def local_sender(latency_ms: float) -> Send:
+    handler = load_handler(latency_ms)
+    # The resolver keeps the current event on the app, one request at a time
+    lock = threading.Lock()
+
+    def send(method: str, path: str, body: Optional[Dict[str, Any]]) -> int:
+        with lock:
+            return int(handler(build_event(method, path, body), None)["statusCode"])
+
+    return send
+
+
+def print_results(results: Dict[str, Dict[str, float]]) -> None:
+    print(
+        f"{'operation':<26}{'requests':>10}{'errors':>8}{'rps':>8}"
+        f"{'p50 ms':>10}{'p99 ms':>10}"
+    )
+    for operation, result in results.items():
+        print(
+            f"{operation:<26}{result['requests']:>10.0f}"
+            f"{result['failed_requests']:>8.0f}{result['throughput_rps']:>8.0f}"
+            f"{result['p50_ms']:>10.1f}{result['p99_ms']:>10.1f}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--endpoint", help="API endpoint URL")
+    target.add_argument(
+        "--local", action="store_true", help="in-process handler, in-memory database"
+    )
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=60, help="seconds")
+    parser.add_argument("--timeout", type=float, default=10, help="seconds")
+    parser.add_argument(
+        "--latency-ms",
+        type=float,
+        default=0,
+        help="simulated database round trip per call with --local",
+    )
+    parser.add_argument("--max-p50-ms", type=float, default=float("inf"))
+    parser.add_argument("--max-p99-ms", type=float, default=float("inf"))
+    parser.add_argument("--max-error-rate", type=float, default=1.0)
+    args = parser.parse_args()
+
+    send = (
+        local_sender(args.latency_ms)
+        if args.local
+        else http_sender(args.endpoint, args.timeout)
+    )
+    results = run_load_test(
+        send, concurrency=args.concurrency, duration_seconds=args.duration
+    )
+    print_results(results)
+    violations = Thresholds(
+        args.max_p50_ms, args.max_p99_ms, args.max_error_rate
+    ).check(results["total"])
+    for violation in violations:
+        print(f"Threshold exceeded: {violation}", file=sys.stderr)
+    if violations:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -18,7 +18,7 @@
 set -o errexit
 set -o verbose
 
-targets=(backend tests app.py constants.py toolchain.py)
+targets=(backend scripts tests app.py constants.py toolchain.py)
 
 # Find common security issues (https://bandit.readthedocs.io)
 bandit --recursive "${targets[@]}"
@@ -42,6 +42,7 @@ pylint --rcfile .pylintrc "${targets[@]}"
 # Check dependencies for security issues (https://pyup.io/safety)
 safety check \
   -r backend/api/runtime/requirements.txt \
+  -r backend/api/runtime/requirements-dax.txt \
   -r requirements.txt \
   -r requirements-dev.txt
 
@@ -54,3 +55,6 @@ xenon --max-absolute A --max-modules A --max-average A "${targets[@]}"
 # Run tests and measure code coverage (https://coverage.readthedocs.io)
 PYTHONPATH="${PWD}/backend/api/runtime" \
   coverage run --source "${PWD}" --omit ".venv/*,tests/*" -m unittest discover -v -s tests
+
+# Measure API Lambda function init and first invocation latency, fail on regressions
+python -m scripts.benchmark_cold_start
@@ -0,0 +1,151 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import pathlib
+import shutil
+import subprocess  # nosec
+import tempfile
+import unittest
+from typing import Any, List
+from unittest import mock
+
+import aws_cdk as cdk
+import aws_cdk.aws_lambda as lambda_
+from aws_cdk import assertions
+
+from backend.api import bundling
+from backend.api.infrastructure import build_runtime_code
+
+RUNTIME_PATH = pathlib.Path(bundling.__file__).parent.joinpath("runtime")
+RUNTIME_SOURCES = bundling.RuntimeSources(RUNTIME_PATH)
+
+
+def fake_pip(returncode: int = 0) -> mock.Mock:
+    def install(command: List[str], **_: Any) -> subprocess.CompletedProcess[bytes]:
+        target = pathlib.Path(command[command.index("--target") + 1])
+        target.joinpath("boto3").mkdir(parents=True)
+        return subprocess.CompletedProcess(command, returncode)
+
+    return mock.Mock(side_effect=install)
+
+
+class BundlingTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.cache_directory = pathlib.Path(directory, "cache")
+        self.output_directory = pathlib.Path(directory, "output")
+        self.asset_hash = bundling.compute_asset_hash(
+            RUNTIME_SOURCES,
+            runtime=lambda_.Runtime.PYTHON_3_11,
+            architecture=lambda_.Architecture.ARM_64,
+        )
+
+    def _try_bundle(self, pip: mock.Mock, output_directory: pathlib.Path) -> bool:
+        local_bundling = bundling.LocalBundling(
+            RUNTIME_SOURCES,
+            runtime=lambda_.Runtime.PYTHON_3_11,
+            architecture=lambda_.Architecture.ARM_64,
+            cached_bundle_path=self.cache_directory.joinpath(self.asset_hash),
+        )
+        with mock.patch("backend.api.bundling.subprocess.run", pip):
+            return local_bundling.try_bundle(str(output_directory))
+
+    def test_asset_hash_depends_on_architecture(self) -> None:
+        self.assertNotEqual(
+            self.asset_hash,
+            bundling.compute_asset_hash(
+                RUNTIME_SOURCES,
+                runtime=lambda_.Runtime.PYTHON_3_11,
+                architecture=lambda_.Architecture.X86_64,
+            ),
+        )
+
+    def test_local_bundling_populates_cache(self) -> None:
+        pip = fake_pip()
+        self.assertTrue(self._try_bundle(pip, self.output_directory))
+        self.assertIn("manylinux2014_aarch64", pip.call_args.args[0])
+        for path in [self.output_directory, self.cache_directory / self.asset_hash]:
+            self.assertTrue(path.joinpath("lambda_function.py").is_file())
+            self.assertTrue(path.joinpath("boto3").is_dir())
+            self.assertFalse(path.joinpath("__pycache__").exists())
+
+        # Later bundles of the same sources are copied from the cache
+        cached_output_directory = self.output_directory.with_name("cached")
+        self.assertTrue(self._try_bundle(pip, cached_output_directory))
+        pip.assert_called_once()
+        self.assertTrue(cached_output_directory.joinpath("boto3").is_dir())
+
+    def test_local_bundling_installs_dax_requirements(self) -> None:
+        sources = bundling.RuntimeSources(
+            RUNTIME_PATH,
+            [bundling.REQUIREMENTS_FILE_NAME, bundling.DAX_REQUIREMENTS_FILE_NAME],
+        )
+        local_bundling = bundling.LocalBundling(
+            sources,
+            runtime=lambda_.Runtime.PYTHON_3_11,
+            architecture=lambda_.Architecture.ARM_64,
+            cached_bundle_path=None,
+        )
+        pip = fake_pip()
+        with mock.patch("backend.api.bundling.subprocess.run", pip):
+            self.assertTrue(local_bundling.try_bundle(str(self.output_directory)))
+        command = pip.call_args.args[0]
+        self.assertIn(str(RUNTIME_PATH / bundling.DAX_REQUIREMENTS_FILE_NAME), command)
+        # Bundles with and without the DAX client are cached apart
+        self.assertNotEqual(
+            self.asset_hash,
+            bundling.compute_asset_hash(
+                sources,
+                runtime=lambda_.Runtime.PYTHON_3_11,
+                architecture=lambda_.Architecture.ARM_64,
+            ),
+        )
+
+    def test_failed_pip_falls_back_to_docker(self) -> None:
+        self.assertFalse(
+            self._try_bundle(fake_pip(returncode=1), self.output_directory)
+        )
+        self.assertFalse(self.cache_directory.exists())
+
+    def test_synth_reuses_cached_bundle(self) -> None:
+        cached_bundle = self.cache_directory.joinpath(self.asset_hash)
+        cached_bundle.mkdir(parents=True)
+        cached_bundle.joinpath("lambda_function.py").touch()
+        # Bundling in Docker would fail without it, synth succeeds from the cache
+        app = cdk.App(context={"bundlingCacheDirectory": str(self.cache_directory)})
+        stack = cdk.Stack(app, "Stack")
+        lambda_.Function(
+            stack,
+            "Function",
+            runtime=lambda_.Runtime.PYTHON_3_11,
+            architecture=lambda_.Architecture.ARM_64,
+            code=build_runtime_code(stack, lambda_.Architecture.ARM_64),
+            handler="lambda_function.lambda_handler",
+        )
+        assertions.Template.from_stack(stack).has_resource_properties(
+            "AWS::Lambda::Function",
+            {
+                "Code": {
+                    "S3Bucket": assertions.Match.any_value(),
+                    "S3Key": assertions.Match.any_value(),
+                },
+                "Handler": "lambda_function.lambda_handler",
+            },
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
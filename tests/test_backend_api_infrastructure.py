@@ -13,6 +13,7 @@
 # IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
+import shutil
 import unittest
 
 import aws_cdk as cdk
@@ -20,22 +21,28 @@ import aws_cdk.aws_dynamodb as dynamodb
 from aws_cdk import assertions
 
 from backend.api.infrastructure import API
+from backend.api.infrastructure import APISettings
 from backend.database.infrastructure import Database
+from backend.database.infrastructure import DatabaseSettings
 
 
 class APITestCase(unittest.TestCase):
+    # Bundles for real, in Docker when pip on the host cannot
+    @unittest.skipUnless(shutil.which("docker"), "Docker is not available")
     def test_lambda_function_bundling(self) -> None:
         stack = cdk.Stack()
         database = Database(
             stack,
             "Database",
-            dynamodb_billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            settings=DatabaseSettings(
+                dynamodb_billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST
+            ),
         )
         API(
             stack,
             "API",
-            dynamodb_table_name=database.dynamodb_table.table_name,
-            lambda_reserved_concurrency=1,
+            database=database,
+            settings=APISettings(lambda_reserved_concurrency=1),
         )
         template = assertions.Template.from_stack(stack).to_json()
         lambda_function_code_property = template["Resources"][
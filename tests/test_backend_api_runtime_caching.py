@@ -0,0 +1,178 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import random
+import time
+import unittest
+from unittest import mock
+
+from backend.api.runtime import caching
+from backend.api.runtime import fan_out
+from backend.api.runtime import in_memory
+
+
+class CachingDatabaseTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.now = 0.0
+        self.database = mock.create_autospec(
+            caching.users.DatabaseInterface, instance=True
+        )
+        self.caching_database = caching.CachingDatabase(
+            database=self.database,
+            max_size=2,
+            ttl_seconds=10,
+            negative_ttl_seconds=1,
+            clock=lambda: self.now,
+        )
+
+    def test_get_user_hit(self) -> None:
+        user = {"username": "john"}
+        self.database.get_user.return_value = user
+        self.assertEqual(self.caching_database.get_user("john"), user)
+        self.assertEqual(self.caching_database.get_user("john"), user)
+        self.database.get_user.assert_called_once_with("john", None)
+        self.assertEqual(
+            self.caching_database.statistics, caching.CacheStatistics(hits=1, misses=1)
+        )
+
+    def test_get_user_expired(self) -> None:
+        self.database.get_user.return_value = {"username": "john"}
+        self.caching_database.get_user("john")
+        self.now = 10
+        self.caching_database.get_user("john")
+        self.assertEqual(self.database.get_user.call_count, 2)
+
+    def test_get_user_negative_cache(self) -> None:
+        self.database.get_user.return_value = None
+        self.assertIsNone(self.caching_database.get_user("john"))
+        self.assertIsNone(self.caching_database.get_user("john"))
+        self.now = 1
+        self.caching_database.get_user("john")
+        self.assertEqual(self.database.get_user.call_count, 2)
+
+    def test_lru_eviction(self) -> None:
+        self.database.get_user.side_effect = lambda username, _: {"username": username}
+        self.caching_database.get_user("john")
+        self.caching_database.get_user("jane")
+        self.caching_database.get_user("john")
+        self.caching_database.get_user("jack")
+        self.caching_database.get_user("jane")
+        self.assertEqual(self.database.get_user.call_count, 4)
+        self.assertEqual(self.caching_database.statistics.evictions, 2)
+
+    def test_update_user_refreshes_entry(self) -> None:
+        self.database.get_user.return_value = {"username": "john"}
+        self.database.update_user.return_value = {"username": "john", "state": "WA"}
+        self.caching_database.get_user("john")
+        self.caching_database.update_user("john", {"state": "WA"})
+        self.assertEqual(
+            self.caching_database.get_user("john"), {"username": "john", "state": "WA"}
+        )
+        self.database.get_user.assert_called_once_with("john", None)
+
+    def test_delete_user_caches_missing_user(self) -> None:
+        self.database.get_user.return_value = {"username": "john"}
+        self.caching_database.get_user("john")
+        self.caching_database.delete_user("john")
+        self.assertIsNone(self.caching_database.get_user("john"))
+        self.database.get_user.assert_called_once_with("john", None)
+
+    def test_failed_write_invalidates_entry(self) -> None:
+        self.database.get_user.return_value = {"username": "john"}
+        self.database.delete_user.side_effect = caching.users.UserNotFoundError("john")
+        self.caching_database.get_user("john")
+        with self.assertRaises(caching.users.UserNotFoundError):
+            self.caching_database.delete_user("john")
+        self.caching_database.get_user("john")
+        self.assertEqual(self.database.get_user.call_count, 2)
+
+    def test_batch_get_users_fetches_misses_only(self) -> None:
+        batch_item_status = caching.users.BatchItemStatus
+        self.database.get_user.return_value = {"username": "john"}
+        self.database.batch_get_users.return_value = [
+            caching.users.BatchItemResult("jane", batch_item_status.NOT_FOUND)
+        ]
+        self.caching_database.get_user("john")
+        results = self.caching_database.batch_get_users(["jane", "john"])
+        self.database.batch_get_users.assert_called_once_with(["jane"], None)
+        self.assertEqual(
+            [result.status for result in results],
+            [batch_item_status.NOT_FOUND, batch_item_status.FOUND],
+        )
+        self.assertIsNone(self.caching_database.get_user("jane"))
+        self.database.get_user.assert_called_once_with("john", None)
+
+    def test_get_user_projects_cached_user(self) -> None:
+        self.database.get_user.return_value = {"username": "john", "state": "WA"}
+        self.caching_database.get_user("john")
+        self.assertEqual(
+            self.caching_database.get_user("john", ["state"]),
+            {"username": "john", "state": "WA"},
+        )
+        self.assertEqual(
+            self.caching_database.get_user("john", ["email"]), {"username": "john"}
+        )
+        self.database.get_user.assert_called_once_with("john", None)
+
+    def test_get_user_projected_miss_not_cached(self) -> None:
+        self.database.get_user.return_value = {"username": "john"}
+        self.caching_database.get_user("john", ["state"])
+        self.caching_database.get_user("john")
+        self.assertEqual(self.database.get_user.call_count, 2)
+
+
+def yielding_clock() -> float:
+    # Switches threads while the cache reads the clock
+    time.sleep(0)
+    return time.monotonic()
+
+
+class FannedOutCachingDatabaseTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        # Fewer entries than users, so that hits race with evictions
+        self.caching_database = caching.CachingDatabase(
+            database=in_memory.InMemoryDatabase(),
+            max_size=8,
+            ttl_seconds=10,
+            negative_ttl_seconds=10,
+            clock=yielding_clock,
+        )
+        self.users_repository = fan_out.FanOutUsersRepository(
+            database=self.caching_database, max_concurrency=8
+        )
+        self.usernames = [f"user{index}" for index in range(16)]
+        for username in self.usernames:
+            self.users_repository.create_user(username, {"country": "US"})
+
+    def test_concurrent_reads_and_updates(self) -> None:
+        samples = random.Random(0)
+        for _ in range(50):
+            results = self.users_repository.get_users_many(
+                samples.sample(self.usernames, 12)
+            )
+            results += self.users_repository.update_users_many(
+                {
+                    username: {"country": "SE"}
+                    for username in samples.sample(self.usernames, 12)
+                }
+            )
+            self.assertEqual([result.error for result in results], [None] * 24)
+        # Every get_user of the fan-out looked up the cache once
+        statistics = self.caching_database.statistics
+        self.assertEqual(statistics.hits + statistics.misses, 50 * 12)
+
+
+if __name__ == "__main__":
+    unittest.main()
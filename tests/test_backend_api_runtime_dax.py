@@ -0,0 +1,66 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import sys
+import unittest
+from unittest import mock
+
+import boto3
+from botocore import stub
+
+# The DAX client is only bundled with the Lambda function
+with mock.patch.dict(sys.modules, {"amazondax": mock.MagicMock()}):
+    from backend.api.runtime import dax
+
+TABLE_NAME = "DaxDatabaseTestCase"
+
+
+class DaxDatabaseTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        dynamodb = boto3.client("dynamodb", region_name="eu-west-1")
+        self.stubber = stub.Stubber(dynamodb)
+        self.stubber.activate()
+        self.addCleanup(self.stubber.deactivate)
+        with mock.patch("users.boto3.client", return_value=dynamodb), mock.patch.object(
+            dax.amazondax, "AmazonDaxClient"
+        ) as mock_dax_client:
+            self.database = dax.DaxDatabase(
+                TABLE_NAME, dax_endpoint="daxs://cluster.dax-clusters.amazonaws.com"
+            )
+        self.dax_client = mock_dax_client.return_value
+
+    def test_get_user_reads_through_dax(self) -> None:
+        self.dax_client.get_item.return_value = {
+            "Item": {"username": {"S": "john"}, "version": {"N": "1"}}
+        }
+        self.assertEqual(
+            self.database.get_user("john"), {"username": "john", "version": 1}
+        )
+        self.dax_client.get_item.assert_called_once_with(
+            TableName=TABLE_NAME, Key={"username": {"S": "john"}}
+        )
+
+    def test_list_users_reads_dynamodb(self) -> None:
+        self.stubber.add_response(
+            "scan",
+            {"Items": [{"username": {"S": "john"}}]},
+            {"TableName": TABLE_NAME, "Limit": 1},
+        )
+        self.assertEqual(self.database.list_users(1).users, [{"username": "john"}])
+        self.dax_client.scan.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
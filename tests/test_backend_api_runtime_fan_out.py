@@ -0,0 +1,122 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import threading
+import time
+import unittest
+from typing import Any, Dict, Optional, Sequence
+from unittest import mock
+
+from backend.api.runtime import fan_out
+from backend.api.runtime import in_memory
+
+
+class ConcurrencyTrackingDatabase(in_memory.InMemoryDatabase):
+    """Records the most get_user calls in flight at once."""
+
+    def __init__(self, *, latency_seconds: float = 0):
+        super().__init__(latency_seconds=latency_seconds)
+        self.max_in_flight = 0
+        self._in_flight = 0
+        self._in_flight_lock = threading.Lock()
+
+    def get_user(
+        self, username: str, fields: Optional[Sequence[str]] = None
+    ) -> Optional[Dict[str, Any]]:
+        with self._in_flight_lock:
+            self._in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self._in_flight)
+        try:
+            return super().get_user(username, fields)
+        finally:
+            with self._in_flight_lock:
+                self._in_flight -= 1
+
+
+class FanOutUsersRepositoryTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.database = ConcurrencyTrackingDatabase(latency_seconds=0.01)
+        self.users_repository = fan_out.FanOutUsersRepository(
+            database=self.database, max_concurrency=4
+        )
+        for index in range(8):
+            self.database.create_user(f"user{index}", {"country": "US"})
+
+    def test_get_users_many_ordered(self) -> None:
+        usernames = [f"user{index}" for index in reversed(range(8))]
+        results = self.users_repository.get_users_many(usernames, ["country"])
+        self.assertEqual([result.username for result in results], usernames)
+        self.assertEqual(
+            results[0],
+            fan_out.ItemResult("user7", {"username": "user7", "country": "US"}),
+        )
+
+    def test_get_users_many_bounded_concurrency(self) -> None:
+        self.users_repository.get_users_many([f"user{index}" for index in range(8)])
+        self.assertGreater(self.database.max_in_flight, 1)
+        self.assertLessEqual(self.database.max_in_flight, 4)
+
+    def test_get_users_many_not_found(self) -> None:
+        results = self.users_repository.get_users_many(["user0", "jane", "user0"])
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results[1], fan_out.ItemResult("jane"))
+
+    def test_update_users_many_per_item_errors(self) -> None:
+        results = self.users_repository.update_users_many(
+            {
+                "user0": {"plan": "pro"},
+                "jane": {"plan": "pro"},
+                "user1": {"plan": "pro"},
+            },
+            expected_versions={"user1": 5},
+        )
+        self.assertEqual(results[0].user["plan"], "pro")  # type: ignore
+        self.assertIsInstance(results[1].error, in_memory.users.UserNotFoundError)
+        self.assertIsInstance(results[2].error, in_memory.users.VersionConflictError)
+        self.assertNotIn("plan", self.database.get_user("user1"))  # type: ignore
+
+    def test_deadline_cancels_queued_calls(self) -> None:
+        database = in_memory.InMemoryDatabase(latency_seconds=0.1)
+        users_repository = fan_out.FanOutUsersRepository(
+            database=database, max_concurrency=1
+        )
+        started = time.monotonic()
+        results = users_repository.get_users_many(
+            [f"user{index}" for index in range(10)], deadline=started + 0.15
+        )
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertIsNone(results[0].error)
+        self.assertIsInstance(results[-1].error, fan_out.DeadlineExceededError)
+
+    def test_deadline_passed(self) -> None:
+        results = self.users_repository.get_users_many(
+            ["user0"], deadline=time.monotonic() - 1
+        )
+        self.assertIsInstance(results[0].error, fan_out.DeadlineExceededError)
+
+    def test_empty(self) -> None:
+        self.assertEqual(self.users_repository.update_users_many({}), [])
+
+    def test_deadline_from_context(self) -> None:
+        context = mock.Mock()
+        context.get_remaining_time_in_millis.return_value = 3000
+        deadline = fan_out.deadline_from_context(
+            context, margin_seconds=0.5, clock=lambda: 100.0
+        )
+        self.assertEqual(deadline, 102.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import unittest
+
+from backend.api.runtime import global_tables
+from backend.api.runtime import in_memory
+
+
+class GlobalTableDatabaseTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        # Replication is left out, the local replica only has what it is given
+        self.local_database = in_memory.InMemoryDatabase()
+        self.primary_database = in_memory.InMemoryDatabase()
+        self.database = global_tables.GlobalTableDatabase(
+            local_database=self.local_database,
+            primary_database=self.primary_database,
+        )
+
+    def test_writes_primary_region(self) -> None:
+        self.database.create_user("john", {"email": "john@example.com"})
+        self.database.update_user("john", {"country": "SE"}, expected_version=1)
+        self.database.batch_write_users({"jane": {"country": "NO"}}, [])
+        self.assertEqual(
+            self.primary_database.get_user("john"),
+            {
+                "username": "john",
+                "email": "john@example.com",
+                "country": "SE",
+                "version": 2,
+            },
+        )
+        self.assertIsNotNone(self.primary_database.get_user("jane"))
+        self.assertEqual(self.local_database.list_users(10).users, [])
+        self.database.delete_user("john")
+        self.assertIsNone(self.primary_database.get_user("john"))
+
+    def test_conditions_checked_in_primary_region(self) -> None:
+        # The local replica may not have the user yet
+        self.primary_database.create_user("john", {})
+        with self.assertRaises(global_tables.users.UserAlreadyExistsError):
+            self.database.create_user("john", {})
+        with self.assertRaises(global_tables.users.VersionConflictError):
+            self.database.update_user("john", {"country": "SE"}, expected_version=2)
+
+    def test_reads_local_replica(self) -> None:
+        self.local_database.create_user("john", {"email": "john@example.com"})
+        self.assertIsNotNone(self.database.get_user("john"))
+        self.assertIsNotNone(self.database.get_user_by_email("john@example.com"))
+        self.assertEqual(len(self.database.find_users("john@example.com")), 1)
+        self.assertEqual(len(self.database.batch_get_users(["john"])), 1)
+        self.assertEqual(len(self.database.list_users(10).users), 1)
+        self.assertEqual(len(list(self.database.iter_users())), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,168 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import unittest
+from unittest import mock
+
+from backend.api.runtime import helpers
+
+
+class HelpersTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        helpers.get_users_repository.cache_clear()
+
+    def tearDown(self) -> None:
+        helpers.get_users_repository.cache_clear()
+
+    @mock.patch.dict(
+        "helpers.os.environ",
+        {
+            "DYNAMODB_MAX_POOL_CONNECTIONS": "25",
+            "DYNAMODB_TCP_KEEPALIVE": "true",
+            "DYNAMODB_CONNECT_TIMEOUT": "1.5",
+            "DYNAMODB_READ_TIMEOUT": "2.5",
+            "DYNAMODB_RETRY_MODE": "adaptive",
+            "DYNAMODB_MAX_ATTEMPTS": "4",
+            "DYNAMODB_REGION": "us-east-1",
+        },
+    )
+    @mock.patch("helpers.config.Config")
+    def test_init_dynamodb_config(self, mock_config: mock.Mock) -> None:
+        helpers.init_dynamodb_config()
+        mock_config.assert_called_once_with(
+            region_name="us-east-1",
+            max_pool_connections=25,
+            tcp_keepalive=True,
+            connect_timeout=1.5,
+            read_timeout=2.5,
+            retries={"mode": "adaptive", "max_attempts": 4},
+        )
+
+    @mock.patch.dict("helpers.os.environ", {"DYNAMODB_TABLE_NAME": "HelpersTestCase"})
+    def test_get_users_repository_reused(self) -> None:
+        users_repository = helpers.get_users_repository()
+        self.assertIs(helpers.get_users_repository(), users_repository)
+
+    @mock.patch.dict(
+        "helpers.os.environ",
+        {
+            "DYNAMODB_TABLE_NAME": "HelpersTestCase",
+            "DAX_ENDPOINT": "daxs://cluster.dax-clusters.amazonaws.com",
+        },
+    )
+    def test_init_database_dax(self) -> None:
+        mock_dax = mock.MagicMock()
+        with mock.patch.dict("sys.modules", {"dax": mock_dax}):
+            database = helpers.init_database()
+        self.assertIs(database, mock_dax.DaxDatabase.return_value)
+        self.assertEqual(
+            mock_dax.DaxDatabase.call_args.kwargs["dax_endpoint"],
+            "daxs://cluster.dax-clusters.amazonaws.com",
+        )
+
+    @mock.patch.dict(
+        "helpers.os.environ",
+        {
+            "DYNAMODB_TABLE_NAME": "HelpersTestCase",
+            "DYNAMODB_REGION": "us-east-1",
+            "DYNAMODB_WRITE_REGION": "eu-west-1",
+        },
+    )
+    @mock.patch("helpers.global_tables.GlobalTableDatabase")
+    @mock.patch("helpers.users.DynamoDBDatabase")
+    def test_init_database_primary_writes(
+        self, mock_database: mock.Mock, mock_global_table_database: mock.Mock
+    ) -> None:
+        database = helpers.init_database()
+        self.assertIs(database, mock_global_table_database.return_value)
+        regions = [
+            call.kwargs["dynamodb_config"].region_name
+            for call in mock_database.call_args_list
+        ]
+        self.assertEqual(regions, ["us-east-1", "eu-west-1"])
+        self.assertEqual(
+            mock_global_table_database.call_args.kwargs,
+            {
+                "local_database": mock_database.return_value,
+                "primary_database": mock_database.return_value,
+            },
+        )
+
+    @mock.patch.dict(
+        "helpers.os.environ",
+        {
+            "USERS_DATABASE": "in_memory",
+            "USERS_ADMISSION_CONTROL_ENABLED": "true",
+            "USERS_ADMISSION_READ_MAX_RATE": "50",
+            "USERS_ADMISSION_WRITE_MAX_RATE": "20",
+        },
+    )
+    def test_init_users_repository_admission_control(self) -> None:
+        users_repository = helpers.init_users_repository()
+        # pylint: disable=protected-access
+        self.assertEqual(users_repository._read_budget.rate, 50)  # type: ignore
+        self.assertEqual(users_repository._write_budget.rate, 20)  # type: ignore
+
+    @mock.patch.dict("helpers.os.environ", {"USERS_DATABASE": "in_memory"})
+    def test_init_users_repository_without_admission_control(self) -> None:
+        self.assertIsNone(helpers.init_budget("USERS_ADMISSION_READ_MAX_RATE"))
+
+    @mock.patch.dict("helpers.os.environ", {"USERS_DATABASE": "in_memory"})
+    def test_get_stats_reader_in_memory(self) -> None:
+        helpers.get_stats_reader.cache_clear()
+        self.addCleanup(helpers.get_stats_reader.cache_clear)
+        stats_reader = helpers.get_stats_reader()
+        self.assertEqual(stats_reader.get_stats(), helpers.stats.UsersStats())
+
+    @mock.patch.dict(
+        "helpers.os.environ",
+        {
+            "DYNAMODB_COMPRESSION_THRESHOLD": "2048",
+            "ATTRIBUTES_BUCKET_NAME": "attributes",
+        },
+    )
+    @mock.patch("helpers.large_attributes.LargeAttributes")
+    def test_init_large_attributes(self, mock_large_attributes: mock.Mock) -> None:
+        helpers.init_large_attributes()
+        kwargs = mock_large_attributes.call_args.kwargs
+        self.assertEqual(kwargs["compression_threshold_bytes"], 2048)
+        self.assertEqual(kwargs["offload_threshold_bytes"], 65536)
+        self.assertEqual(kwargs["bucket_name"], "attributes")
+        self.assertIsNone(kwargs["s3_config"])
+        self.assertIn("email", kwargs["plain_attributes"])
+
+    @mock.patch.dict(
+        "helpers.os.environ",
+        {
+            "DYNAMODB_COMPRESSION_THRESHOLD": "2048",
+            "ATTRIBUTES_BUCKET_NAME": "attributes",
+            "ATTRIBUTES_BUCKET_REGION": "eu-west-1",
+        },
+    )
+    @mock.patch("helpers.large_attributes.LargeAttributes")
+    def test_init_large_attributes_bucket_region(
+        self, mock_large_attributes: mock.Mock
+    ) -> None:
+        helpers.init_large_attributes()
+        s3_config = mock_large_attributes.call_args.kwargs["s3_config"]
+        self.assertEqual(s3_config.region_name, "eu-west-1")
+
+    @mock.patch.dict("helpers.os.environ", {"DYNAMODB_COMPRESSION_THRESHOLD": "0"})
+    def test_init_large_attributes_disabled(self) -> None:
+        self.assertIsNone(helpers.init_large_attributes())
+
+
+if __name__ == "__main__":
+    unittest.main()
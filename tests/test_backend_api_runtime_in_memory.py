@@ -0,0 +1,129 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import unittest
+
+from backend.api.runtime import in_memory
+
+
+class InMemoryDatabaseTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.database = in_memory.InMemoryDatabase()
+
+    def test_create_user_already_exists(self) -> None:
+        self.database.create_user("john", {"email": "john@example.com"})
+        with self.assertRaises(in_memory.users.UserAlreadyExistsError):
+            self.database.create_user("john", {})
+
+    def test_update_user_not_found(self) -> None:
+        with self.assertRaises(in_memory.users.UserNotFoundError):
+            self.database.update_user("john", {"state": "WA"})
+
+    def test_returned_users_are_copies(self) -> None:
+        user = self.database.create_user("john", {"state": "WA"})
+        user["state"] = "CA"
+        self.assertEqual(
+            self.database.get_user("john"),
+            {"username": "john", "state": "WA", "version": 1},
+        )
+
+    def test_list_users_pagination(self) -> None:
+        for username in ["jack", "jane", "john"]:
+            self.database.create_user(username, {})
+        first_page = self.database.list_users(2)
+        second_page = self.database.list_users(2, first_page.cursor)
+        self.assertEqual(
+            [user["username"] for user in first_page.users + second_page.users],
+            ["jack", "jane", "john"],
+        )
+        self.assertIsNone(second_page.cursor)
+
+    def test_batch_write_and_get_users(self) -> None:
+        self.database.create_user("jane", {})
+        self.database.batch_write_users({"john": {"state": "WA"}}, ["jane"])
+        results = self.database.batch_get_users(["john", "jane"])
+        self.assertEqual(
+            [result.status for result in results],
+            [
+                in_memory.users.BatchItemStatus.FOUND,
+                in_memory.users.BatchItemStatus.NOT_FOUND,
+            ],
+        )
+
+    def test_batch_put_increases_version(self) -> None:
+        self.database.create_user("john", {})
+        self.database.batch_write_users({"john": {"state": "WA"}}, [])
+        user = self.database.get_user("john") or {}
+        self.assertEqual(in_memory.users.get_version(user), 2)
+
+    def test_batch_put_email_in_use(self) -> None:
+        self.database.create_user("jane", {"email": "jane@example.com"})
+        results = self.database.batch_write_users(
+            {"john": {"email": "jane@example.com"}}, []
+        )
+        self.assertEqual(results[0].status, in_memory.users.BatchItemStatus.CONFLICT)
+        self.assertIsNone(self.database.get_user("john"))
+
+    def test_apply_user_update(self) -> None:
+        self.database.create_user("john", {"state": "WA", "tags": {"a"}})
+        user_update = in_memory.users.UserUpdate(
+            set_attributes_if_not_exists={"state": "CA", "country": "US"},
+            remove_attributes=("state",),
+            add_values={"logins": 1, "tags": {"b"}},
+        )
+        self.assertEqual(
+            self.database.apply_user_update("john", user_update),
+            {
+                "username": "john",
+                "country": "US",
+                "logins": 1,
+                "tags": {"a", "b"},
+                "version": 2,
+            },
+        )
+
+    def test_version_conflict(self) -> None:
+        self.database.create_user("john", {})
+        self.database.update_user("john", {"state": "WA"}, expected_version=1)
+        with self.assertRaises(in_memory.users.VersionConflictError):
+            self.database.update_user("john", {"state": "CA"}, expected_version=1)
+        with self.assertRaises(in_memory.users.VersionConflictError):
+            self.database.delete_user("john", expected_version=1)
+        self.database.delete_user("john", expected_version=2)
+        self.assertIsNone(self.database.get_user("john"))
+
+    def test_email_uniqueness(self) -> None:
+        self.database.create_user("john", {"email": "john@example.com"})
+        self.database.create_user("jane", {})
+        with self.assertRaises(in_memory.users.EmailAlreadyInUseError):
+            self.database.create_user("jack", {"email": "john@example.com"})
+        with self.assertRaises(in_memory.users.EmailAlreadyInUseError):
+            self.database.update_user("jane", {"email": "john@example.com"})
+        self.assertNotIn("email", self.database.get_user("jane") or {})
+        self.database.update_user("john", {"email": "john@example.org"})
+        self.database.update_user("jane", {"email": "john@example.com"})
+
+    def test_find_users(self) -> None:
+        self.database.create_user("john", {"email": "john@example.com", "state": "WA"})
+        self.database.create_user("jane", {"email": "jane@example.com"})
+        self.assertEqual(
+            self.database.find_users("john@example.com", ["state"]),
+            [{"username": "john", "state": "WA"}],
+        )
+        self.assertIsNone(self.database.get_user_by_email("jack@example.com"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import contextlib
+import io
+import json
+import unittest
+from typing import Any, Dict, List
+from unittest import mock
+
+import boto3
+from botocore import stub
+
+from backend.api.runtime import instrumentation
+
+
+def capture_metrics(function: Any, *args: Any) -> List[Dict[str, Any]]:
+    # Embedded metric format blobs are printed as one JSON document per line
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        function(*args)
+    return [json.loads(line) for line in output.getvalue().splitlines()]
+
+
+def metric_names(blob: Dict[str, Any]) -> List[str]:
+    directives = blob["_aws"]["CloudWatchMetrics"]
+    return [metric["Name"] for metric in directives[0]["Metrics"]]
+
+
+class DisabledInstrumentationTestCase(unittest.TestCase):
+    def test_functions_untouched(self) -> None:
+        def get_user() -> None:
+            pass
+
+        with mock.patch.object(instrumentation, "METRICS_ENABLED", False):
+            self.assertIs(
+                instrumentation.timed("Latency", "Method")(get_user), get_user
+            )
+            self.assertIs(instrumentation.instrument_handler(get_user), get_user)
+            self.assertEqual(
+                capture_metrics(instrumentation.add_count, "CacheHits"), []
+            )
+
+
+@mock.patch.object(instrumentation, "METRICS_ENABLED", True)
+class MetricsTestCase(unittest.TestCase):
+    def test_timed(self) -> None:
+        @instrumentation.timed("DynamoDBLatency", "Method")
+        def get_user() -> None:
+            pass
+
+        (blob,) = capture_metrics(get_user)
+        self.assertEqual(metric_names(blob), ["DynamoDBLatency"])
+        self.assertEqual(blob["Method"], "get_user")
+        self.assertGreaterEqual(blob["DynamoDBLatency"][0], 0)
+
+    def test_consumed_capacity(self) -> None:
+        dynamodb = boto3.client("dynamodb", region_name="eu-west-1")
+        instrumentation.register_consumed_capacity(dynamodb)
+        with stub.Stubber(dynamodb) as stubber:
+            stubber.add_response(
+                "get_item",
+                {"ConsumedCapacity": {"TableName": "Users", "CapacityUnits": 0.5}},
+                {
+                    "TableName": "Users",
+                    "Key": {"username": {"S": "john"}},
+                    "ReturnConsumedCapacity": "TOTAL",
+                },
+            )
+            (blob,) = capture_metrics(
+                lambda: dynamodb.get_item(
+                    TableName="Users", Key={"username": {"S": "john"}}
+                )
+            )
+        self.assertEqual(blob["ConsumedCapacity"], [0.5])
+        self.assertEqual(blob["Operation"], "GetItem")
+
+    def test_route_middleware(self) -> None:
+        app = mock.Mock(
+            context={"_route": mock.Mock(func=mock.Mock(__name__="get_user"))}
+        )
+        next_middleware = mock.Mock()
+        response = instrumentation.route_middleware(app, next_middleware)
+        self.assertIs(response, next_middleware.return_value)
+        (blob,) = capture_metrics(instrumentation.metrics.flush_metrics)
+        self.assertEqual(metric_names(blob), ["RouteRequests", "RouteLatency"])
+        self.assertEqual(blob["Route"], "get_user")
+
+    @mock.patch("aws_lambda_powertools.metrics.provider.cold_start.is_cold_start", True)
+    def test_handler_flushes_metrics_with_cold_start(self) -> None:
+        def lambda_handler(_event: Dict[str, Any], _context: object) -> None:
+            instrumentation.add_count("CacheHits")
+
+        context = mock.Mock(function_name="API")
+        blobs = capture_metrics(
+            instrumentation.instrument_handler(lambda_handler), {}, context
+        )
+        self.assertEqual(
+            sorted(name for blob in blobs for name in metric_names(blob)),
+            ["CacheHits", "ColdStart"],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
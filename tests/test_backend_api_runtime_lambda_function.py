@@ -15,9 +15,19 @@
 
 import json
 import unittest
+from typing import Any, Dict, Optional
 from unittest import mock
+from urllib import parse
 
+import boto3
+from botocore import stub
+
+import toolchain
 from backend.api.runtime import lambda_function
+from scripts import api_events
+
+TABLE_NAME = "AppTestCase"
+EMAIL_TABLE_NAME = "AppTestCaseEmails"
 
 
 class AppTestCase(unittest.TestCase):
@@ -41,5 +51,940 @@ class AppTestCase(unittest.TestCase):
         self.assertEqual(json.loads(response["body"]), user)
 
 
+class StubbedDynamoDBTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        lambda_function.helpers.get_users_repository.cache_clear()
+        dynamodb = boto3.client("dynamodb", region_name="eu-west-1")
+        self.stubber = stub.Stubber(dynamodb)
+        patchers = [
+            mock.patch.dict("helpers.os.environ", {"DYNAMODB_TABLE_NAME": TABLE_NAME}),
+            mock.patch("users.boto3.client", return_value=dynamodb),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.stubber.activate()
+        self.addCleanup(self.stubber.deactivate)
+        self.addCleanup(lambda_function.helpers.get_users_repository.cache_clear)
+
+    def _handle(
+        self,
+        method: str,
+        path: str,
+        body: Optional[Dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> Dict[str, Any]:
+        # Query string parameters and headers
+        event = api_events.build_event(method, path, body, **kwargs)
+        response: Dict[str, Any] = lambda_function.lambda_handler(event, None)
+        # Any DynamoDB call beyond the stubbed ones fails the request
+        self.stubber.assert_no_pending_responses()
+        return response
+
+
+class DynamoDBCallsTestCase(StubbedDynamoDBTestCase):
+    def test_create_user_single_call(self) -> None:
+        self.stubber.add_response(
+            "put_item",
+            {},
+            {
+                "TableName": TABLE_NAME,
+                "Item": {
+                    "username": {"S": "john"},
+                    "email": {"S": "john@example.com"},
+                    "version": {"N": "1"},
+                },
+                "ConditionExpression": "attribute_not_exists(username)",
+            },
+        )
+        response = self._handle(
+            "POST", "/users", {"username": "john", "email": "john@example.com"}
+        )
+        self.assertEqual(response["statusCode"], 200)
+        self.assertEqual(response["headers"]["ETag"], '"1"')
+
+    def test_create_user_fractional_number(self) -> None:
+        self.stubber.add_response(
+            "put_item",
+            {},
+            {
+                "TableName": TABLE_NAME,
+                "Item": {
+                    "username": {"S": "john"},
+                    "score": {"N": "4.25"},
+                    "version": {"N": "1"},
+                },
+                "ConditionExpression": "attribute_not_exists(username)",
+            },
+        )
+        response = self._handle("POST", "/users", {"username": "john", "score": 4.25})
+        self.assertEqual(
+            {"username": "john", "score": 4.25, "version": 1},
+            json.loads(response["body"]),
+        )
+
+    def test_get_user_sets(self) -> None:
+        self.stubber.add_response(
+            "get_item",
+            {
+                "Item": {
+                    "username": {"S": "john"},
+                    "tags": {"SS": ["b", "a"]},
+                    "version": {"N": "2"},
+                }
+            },
+        )
+        response = self._handle("GET", "/users/john")
+        self.assertEqual(
+            {"username": "john", "tags": ["a", "b"], "version": 2},
+            json.loads(response["body"]),
+        )
+
+    def test_create_user_already_exists(self) -> None:
+        self.stubber.add_client_error("put_item", "ConditionalCheckFailedException")
+        response = self._handle("POST", "/users", {"username": "john"})
+        self.assertEqual(response["statusCode"], 400)
+
+    def test_update_user_single_call(self) -> None:
+        self.stubber.add_response(
+            "update_item",
+            {"Attributes": {"username": {"S": "john"}, "country": {"S": "US"}}},
+            {
+                "TableName": TABLE_NAME,
+                "Key": {"username": {"S": "john"}},
+                "UpdateExpression": "SET #n0 = :v0 ADD #n1 :v1",
+                "ConditionExpression": "attribute_exists(#username)",
+                "ExpressionAttributeNames": {
+                    "#username": "username",
+                    "#n0": "country",
+                    "#n1": "version",
+                },
+                "ExpressionAttributeValues": {":v0": {"S": "US"}, ":v1": {"N": "1"}},
+                "ReturnValues": "ALL_NEW",
+            },
+        )
+        response = self._handle("PUT", "/users/john", {"country": "US"})
+        self.assertEqual(
+            json.loads(response["body"]), {"username": "john", "country": "US"}
+        )
+
+    def test_update_user_not_found(self) -> None:
+        self.stubber.add_client_error("update_item", "ConditionalCheckFailedException")
+        response = self._handle("PUT", "/users/john", {"country": "US"})
+        self.assertEqual(response["statusCode"], 404)
+
+    def test_delete_user_single_call(self) -> None:
+        self.stubber.add_response(
+            "delete_item",
+            {},
+            {
+                "TableName": TABLE_NAME,
+                "Key": {"username": {"S": "john"}},
+                "ConditionExpression": "attribute_exists(username)",
+            },
+        )
+        response = self._handle("DELETE", "/users/john")
+        self.assertEqual(response["statusCode"], 200)
+
+    def test_delete_user_not_found(self) -> None:
+        self.stubber.add_client_error("delete_item", "ConditionalCheckFailedException")
+        response = self._handle("DELETE", "/users/john")
+        self.assertEqual(response["statusCode"], 404)
+
+    @mock.patch("users.time.sleep")
+    def test_batch_get_users_chunks_and_retries(self, mock_sleep: mock.Mock) -> None:
+        usernames = [f"user{index}" for index in range(150)]
+        first_chunk_keys = [
+            {"username": {"S": username}} for username in usernames[:100]
+        ]
+        self.stubber.add_response(
+            "batch_get_item",
+            {
+                "Responses": {TABLE_NAME: [{"username": {"S": "user0"}}]},
+                "UnprocessedKeys": {
+                    TABLE_NAME: {"Keys": [{"username": {"S": "user1"}}]}
+                },
+            },
+            {"RequestItems": {TABLE_NAME: {"Keys": first_chunk_keys}}},
+        )
+        self.stubber.add_response(
+            "batch_get_item",
+            {"Responses": {TABLE_NAME: [{"username": {"S": "user1"}}]}},
+            {"RequestItems": {TABLE_NAME: {"Keys": [{"username": {"S": "user1"}}]}}},
+        )
+        self.stubber.add_response(
+            "batch_get_item",
+            {"Responses": {TABLE_NAME: []}},
+            {
+                "RequestItems": {
+                    TABLE_NAME: {
+                        "Keys": [
+                            {"username": {"S": username}}
+                            for username in usernames[100:]
+                        ]
+                    }
+                }
+            },
+        )
+        response = self._handle("POST", "/users:batchGet", {"usernames": usernames})
+        results = json.loads(response["body"])["results"]
+        self.assertEqual(len(results), 150)
+        self.assertEqual(
+            [result["status"] for result in results[:3]],
+            ["found", "found", "not_found"],
+        )
+        mock_sleep.assert_called_once()
+
+    def test_batch_write_users(self) -> None:
+        self.stubber.add_response(
+            "get_item",
+            {"Item": {"username": {"S": "john"}, "version": {"N": "2"}}},
+            {
+                "TableName": TABLE_NAME,
+                "Key": {"username": {"S": "john"}},
+                "ConsistentRead": True,
+            },
+        )
+        self.stubber.add_response(
+            "put_item",
+            {},
+            {
+                "TableName": TABLE_NAME,
+                "Item": {
+                    "username": {"S": "john"},
+                    "state": {"S": "WA"},
+                    "version": {"N": "3"},
+                },
+                "ConditionExpression": (
+                    "attribute_exists(username) AND #version = :expected_version"
+                ),
+                "ExpressionAttributeNames": {"#version": "version"},
+                "ExpressionAttributeValues": {":expected_version": {"N": "2"}},
+            },
+        )
+        for _ in range(lambda_function.users.BATCH_MAX_ATTEMPTS):
+            self.stubber.add_response(
+                "batch_write_item",
+                {
+                    "UnprocessedItems": {
+                        TABLE_NAME: [
+                            {"DeleteRequest": {"Key": {"username": {"S": "jane"}}}}
+                        ]
+                    }
+                },
+                {
+                    "RequestItems": {
+                        TABLE_NAME: [
+                            {"DeleteRequest": {"Key": {"username": {"S": "jane"}}}}
+                        ]
+                    }
+                },
+            )
+        with mock.patch("users.time.sleep"):
+            response = self._handle(
+                "POST",
+                "/users:batchWrite",
+                {"put": [{"username": "john", "state": "WA"}], "delete": ["jane"]},
+            )
+        self.assertEqual(
+            json.loads(response["body"])["results"],
+            [
+                {
+                    "username": "john",
+                    "status": "put",
+                    "user": {"username": "john", "state": "WA", "version": 3},
+                },
+                {"username": "jane", "status": "unprocessed", "user": None},
+            ],
+        )
+
+    def test_batch_write_users_duplicate(self) -> None:
+        response = self._handle(
+            "POST",
+            "/users:batchWrite",
+            {"put": [{"username": "john"}], "delete": ["john"]},
+        )
+        self.assertEqual(response["statusCode"], 400)
+
+    def test_batch_update_users(self) -> None:
+        self.stubber.add_client_error("update_item", "ConditionalCheckFailedException")
+        response = self._handle(
+            "POST",
+            "/users:batchUpdate",
+            {"users": [{"username": "john", "country": "US"}]},
+        )
+        self.assertEqual(
+            json.loads(response["body"])["results"],
+            [{"username": "john", "error": "User john does not exist"}],
+        )
+
+    def test_batch_update_users_duplicate(self) -> None:
+        response = self._handle(
+            "POST",
+            "/users:batchUpdate",
+            {"users": [{"username": "john"}, {"username": "john"}]},
+        )
+        self.assertEqual(response["statusCode"], 400)
+
+    def test_list_users_pagination(self) -> None:
+        self.stubber.add_response(
+            "scan",
+            {
+                "Items": [{"username": {"S": "jane"}}],
+                "LastEvaluatedKey": {"username": {"S": "jane"}},
+            },
+            {"TableName": TABLE_NAME, "Limit": 1},
+        )
+        first_page = json.loads(
+            self._handle("GET", "/users", query_string_parameters={"limit": "1"})[
+                "body"
+            ]
+        )
+        self.stubber.add_response(
+            "scan",
+            {"Items": [{"username": {"S": "john"}}]},
+            {
+                "TableName": TABLE_NAME,
+                "Limit": 1,
+                "ExclusiveStartKey": {"username": {"S": "jane"}},
+            },
+        )
+        second_page = json.loads(
+            self._handle(
+                "GET",
+                "/users",
+                query_string_parameters={"limit": "1", "cursor": first_page["cursor"]},
+            )["body"]
+        )
+        self.assertEqual(first_page["users"], [{"username": "jane"}])
+        self.assertEqual(second_page, {"users": [{"username": "john"}], "cursor": None})
+
+    def test_list_users_invalid_cursor(self) -> None:
+        response = self._handle(
+            "GET", "/users", query_string_parameters={"cursor": "invalid"}
+        )
+        self.assertEqual(response["statusCode"], 400)
+
+    def test_list_users_invalid_limit(self) -> None:
+        response = self._handle("GET", "/users", query_string_parameters={"limit": "0"})
+        self.assertEqual(response["statusCode"], 400)
+
+    def test_get_user_fields_projection(self) -> None:
+        self.stubber.add_response(
+            "get_item",
+            {"Item": {"username": {"S": "john"}, "email": {"S": "john@example.com"}}},
+            {
+                "TableName": TABLE_NAME,
+                "Key": {"username": {"S": "john"}},
+                "ProjectionExpression": "#p0, #p1, #p2",
+                "ExpressionAttributeNames": {
+                    "#p0": "username",
+                    "#p1": "email",
+                    "#p2": "version",
+                },
+            },
+        )
+        response = self._handle(
+            "GET", "/users/john", query_string_parameters={"fields": "email"}
+        )
+        self.assertEqual(
+            json.loads(response["body"]),
+            {"username": "john", "email": "john@example.com"},
+        )
+
+    def test_patch_user_remove_and_add(self) -> None:
+        self.stubber.add_response(
+            "update_item",
+            {"Attributes": {"username": {"S": "john"}, "logins": {"N": "3"}}},
+            {
+                "TableName": TABLE_NAME,
+                "Key": {"username": {"S": "john"}},
+                "UpdateExpression": "REMOVE #n0 ADD #n1 :v0, #n2 :v1",
+                "ConditionExpression": "attribute_exists(#username)",
+                "ExpressionAttributeNames": {
+                    "#username": "username",
+                    "#n0": "state",
+                    "#n1": "logins",
+                    "#n2": "version",
+                },
+                "ExpressionAttributeValues": {":v0": {"N": "1"}, ":v1": {"N": "1"}},
+                "ReturnValues": "ALL_NEW",
+            },
+        )
+        response = self._handle(
+            "PATCH", "/users/john", {"remove": ["state"], "add": {"logins": 1}}
+        )
+        self.assertEqual(response["statusCode"], 200)
+
+    def test_patch_user_empty_update(self) -> None:
+        response = self._handle("PATCH", "/users/john", {})
+        self.assertEqual(response["statusCode"], 400)
+
+    def test_patch_user_invalid_update(self) -> None:
+        for update in [
+            {"add": {"tags": []}},
+            {"add": {"tags": [{"a": 1}]}},
+            {"add": {"tags": ["a", 1]}},
+            {"set": {"username": "jane"}},
+            {"remove": ["username"]},
+        ]:
+            response = self._handle("PATCH", "/users/john", update)
+            self.assertEqual(response["statusCode"], 400)
+
+
+class SmokeTestTestCase(StubbedDynamoDBTestCase):
+    def test_smoke_test_path_on_empty_table(self) -> None:
+        # The production smoke tests fail on HTTP errors
+        self.stubber.add_response(
+            "scan", {"Items": []}, {"TableName": TABLE_NAME, "Limit": 1}
+        )
+        smoke_test_url = parse.urlsplit(toolchain.SMOKE_TEST_PATH)
+        response = self._handle(
+            "GET",
+            smoke_test_url.path,
+            query_string_parameters=dict(parse.parse_qsl(smoke_test_url.query)),
+        )
+        self.assertEqual(response["statusCode"], 200)
+
+
+class ConditionalRequestsTestCase(StubbedDynamoDBTestCase):
+    def test_update_user_if_match(self) -> None:
+        self.stubber.add_response(
+            "update_item",
+            {"Attributes": {"username": {"S": "john"}, "version": {"N": "4"}}},
+            {
+                "TableName": TABLE_NAME,
+                "Key": {"username": {"S": "john"}},
+                "UpdateExpression": "SET #n0 = :v0 ADD #n1 :v1",
+                "ConditionExpression": (
+                    "attribute_exists(#username) AND #version = :expected_version"
+                ),
+                "ExpressionAttributeNames": {
+                    "#username": "username",
+                    "#n0": "country",
+                    "#n1": "version",
+                    "#version": "version",
+                },
+                "ExpressionAttributeValues": {
+                    ":v0": {"S": "US"},
+                    ":v1": {"N": "1"},
+                    ":expected_version": {"N": "3"},
+                },
+                "ReturnValues": "ALL_NEW",
+                "ReturnValuesOnConditionCheckFailure": "ALL_OLD",
+            },
+        )
+        response = self._handle(
+            "PUT", "/users/john", {"country": "US"}, headers={"If-Match": '"3"'}
+        )
+        self.assertEqual(response["headers"]["ETag"], '"4"')
+
+    def test_update_user_version_conflict(self) -> None:
+        self.stubber.add_client_error(
+            "update_item",
+            "ConditionalCheckFailedException",
+            modeled_fields={"Item": {"username": {"S": "john"}, "version": {"N": "4"}}},
+        )
+        response = self._handle(
+            "PUT", "/users/john", {"country": "US"}, headers={"If-Match": '"3"'}
+        )
+        self.assertEqual(response["statusCode"], 412)
+
+    def test_update_user_invalid_if_match(self) -> None:
+        response = self._handle(
+            "PUT", "/users/john", {"country": "US"}, headers={"If-Match": "latest"}
+        )
+        self.assertEqual(response["statusCode"], 400)
+
+    def test_delete_user_if_match_unversioned(self) -> None:
+        self.stubber.add_response(
+            "delete_item",
+            {},
+            {
+                "TableName": TABLE_NAME,
+                "Key": {"username": {"S": "john"}},
+                "ConditionExpression": (
+                    "attribute_exists(username) AND attribute_not_exists(#version)"
+                ),
+                "ExpressionAttributeNames": {"#version": "version"},
+                "ReturnValuesOnConditionCheckFailure": "ALL_OLD",
+            },
+        )
+        response = self._handle("DELETE", "/users/john", headers={"If-Match": '"0"'})
+        self.assertEqual(response["statusCode"], 200)
+
+    def test_delete_user_if_match_not_found(self) -> None:
+        self.stubber.add_client_error("delete_item", "ConditionalCheckFailedException")
+        response = self._handle("DELETE", "/users/john", headers={"If-Match": '"3"'})
+        self.assertEqual(response["statusCode"], 404)
+
+    def test_patch_user_version_attribute(self) -> None:
+        response = self._handle("PATCH", "/users/john", {"set": {"version": 7}})
+        self.assertEqual(response["statusCode"], 400)
+
+    def test_get_user_etag(self) -> None:
+        self.stubber.add_response(
+            "get_item",
+            {"Item": {"username": {"S": "john"}, "version": {"N": "2"}}},
+            {"TableName": TABLE_NAME, "Key": {"username": {"S": "john"}}},
+        )
+        response = self._handle("GET", "/users/john")
+        self.assertEqual(response["statusCode"], 200)
+        self.assertEqual(response["headers"]["ETag"], '"2"')
+
+    def test_get_user_not_modified(self) -> None:
+        self.stubber.add_response(
+            "get_item",
+            {"Item": {"username": {"S": "john"}, "version": {"N": "2"}}},
+            {"TableName": TABLE_NAME, "Key": {"username": {"S": "john"}}},
+        )
+        response = self._handle(
+            "GET", "/users/john", headers={"If-None-Match": 'W/"1", "2"'}
+        )
+        self.assertEqual(response["statusCode"], 304)
+        self.assertIsNone(response["body"])
+        self.assertEqual(response["headers"]["ETag"], '"2"')
+
+    def test_get_user_projection_etag(self) -> None:
+        self.stubber.add_response(
+            "get_item",
+            {"Item": {"username": {"S": "john"}, "version": {"N": "2"}}},
+            {
+                "TableName": TABLE_NAME,
+                "Key": {"username": {"S": "john"}},
+                "ProjectionExpression": "#p0, #p1, #p2",
+                "ExpressionAttributeNames": {
+                    "#p0": "username",
+                    "#p1": "email",
+                    "#p2": "version",
+                },
+            },
+        )
+        # The full representation's ETag does not match a projection of it
+        response = self._handle(
+            "GET",
+            "/users/john",
+            query_string_parameters={"fields": "email"},
+            headers={"If-None-Match": '"2"'},
+        )
+        self.assertEqual(response["statusCode"], 200)
+        entity_tag = response["headers"]["ETag"]
+        self.assertRegex(entity_tag, r'^"2-[0-9a-f]{16}"$')
+        self.stubber.add_client_error("delete_item", "ConditionalCheckFailedException")
+        response = self._handle(
+            "DELETE", "/users/john", headers={"If-Match": entity_tag}
+        )
+        self.assertEqual(response["statusCode"], 404)
+
+    def test_batch_write_users_conflict(self) -> None:
+        self.stubber.add_response("get_item", {})
+        self.stubber.add_client_error("put_item", "ConditionalCheckFailedException")
+        response = self._handle(
+            "POST", "/users:batchWrite", {"put": [{"username": "john"}]}
+        )
+        self.assertEqual(
+            json.loads(response["body"])["results"],
+            [{"username": "john", "status": "conflict", "user": None}],
+        )
+
+
+class AdmissionControlTestCase(StubbedDynamoDBTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        patcher = mock.patch.dict(
+            "helpers.os.environ",
+            {
+                "USERS_ADMISSION_CONTROL_ENABLED": "true",
+                "USERS_ADMISSION_READ_MAX_RATE": "2",
+            },
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_throttled_request_sheds_load(self) -> None:
+        self.stubber.add_client_error(
+            "get_item", "ProvisionedThroughputExceededException"
+        )
+        response = self._handle("GET", "/users/john")
+        self.assertEqual(response["statusCode"], 429)
+        self.assertEqual(response["headers"]["Retry-After"], "1")
+        # Shed without calling DynamoDB until the budget refills
+        response = self._handle("GET", "/users/john")
+        self.assertEqual(response["statusCode"], 429)
+        self.assertIn("retry later", json.loads(response["body"])["message"])
+
+    def test_writes_not_limited_by_reads(self) -> None:
+        self.stubber.add_client_error(
+            "get_item", "ProvisionedThroughputExceededException"
+        )
+        self._handle("GET", "/users/john")
+        self.stubber.add_response("delete_item", {})
+        response = self._handle("DELETE", "/users/john")
+        self.assertEqual(response["statusCode"], 200)
+
+
+class StatsTestCase(StubbedDynamoDBTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        lambda_function.helpers.get_stats_reader.cache_clear()
+        self.addCleanup(lambda_function.helpers.get_stats_reader.cache_clear)
+
+    def test_get_users_stats(self) -> None:
+        self.stubber.add_response(
+            "get_item",
+            {
+                "Item": {
+                    "id": {"S": "users"},
+                    "userCount": {"N": "3"},
+                    "count#country#US": {"N": "2"},
+                }
+            },
+            {"TableName": "AppTestCaseStats", "Key": {"id": {"S": "users"}}},
+        )
+        with mock.patch.dict(
+            "helpers.os.environ", {"STATS_TABLE_NAME": "AppTestCaseStats"}
+        ):
+            response = self._handle("GET", "/stats/users")
+        self.assertEqual(
+            {"user_count": 3, "counts": {"country": {"US": 2}}},
+            json.loads(response["body"]),
+        )
+
+    def test_get_users_stats_not_enabled(self) -> None:
+        response = self._handle("GET", "/stats/users")
+        self.assertEqual(response["statusCode"], 404)
+
+    def test_get_user_named_stats(self) -> None:
+        self.stubber.add_response(
+            "get_item",
+            {"Item": {"username": {"S": "stats"}}},
+            {"TableName": TABLE_NAME, "Key": {"username": {"S": "stats"}}},
+        )
+        response = self._handle("GET", "/users/stats")
+        self.assertEqual(json.loads(response["body"]), {"username": "stats"})
+
+
+class LargeAttributesTestCase(StubbedDynamoDBTestCase):
+    @mock.patch.dict("helpers.os.environ", {"DYNAMODB_COMPRESSION_THRESHOLD": "256"})
+    def test_marker_maps_rejected(self) -> None:
+        response = self._handle(
+            "POST", "/users", {"username": "john", "profile": {"$s3": "jane/a/0"}}
+        )
+        self.assertEqual(response["statusCode"], 400)
+        response = self._handle(
+            "POST",
+            "/users:batchWrite",
+            {"put": [{"username": "john", "profile": {"$zlib": "x"}}]},
+        )
+        self.assertEqual(response["statusCode"], 400)
+
+
+class EmailTestCase(StubbedDynamoDBTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        patcher = mock.patch.dict(
+            "helpers.os.environ", {"DYNAMODB_EMAIL_TABLE_NAME": EMAIL_TABLE_NAME}
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_create_user_claims_email(self) -> None:
+        self.stubber.add_response(
+            "transact_write_items",
+            {},
+            {
+                "TransactItems": [
+                    {
+                        "Put": {
+                            "TableName": TABLE_NAME,
+                            "Item": {
+                                "username": {"S": "john"},
+                                "email": {"S": "john@example.com"},
+                                "version": {"N": "1"},
+                            },
+                            "ConditionExpression": "attribute_not_exists(username)",
+                        }
+                    },
+                    {"Put": _email_claim("john@example.com", "john")},
+                ]
+            },
+        )
+        response = self._handle(
+            "POST", "/users", {"username": "john", "email": "john@example.com"}
+        )
+        self.assertEqual(response["statusCode"], 200)
+
+    def test_create_user_email_in_use(self) -> None:
+        self.stubber.add_client_error(
+            "transact_write_items",
+            "TransactionCanceledException",
+            modeled_fields={
+                "CancellationReasons": [
+                    {"Code": "None"},
+                    {"Code": "ConditionalCheckFailed"},
+                ]
+            },
+        )
+        response = self._handle(
+            "POST", "/users", {"username": "john", "email": "john@example.com"}
+        )
+        self.assertEqual(response["statusCode"], 400)
+        self.assertIn("john@example.com", json.loads(response["body"])["message"])
+
+    def test_update_user_moves_email_claim(self) -> None:
+        self._add_consistent_get_item(
+            {"username": {"S": "john"}, "email": {"S": "old@example.com"}}
+        )
+        self.stubber.add_response(
+            "transact_write_items",
+            {},
+            {
+                "TransactItems": [
+                    {"Update": stub.ANY},
+                    {"Put": _email_claim("new@example.com", "john")},
+                    {
+                        "Delete": {
+                            "TableName": EMAIL_TABLE_NAME,
+                            "Key": {"email": {"S": "old@example.com"}},
+                            **_email_claim_condition("john"),
+                        }
+                    },
+                ]
+            },
+        )
+        self._add_consistent_get_item(
+            {
+                "username": {"S": "john"},
+                "email": {"S": "new@example.com"},
+                "version": {"N": "1"},
+            }
+        )
+        response = self._handle("PUT", "/users/john", {"email": "new@example.com"})
+        self.assertEqual(response["headers"]["ETag"], '"1"')
+
+    def test_update_user_without_email_single_call(self) -> None:
+        self.stubber.add_response(
+            "update_item", {"Attributes": {"username": {"S": "john"}}}, None
+        )
+        response = self._handle("PUT", "/users/john", {"country": "US"})
+        self.assertEqual(response["statusCode"], 200)
+
+    def test_delete_user_releases_email_claim(self) -> None:
+        self._add_consistent_get_item(
+            {
+                "username": {"S": "john"},
+                "email": {"S": "john@example.com"},
+                "version": {"N": "2"},
+            }
+        )
+        self.stubber.add_response(
+            "transact_write_items",
+            {},
+            {
+                "TransactItems": [
+                    {
+                        "Delete": {
+                            "TableName": TABLE_NAME,
+                            "Key": {"username": {"S": "john"}},
+                            "ConditionExpression": (
+                                "attribute_exists(username) "
+                                "AND #version = :expected_version"
+                            ),
+                            "ExpressionAttributeNames": {"#version": "version"},
+                            "ExpressionAttributeValues": {
+                                ":expected_version": {"N": "2"}
+                            },
+                        }
+                    },
+                    {
+                        "Delete": {
+                            "TableName": EMAIL_TABLE_NAME,
+                            "Key": {"email": {"S": "john@example.com"}},
+                            **_email_claim_condition("john"),
+                        }
+                    },
+                ]
+            },
+        )
+        response = self._handle("DELETE", "/users/john")
+        self.assertEqual(response["statusCode"], 200)
+
+    def test_find_users_by_email(self) -> None:
+        self.stubber.add_response(
+            "query",
+            {
+                "Items": [
+                    {"username": {"S": "john"}, "email": {"S": "john@example.com"}}
+                ]
+            },
+            {
+                "TableName": TABLE_NAME,
+                "IndexName": "email",
+                "KeyConditionExpression": "#email = :email",
+                "ExpressionAttributeNames": {"#email": "email"},
+                "ExpressionAttributeValues": {":email": {"S": "john@example.com"}},
+            },
+        )
+        response = self._handle(
+            "GET", "/users", query_string_parameters={"email": "john@example.com"}
+        )
+        self.assertEqual(
+            json.loads(response["body"]),
+            {
+                "users": [{"username": "john", "email": "john@example.com"}],
+                "cursor": None,
+            },
+        )
+
+    @mock.patch.dict("helpers.os.environ", {"DYNAMODB_EMAIL_INDEX_ATTRIBUTES": ""})
+    def test_find_users_outside_projection(self) -> None:
+        self.stubber.add_response(
+            "query",
+            {"Items": [{"username": {"S": "john"}}]},
+            {
+                "TableName": TABLE_NAME,
+                "IndexName": "email",
+                "KeyConditionExpression": "#email = :email",
+                "ProjectionExpression": "#p0",
+                "ExpressionAttributeNames": {"#email": "email", "#p0": "username"},
+                "ExpressionAttributeValues": {":email": {"S": "john@example.com"}},
+            },
+        )
+        self.stubber.add_response(
+            "batch_get_item",
+            {
+                "Responses": {
+                    TABLE_NAME: [{"username": {"S": "john"}, "state": {"S": "WA"}}]
+                }
+            },
+            {
+                "RequestItems": {
+                    TABLE_NAME: {
+                        "Keys": [{"username": {"S": "john"}}],
+                        "ProjectionExpression": "#p0, #p1",
+                        "ExpressionAttributeNames": {"#p0": "username", "#p1": "state"},
+                    }
+                }
+            },
+        )
+        response = self._handle(
+            "GET",
+            "/users",
+            query_string_parameters={"email": "john@example.com", "fields": "state"},
+        )
+        self.assertEqual(
+            json.loads(response["body"])["users"], [{"username": "john", "state": "WA"}]
+        )
+
+    def test_batch_write_users_moves_email_claims(self) -> None:
+        self._add_consistent_get_item(
+            {
+                "username": {"S": "john"},
+                "email": {"S": "old@example.com"},
+                "version": {"N": "2"},
+            }
+        )
+        self.stubber.add_response(
+            "transact_write_items",
+            {},
+            {
+                "TransactItems": [
+                    {
+                        "Put": {
+                            "TableName": TABLE_NAME,
+                            "Item": stub.ANY,
+                            "ConditionExpression": (
+                                "attribute_exists(username) "
+                                "AND #version = :expected_version"
+                            ),
+                            "ExpressionAttributeNames": {"#version": "version"},
+                            "ExpressionAttributeValues": {
+                                ":expected_version": {"N": "2"}
+                            },
+                        }
+                    },
+                    {"Put": _email_claim("new@example.com", "john")},
+                    {
+                        "Delete": {
+                            "TableName": EMAIL_TABLE_NAME,
+                            "Key": {"email": {"S": "old@example.com"}},
+                            **_email_claim_condition("john"),
+                        }
+                    },
+                ]
+            },
+        )
+        response = self._handle(
+            "POST",
+            "/users:batchWrite",
+            {"put": [{"username": "john", "email": "new@example.com"}]},
+        )
+        self.assertEqual(json.loads(response["body"])["results"][0]["status"], "put")
+
+    def test_batch_write_users_releases_email_claims(self) -> None:
+        self.stubber.add_response(
+            "get_item",
+            {
+                "Item": {
+                    "username": {"S": "jane"},
+                    "email": {"S": "jane@example.com"},
+                }
+            },
+            {
+                "TableName": TABLE_NAME,
+                "Key": {"username": {"S": "jane"}},
+                "ConsistentRead": True,
+            },
+        )
+        self.stubber.add_response(
+            "transact_write_items",
+            {},
+            {
+                "TransactItems": [
+                    {"Delete": stub.ANY},
+                    {
+                        "Delete": {
+                            "TableName": EMAIL_TABLE_NAME,
+                            "Key": {"email": {"S": "jane@example.com"}},
+                            **_email_claim_condition("jane"),
+                        }
+                    },
+                ]
+            },
+        )
+        response = self._handle("POST", "/users:batchWrite", {"delete": ["jane"]})
+        self.assertEqual(
+            json.loads(response["body"])["results"],
+            [{"username": "jane", "status": "deleted", "user": None}],
+        )
+
+    def _add_consistent_get_item(self, item: Dict[str, Any]) -> None:
+        self.stubber.add_response(
+            "get_item",
+            {"Item": item},
+            {
+                "TableName": TABLE_NAME,
+                "Key": {"username": {"S": "john"}},
+                "ConsistentRead": True,
+            },
+        )
+
+
+def _email_claim(email: str, username: str) -> Dict[str, Any]:
+    return {
+        "TableName": EMAIL_TABLE_NAME,
+        "Item": {"email": {"S": email}, "username": {"S": username}},
+        **_email_claim_condition(username),
+    }
+
+
+def _email_claim_condition(username: str) -> Dict[str, Any]:
+    return {
+        "ConditionExpression": "attribute_not_exists(#email) OR username = :username",
+        "ExpressionAttributeNames": {"#email": "email"},
+        "ExpressionAttributeValues": {":username": {"S": username}},
+    }
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,345 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import decimal
+import io
+import unittest
+from typing import Any, Dict, List, Optional
+from unittest import mock
+
+from backend.api.runtime import large_attributes
+from backend.api.runtime import marshalling
+from backend.api.runtime import users
+
+BUCKET_NAME = "attributes"
+TABLE_NAME = "DynamoDBDatabaseTestCase"
+COMPRESSION_THRESHOLD = 256
+OFFLOAD_THRESHOLD = 1024
+# Compresses well below the offload threshold
+PREFERENCES = {"theme": "dark", "history": ["page"] * 200}
+# Random-looking, still too large once compressed
+PROFILE = "".join(f"{index * 7919 % 10007:05d}" for index in range(2000))
+
+
+class FakeS3:
+    """Object store standing in for the attributes bucket."""
+
+    def __init__(self) -> None:
+        self.objects: Dict[str, bytes] = {}
+        self.gets: List[str] = []
+
+    def put_object(self, Bucket: str, Key: str, Body: bytes) -> None:
+        # pylint: disable=invalid-name
+        assert Bucket == BUCKET_NAME  # nosec
+        self.objects[Key] = Body
+
+    def get_object(self, Bucket: str, Key: str) -> Dict[str, Any]:
+        # pylint: disable=invalid-name
+        assert Bucket == BUCKET_NAME  # nosec
+        self.gets.append(Key)
+        return {"Body": io.BytesIO(self.objects[Key])}
+
+    def delete_objects(self, Bucket: str, Delete: Dict[str, Any]) -> None:
+        # pylint: disable=invalid-name
+        assert Bucket == BUCKET_NAME  # nosec
+        for deleted_object in Delete["Objects"]:
+            self.objects.pop(deleted_object["Key"], None)
+
+
+class FakeDynamoDB:
+    """PutItem, GetItem with projections and DeleteItem on serialized items.
+
+    Transactions write the users table unconditionally, email claims always
+    succeed.
+    """
+
+    def __init__(self) -> None:
+        self.items: Dict[str, Dict[str, Any]] = {}
+
+    def put_item(
+        self, TableName: str, Item: Dict[str, Any], ReturnValues: str = "NONE", **_: Any
+    ) -> Dict[str, Any]:
+        # pylint: disable=invalid-name,unused-argument
+        replaced_item = self.items.get(Item["username"]["S"])
+        self.items[Item["username"]["S"]] = Item
+        if replaced_item is None or ReturnValues != "ALL_OLD":
+            return {}
+        return {"Attributes": replaced_item}
+
+    def get_item(
+        self,
+        TableName: str,
+        Key: Dict[str, Any],
+        ExpressionAttributeNames: Optional[Dict[str, str]] = None,
+        **_: Any,
+    ) -> Dict[str, Any]:
+        # pylint: disable=invalid-name,unused-argument
+        item = self.items.get(Key["username"]["S"])
+        if item is None:
+            return {}
+        if ExpressionAttributeNames is not None:
+            projected = set(ExpressionAttributeNames.values())
+            item = {name: value for name, value in item.items() if name in projected}
+        return {"Item": item}
+
+    def delete_item(
+        self, TableName: str, Key: Dict[str, Any], ReturnValues: str = "NONE", **_: Any
+    ) -> Dict[str, Any]:
+        # pylint: disable=invalid-name,unused-argument
+        item = self.items.pop(Key["username"]["S"])
+        return {"Attributes": item} if ReturnValues == "ALL_OLD" else {}
+
+    def transact_write_items(self, TransactItems: List[Dict[str, Any]]) -> None:
+        # pylint: disable=invalid-name
+        for transact_item in TransactItems:
+            if transact_item.get("Put", {}).get("TableName") == TABLE_NAME:
+                self.put_item(**transact_item["Put"])
+            if transact_item.get("Delete", {}).get("TableName") == TABLE_NAME:
+                self.delete_item(**transact_item["Delete"])
+
+
+def create_large_attributes(
+    s3: FakeS3, bucket_name: Optional[str] = BUCKET_NAME
+) -> large_attributes.LargeAttributes:
+    with mock.patch("large_attributes.boto3.client", return_value=s3):
+        return large_attributes.LargeAttributes(
+            compression_threshold_bytes=COMPRESSION_THRESHOLD,
+            offload_threshold_bytes=OFFLOAD_THRESHOLD,
+            bucket_name=bucket_name,
+            plain_attributes=frozenset({"username", "version"}),
+        )
+
+
+def round_trip(
+    store: large_attributes.LargeAttributes, attributes: Dict[str, Any]
+) -> Dict[str, Any]:
+    # Through DynamoDB JSON, as the table would return the item
+    encoded = store.encode_attributes("john", attributes)
+    item = marshalling.serialize_item(dict(encoded, username="john"))
+    decoded = store.decode_item(marshalling.deserialize_item(item))
+    del decoded["username"]
+    return decoded
+
+
+class LargeAttributesTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.s3 = FakeS3()
+        self.store = create_large_attributes(self.s3)
+
+    def test_small_values_unchanged(self) -> None:
+        attributes = {"country": "SE", "age": 42, "tags": {"a", "b"}}
+        self.assertEqual(self.store.encode_attributes("john", attributes), attributes)
+
+    def test_compressed_round_trip(self) -> None:
+        encoded = self.store.encode_attributes("john", {"preferences": PREFERENCES})
+        self.assertIn(large_attributes.COMPRESSED_KEY, encoded["preferences"])
+        self.assertEqual(
+            round_trip(self.store, {"preferences": PREFERENCES}),
+            {"preferences": PREFERENCES},
+        )
+        self.assertEqual(self.s3.objects, {})
+
+    def test_types_preserved(self) -> None:
+        attributes = {
+            "scores": {"total": decimal.Decimal("1.5"), "history": list(range(200))},
+            "badges": {f"badge{index}" for index in range(50)},
+        }
+        self.assertEqual(round_trip(self.store, attributes), attributes)
+
+    def test_offloaded_round_trip(self) -> None:
+        encoded = self.store.encode_attributes("john", {"profile": PROFILE})
+        key = encoded["profile"][large_attributes.OFFLOADED_KEY].decode()
+        self.assertTrue(key.startswith("john/profile/"))
+        self.assertEqual(list(self.s3.objects), [key])
+        self.assertEqual(
+            round_trip(self.store, {"profile": PROFILE}), {"profile": PROFILE}
+        )
+
+    def test_plain_attributes_unchanged(self) -> None:
+        encoded = self.store.encode_attributes("john", {"username": PROFILE})
+        self.assertEqual(encoded, {"username": PROFILE})
+
+    def test_compressed_without_bucket(self) -> None:
+        store = create_large_attributes(self.s3, bucket_name=None)
+        encoded = store.encode_attributes("john", {"profile": PROFILE})
+        self.assertIn(large_attributes.COMPRESSED_KEY, encoded["profile"])
+        self.assertEqual(round_trip(store, {"profile": PROFILE}), {"profile": PROFILE})
+        self.assertEqual(self.s3.objects, {})
+
+    def test_delete_offloaded(self) -> None:
+        encoded = self.store.encode_attributes(
+            "john", {"profile": PROFILE, "preferences": PREFERENCES}
+        )
+        self.store.delete_offloaded(dict(encoded, username="john"))
+        self.assertEqual(self.s3.objects, {})
+
+    def test_delete_offloaded_keeps_replacement_objects(self) -> None:
+        item = dict(
+            self.store.encode_attributes("john", {"profile": PROFILE}),
+            username="john",
+        )
+        self.store.delete_offloaded(item, dict(item))
+        self.assertEqual(len(self.s3.objects), 1)
+        self.store.delete_offloaded(item, {"username": "john", "profile": "short"})
+        self.assertEqual(self.s3.objects, {})
+
+    def test_marker_keys_rejected(self) -> None:
+        for value in [{"$zlib": "x"}, {"$s3": "jane/profile/0", "other": 1}]:
+            with self.assertRaises(ValueError):
+                self.store.encode_attributes("john", {"profile": value})
+
+    def test_unencoded_marker_maps_read_as_is(self) -> None:
+        item = {"username": "john", "profile": {"$s3": "jane/profile/0"}}
+        self.assertEqual(self.store.decode_item(item), item)
+        self.store.delete_offloaded(item)
+        self.assertEqual(self.s3.gets, [])
+
+    def test_other_users_objects_not_read_or_deleted(self) -> None:
+        encoded = self.store.encode_attributes("jane", {"profile": PROFILE})
+        item = dict(encoded, username="john")
+        with self.assertRaises(ValueError):
+            self.store.decode_item(item)
+        self.store.delete_offloaded(item)
+        self.assertEqual(self.s3.gets, [])
+        self.assertEqual(len(self.s3.objects), 1)
+
+
+class DynamoDBDatabaseTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.s3 = FakeS3()
+        self.dynamodb = FakeDynamoDB()
+        with mock.patch("users.boto3.client", return_value=self.dynamodb):
+            self.database = users.DynamoDBDatabase(
+                TABLE_NAME,
+                large_attribute_store=create_large_attributes(self.s3),
+            )
+        self.database.create_user(
+            "john", {"country": "SE", "preferences": PREFERENCES, "profile": PROFILE}
+        )
+
+    def test_get_user_round_trip(self) -> None:
+        self.assertEqual(
+            self.database.get_user("john"),
+            {
+                "username": "john",
+                "country": "SE",
+                "preferences": PREFERENCES,
+                "profile": PROFILE,
+                "version": 1,
+            },
+        )
+        self.assertEqual(len(self.s3.gets), 1)
+
+    def test_get_user_fields_skip_offloaded(self) -> None:
+        self.assertEqual(
+            self.database.get_user("john", ["country", "preferences"]),
+            {"username": "john", "country": "SE", "preferences": PREFERENCES},
+        )
+        self.assertEqual(self.s3.gets, [])
+
+    def test_stored_item_encoded(self) -> None:
+        item = marshalling.deserialize_item(self.dynamodb.items["john"])
+        self.assertEqual(item["country"], "SE")
+        self.assertIn(large_attributes.COMPRESSED_KEY, item["preferences"])
+        self.assertIn(large_attributes.OFFLOADED_KEY, item["profile"])
+
+    def test_update_user_encodes_set_values(self) -> None:
+        update_item = mock.Mock(return_value={"Attributes": {}})
+        with mock.patch.object(self.dynamodb, "update_item", update_item, create=True):
+            self.database.update_user("john", {"preferences": PREFERENCES})
+        values = update_item.call_args.kwargs["ExpressionAttributeValues"]
+        self.assertTrue(
+            any(
+                large_attributes.COMPRESSED_KEY in value.get("M", {})
+                for value in values.values()
+            )
+        )
+
+    def test_delete_user_deletes_offloaded(self) -> None:
+        self.database.delete_user("john")
+        self.assertEqual(self.dynamodb.items, {})
+        self.assertEqual(self.s3.objects, {})
+
+    def test_update_user_deletes_replaced_offloaded(self) -> None:
+        def update_item(**kwargs: Any) -> Dict[str, Any]:
+            # Sets the profile, the only map among the update's values
+            (profile,) = [
+                value
+                for value in kwargs["ExpressionAttributeValues"].values()
+                if "M" in value
+            ]
+            replaced_item = self.dynamodb.items["john"]
+            self.dynamodb.items["john"] = dict(replaced_item, profile=profile)
+            return {"Attributes": {"profile": replaced_item["profile"]}}
+
+        with mock.patch.object(
+            self.dynamodb, "update_item", side_effect=update_item, create=True
+        ) as mock_update_item:
+            user = self.database.update_user("john", {"profile": PROFILE[::-1]})
+        self.assertEqual(
+            mock_update_item.call_args.kwargs["ReturnValues"], "UPDATED_OLD"
+        )
+        self.assertEqual(user["profile"], PROFILE[::-1])
+        self.assertEqual(len(self.s3.objects), 1)
+
+    def test_update_user_keeps_unchanged_offloaded(self) -> None:
+        update_item = mock.Mock(return_value={"Attributes": {"country": {"S": "SE"}}})
+        with mock.patch.object(self.dynamodb, "update_item", update_item, create=True):
+            user = self.database.update_user("john", {"country": "NO"})
+        self.assertEqual(user["profile"], PROFILE)
+        self.assertEqual(len(self.s3.objects), 1)
+
+    def test_batch_put_deletes_replaced_offloaded(self) -> None:
+        results = self.database.batch_write_users(
+            {"john": {"profile": PROFILE[::-1]}}, []
+        )
+        self.assertEqual(results[0].status, users.BatchItemStatus.PUT)
+        self.assertEqual(len(self.s3.objects), 1)
+        self.assertEqual(self.database.get_user("john")["profile"], PROFILE[::-1])
+
+    def test_batch_delete_deletes_offloaded(self) -> None:
+        results = self.database.batch_write_users({}, ["john"])
+        self.assertEqual(results[0].status, users.BatchItemStatus.DELETED)
+        self.assertEqual(self.s3.objects, {})
+
+
+class EmailClaimsTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.s3 = FakeS3()
+        self.dynamodb = FakeDynamoDB()
+        with mock.patch("users.boto3.client", return_value=self.dynamodb):
+            self.database = users.DynamoDBDatabase(
+                TABLE_NAME,
+                email_index=users.EmailIndex(claims_table_name="Emails"),
+                large_attribute_store=create_large_attributes(self.s3),
+            )
+
+    def test_batch_put_identical_user_keeps_offloaded(self) -> None:
+        user_attributes = {"email": "john@example.com", "profile": PROFILE}
+        for _ in range(2):
+            self.database.batch_write_users({"john": user_attributes}, [])
+        self.assertEqual(len(self.s3.objects), 1)
+        user = self.database.get_user("john", ["email", "profile"])
+        self.assertEqual(user, dict(user_attributes, username="john"))
+
+    def test_batch_put_changed_user_deletes_replaced(self) -> None:
+        self.database.batch_write_users({"john": {"profile": PROFILE}}, [])
+        self.database.batch_write_users({"john": {"profile": PROFILE[::-1]}}, [])
+        self.assertEqual(len(self.s3.objects), 1)
+        self.assertEqual(self.database.get_user("john")["profile"], PROFILE[::-1])
+
+
+if __name__ == "__main__":
+    unittest.main()
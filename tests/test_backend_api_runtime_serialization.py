@@ -0,0 +1,111 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import decimal
+import json
+import unittest
+from unittest import mock
+
+from backend.api.runtime import serialization
+
+USER = {
+    "username": "john",
+    "version": decimal.Decimal("3"),
+    "score": decimal.Decimal("4.25"),
+    "large": decimal.Decimal("12345678901234567890123456789012345678"),
+    "tags": {"b", "a"},
+    "lucky_numbers": {decimal.Decimal("7"), decimal.Decimal("3")},
+    "address": {"zip": decimal.Decimal("98101"), "lines": ["1 Main St"]},
+}
+
+
+class SerializerTestCase(unittest.TestCase):
+    serializer: serialization.JsonSerializer
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.serializer = serialization.StandardJsonSerializer()
+
+    def test_dumps_dynamodb_types(self) -> None:
+        self.assertEqual(
+            {
+                "username": "john",
+                "version": 3,
+                "score": 4.25,
+                "large": 12345678901234567890123456789012345678,
+                "tags": ["a", "b"],
+                "lucky_numbers": [3, 7],
+                "address": {"zip": 98101, "lines": ["1 Main St"]},
+            },
+            json.loads(self.serializer.dumps(USER)),
+        )
+
+    def test_dumps_compact(self) -> None:
+        self.assertEqual('{"a":[1,2]}', self.serializer.dumps({"a": [1, 2]}))
+
+    def test_dumps_unsupported_type(self) -> None:
+        with self.assertRaises(TypeError):
+            self.serializer.dumps({"a": object()})
+
+    def test_loads_numbers(self) -> None:
+        body = self.serializer.loads(
+            '{"version":3,"score":0.1,"ratio":[2.5e-3],'
+            '"large":12345678901234567890123456789012345678}'
+        )
+        self.assertEqual(
+            {
+                "version": 3,
+                "score": decimal.Decimal("0.1"),
+                "ratio": [decimal.Decimal("0.0025")],
+                "large": 12345678901234567890123456789012345678,
+            },
+            body,
+        )
+        self.assertIsInstance(body["score"], decimal.Decimal)
+
+    def test_loads_invalid_document(self) -> None:
+        with self.assertRaises(json.JSONDecodeError):
+            self.serializer.loads('{"username":')
+
+
+class OrjsonSerializerTestCase(SerializerTestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.serializer = serialization.OrjsonSerializer()
+
+
+class CreateSerializerTestCase(unittest.TestCase):
+    def test_orjson(self) -> None:
+        self.assertIsInstance(
+            serialization.create_serializer("orjson"),
+            serialization.OrjsonSerializer,
+        )
+
+    def test_json(self) -> None:
+        self.assertIsInstance(
+            serialization.create_serializer("json"),
+            serialization.StandardJsonSerializer,
+        )
+        self.assertNotIsInstance(
+            serialization.create_serializer("json"),
+            serialization.OrjsonSerializer,
+        )
+
+    @mock.patch.dict("sys.modules", {"orjson": None})
+    def test_orjson_not_installed(self) -> None:
+        self.assertNotIsInstance(
+            serialization.create_serializer("orjson"),
+            serialization.OrjsonSerializer,
+        )
@@ -0,0 +1,242 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import decimal
+import unittest
+from typing import Any, Dict, List, Optional, Sequence
+from unittest import mock
+
+from botocore import exceptions
+
+from backend.api.runtime import marshalling
+from backend.api.runtime import stats
+
+COUNTED_VALUES = {"country": {"DE", "FR", "US"}, "plan": {"free", "pro"}}
+
+
+class FakeStatsTable:
+    """TransactWriteItems on a table of markers and the summary item."""
+
+    def __init__(self, fail_with: Optional[str] = None):
+        self.items: Dict[str, Dict[str, Any]] = {}
+        self.transactions = 0
+        self._fail_with = fail_with
+
+    def transact_write_items(self, TransactItems: List[Dict[str, Any]]) -> None:
+        # pylint: disable=invalid-name
+        self.transactions += 1
+        reasons = [self._check(transact_item) for transact_item in TransactItems]
+        if any(reason["Code"] != "None" for reason in reasons):
+            raise exceptions.ClientError(
+                {
+                    "Error": {"Code": "TransactionCanceledException"},
+                    "CancellationReasons": reasons,
+                },
+                "TransactWriteItems",
+            )
+        for transact_item in TransactItems:
+            self._write(transact_item)
+
+    @property
+    def summary(self) -> Dict[str, Any]:
+        return self.items.get(stats.SUMMARY_ID, {})
+
+    def _check(self, transact_item: Dict[str, Any]) -> Dict[str, str]:
+        if self._fail_with is not None:
+            return {"Code": self._fail_with}
+        if "Put" in transact_item:
+            item = marshalling.deserialize_item(transact_item["Put"]["Item"])
+            if item["id"] in self.items:
+                return {"Code": "ConditionalCheckFailed"}
+        return {"Code": "None"}
+
+    def _write(self, transact_item: Dict[str, Any]) -> None:
+        if "Put" in transact_item:
+            item = marshalling.deserialize_item(transact_item["Put"]["Item"])
+            self.items[item["id"]] = item
+            return
+        update = transact_item["Update"]
+        names = update["ExpressionAttributeNames"]
+        values = marshalling.deserialize_item(update["ExpressionAttributeValues"])
+        summary = self.items.setdefault(stats.SUMMARY_ID, {"id": stats.SUMMARY_ID})
+        for action in update["UpdateExpression"].removeprefix("ADD ").split(", "):
+            name, value = action.split(" ")
+            summary[names[name]] = summary.get(names[name], 0) + values[value]
+
+
+def stream_record(
+    event_id: str,
+    old_user: Optional[Dict[str, Any]] = None,
+    new_user: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    images = {}
+    if old_user is not None:
+        images["OldImage"] = marshalling.serialize_item(old_user)
+    if new_user is not None:
+        images["NewImage"] = marshalling.serialize_item(new_user)
+    return {"eventID": event_id, "dynamodb": images}
+
+
+class StatsAggregatorTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.table = FakeStatsTable()
+        self.aggregator = self._create_aggregator(self.table)
+
+    @staticmethod
+    def _create_aggregator(table: FakeStatsTable) -> stats.StatsAggregator:
+        with mock.patch("stats.boto3.client", return_value=table):
+            return stats.StatsAggregator(
+                "StatsAggregatorTestCase",
+                counted_values=COUNTED_VALUES,
+                clock=lambda: 1000.0,
+            )
+
+    def _apply(self, records: Sequence[Dict[str, Any]]) -> None:
+        self.aggregator.apply(records)
+
+    def test_batch_in_one_transaction(self) -> None:
+        self._apply(
+            [
+                stream_record("1", new_user={"username": "john", "country": "US"}),
+                stream_record("2", new_user={"username": "jane", "country": "FR"}),
+                stream_record(
+                    "3",
+                    old_user={"username": "john", "country": "US"},
+                    new_user={"username": "john", "country": "DE", "plan": "pro"},
+                ),
+            ]
+        )
+        self.assertEqual(1, self.table.transactions)
+        self.assertEqual(
+            {
+                "id": "users",
+                "userCount": 2,
+                "count#country#FR": 1,
+                "count#country#DE": 1,
+                "count#plan#pro": 1,
+            },
+            self.table.summary,
+        )
+        self.assertEqual(
+            {"id": "event#1", "expiresAt": 1000 + stats.EVENT_MARKER_TTL_SECONDS},
+            self.table.items["event#1"],
+        )
+
+    def test_retried_batch_counted_once(self) -> None:
+        records = [
+            stream_record("1", new_user={"username": "john", "country": "US"}),
+            stream_record("2", new_user={"username": "jane", "country": "US"}),
+        ]
+        self._apply(records[:1])
+        # Retried with more records than the batch counted before
+        self._apply(records)
+        self._apply(records)
+        self.assertEqual(
+            {"id": "users", "userCount": 2, "count#country#US": 2},
+            self.table.summary,
+        )
+
+    def test_changes_cancelling_out(self) -> None:
+        self._apply([stream_record("1", new_user={"username": "john"})])
+        self._apply(
+            [
+                stream_record("1", new_user={"username": "john"}),
+                stream_record("2", old_user={"username": "john"}),
+            ]
+        )
+        self.assertEqual(0, self.table.summary["userCount"])
+
+    def test_unchanged_counts_not_written(self) -> None:
+        self._apply(
+            [
+                stream_record(
+                    "1",
+                    old_user={"username": "john", "country": "US", "version": 1},
+                    new_user={"username": "john", "country": "US", "version": 2},
+                )
+            ]
+        )
+        self.assertEqual(0, self.table.transactions)
+
+    def test_large_batch_split_into_transactions(self) -> None:
+        self._apply(
+            [
+                stream_record(str(index), new_user={"username": f"user{index}"})
+                for index in range(stats.MAX_TRANSACTION_RECORDS + 1)
+            ]
+        )
+        self.assertEqual(2, self.table.transactions)
+        self.assertEqual(100, self.table.summary["userCount"])
+
+    def test_other_cancellations_raised(self) -> None:
+        self.aggregator = self._create_aggregator(
+            FakeStatsTable(fail_with="TransactionConflict")
+        )
+        with self.assertRaises(exceptions.ClientError):
+            self._apply([stream_record("1", new_user={"username": "john"})])
+
+
+class RecordDeltasTestCase(unittest.TestCase):
+    def test_removal(self) -> None:
+        self.assertEqual(
+            {"userCount": -1, "count#plan#free": -1},
+            stats.record_deltas(
+                stream_record("1", old_user={"username": "john", "plan": "free"}),
+                COUNTED_VALUES,
+            ),
+        )
+
+    def test_non_string_values_not_counted(self) -> None:
+        self.assertEqual(
+            {"userCount": 1},
+            stats.record_deltas(
+                stream_record(
+                    "1", new_user={"username": "john", "plan": decimal.Decimal(3)}
+                ),
+                COUNTED_VALUES,
+            ),
+        )
+
+    def test_values_outside_allowlist_counted_together(self) -> None:
+        self.assertEqual(
+            {"count#country#*": 1, "count#country#US": -1},
+            stats.record_deltas(
+                stream_record(
+                    "1",
+                    old_user={"username": "john", "country": "US"},
+                    new_user={"username": "john", "country": "x" * 1000},
+                ),
+                COUNTED_VALUES,
+            ),
+        )
+
+
+class ParseSummaryTestCase(unittest.TestCase):
+    def test_parse_summary(self) -> None:
+        self.assertEqual(
+            stats.UsersStats(user_count=3, counts={"country": {"US": 2, "C#D": 1}}),
+            stats.parse_summary(
+                {
+                    "id": "users",
+                    "userCount": decimal.Decimal(3),
+                    "count#country#US": decimal.Decimal(2),
+                    "count#country#C#D": decimal.Decimal(1),
+                    "count#country#FR": decimal.Decimal(0),
+                }
+            ),
+        )
+
+    def test_parse_missing_summary(self) -> None:
+        self.assertEqual(stats.UsersStats(), stats.parse_summary({}))
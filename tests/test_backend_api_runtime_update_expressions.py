@@ -0,0 +1,65 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import unittest
+
+from backend.api.runtime import update_expressions
+
+
+class UpdateExpressionsTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        update_expressions.compile_update.cache_clear()
+
+    def test_build_update_expression(self) -> None:
+        update_expression = update_expressions.build_update_expression(
+            set_attributes={"state": "WA"},
+            set_attributes_if_not_exists={"created": "2024-01-01"},
+            remove_attributes=["country"],
+            add_values={"logins": 1},
+        )
+        self.assertEqual(
+            update_expression,
+            update_expressions.UpdateExpression(
+                "SET #n0 = :v0, #n1 = if_not_exists(#n1, :v1) "
+                "REMOVE #n2 ADD #n3 :v2",
+                {
+                    "#username": "username",
+                    "#n0": "state",
+                    "#n1": "created",
+                    "#n2": "country",
+                    "#n3": "logins",
+                },
+                {":v0": "WA", ":v1": "2024-01-01", ":v2": 1},
+            ),
+        )
+
+    def test_same_shape_compiled_once(self) -> None:
+        for state in ["WA", "CA"]:
+            update_expressions.build_update_expression(
+                set_attributes={"state": state},
+                set_attributes_if_not_exists={},
+                remove_attributes=[],
+                add_values={},
+            )
+        cache_info = update_expressions.compile_update.cache_info()
+        self.assertEqual((cache_info.hits, cache_info.misses), (1, 1))
+
+    def test_attribute_changed_twice(self) -> None:
+        with self.assertRaises(ValueError):
+            update_expressions.compile_update((("state",), (), ("state",), ()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,207 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import math
+import unittest
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+from unittest import mock
+
+from botocore import exceptions
+
+from backend.api.runtime import in_memory
+from backend.api.runtime import users
+
+
+def _scan_segment(
+    _: users.DynamoDBDatabase, segment: int, total_segments: int
+) -> Iterator[List[Dict[str, Any]]]:
+    for page in range(3):
+        yield [
+            {"username": f"user{segment}-{page}-{index}"}
+            for index in range(total_segments)
+        ]
+
+
+class DynamoDBDatabaseTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        patcher = mock.patch("users.boto3.client")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.dynamodb_database = users.DynamoDBDatabase("DynamoDBDatabaseTestCase")
+
+    @mock.patch.object(users.DynamoDBDatabase, "_scan_segment", _scan_segment)
+    def test_iter_users_parallel_scan(self) -> None:
+        usernames = sorted(
+            user["username"]
+            for user in self.dynamodb_database.iter_users(total_segments=4)
+        )
+        self.assertEqual(
+            usernames,
+            sorted(
+                f"user{segment}-{page}-{index}"
+                for segment in range(4)
+                for page in range(3)
+                for index in range(4)
+            ),
+        )
+
+    @mock.patch.object(users.DynamoDBDatabase, "_scan_segment", _scan_segment)
+    def test_iter_users_stops_early(self) -> None:
+        user_iterator = self.dynamodb_database.iter_users(total_segments=2)
+        self.assertIn("username", next(user_iterator))
+        user_iterator.close()  # type: ignore
+
+    def test_cursor_round_trip(self) -> None:
+        last_evaluated_key = {"username": "john"}
+        cursor = users.encode_cursor(last_evaluated_key)
+        self.assertEqual(users.decode_cursor(cursor), last_evaluated_key)
+
+    def test_decode_cursor_rejects_other_keys(self) -> None:
+        for last_evaluated_key in [
+            {},
+            {"username": 1},
+            {"username": {"S": "john"}},
+            {"username": "john", "email": "john@example.com"},
+        ]:
+            cursor = users.encode_cursor(last_evaluated_key)
+            with self.assertRaises(ValueError):
+                users.decode_cursor(cursor)
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+
+class ThrottlingDatabase(in_memory.InMemoryDatabase):
+    """Throttles every call from throttled_from until throttled_until."""
+
+    def __init__(self, clock: Callable[[], float]):
+        super().__init__()
+        self.calls = 0
+        self.throttled_from = math.inf
+        self.throttled_until = math.inf
+        self._clock = clock
+
+    def get_user(
+        self, username: str, fields: Optional[Sequence[str]] = None
+    ) -> Optional[Dict[str, Any]]:
+        self._call()
+        return super().get_user(username, fields)
+
+    def create_user(
+        self, username: str, user_attributes: Dict[str, str]
+    ) -> Dict[str, Any]:
+        self._call()
+        return super().create_user(username, user_attributes)
+
+    def _call(self) -> None:
+        self.calls += 1
+        if self.throttled_from <= self._clock() < self.throttled_until:
+            raise exceptions.ClientError(
+                {"Error": {"Code": "ProvisionedThroughputExceededException"}},
+                "GetItem",
+            )
+
+
+class AdmissionControlTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.now = 0.0
+        self.database = ThrottlingDatabase(lambda: self.now)
+        self.read_budget = users.AdaptiveTokenBucket(
+            max_rate=10, min_rate=1, recovery_rate=2, clock=lambda: self.now
+        )
+        self.write_budget = users.AdaptiveTokenBucket(
+            max_rate=2, clock=lambda: self.now
+        )
+        self.users_repository = users.UsersRepository(
+            database=self.database,
+            read_budget=self.read_budget,
+            write_budget=self.write_budget,
+        )
+
+    def test_budget_exhausted(self) -> None:
+        self.users_repository.create_user("john", {})
+        self.users_repository.create_user("jane", {})
+        with self.assertRaises(users.RateLimitExceededError) as context:
+            self.users_repository.create_user("jack", {})
+        self.assertAlmostEqual(0.5, context.exception.retry_after_seconds)
+        self.assertEqual(2, self.database.calls)
+        # Reads are admitted from their own budget
+        self.assertIsNotNone(self.users_repository.get_user("john"))
+        self.now = 0.5
+        self.users_repository.create_user("jack", {})
+
+    def test_throttling_sheds_load_until_recovered(self) -> None:
+        self.database.throttled_from = 1
+        self.database.throttled_until = 2
+        self.now = 1
+        with self.assertRaises(users.RateLimitExceededError) as context:
+            self.users_repository.get_user("john")
+        self.assertEqual(5, self.read_budget.rate)
+        self.assertAlmostEqual(0.2, context.exception.retry_after_seconds)
+        # Shed without calling the throttling table
+        with self.assertRaises(users.RateLimitExceededError):
+            self.users_repository.get_user("john")
+        self.assertEqual(1, self.database.calls)
+        # Every throttled call that was admitted halves the rate
+        self.now = 1.2
+        with self.assertRaises(users.RateLimitExceededError):
+            self.users_repository.get_user("john")
+        self.assertAlmostEqual(2.7, self.read_budget.rate)
+        self.now = 2
+        self.assertIsNone(self.users_repository.get_user("john"))
+        self.assertAlmostEqual(4.3, self.read_budget.rate)
+        # The rate recovers linearly up to the maximum without throttling
+        self.now = 10
+        self.users_repository.get_user("john")
+        self.assertEqual(10, self.read_budget.rate)
+        self.assertEqual(4, self.database.calls)
+
+    def test_rate_not_below_minimum(self) -> None:
+        budget = users.AdaptiveTokenBucket(
+            max_rate=10, min_rate=4, recovery_rate=0, clock=lambda: self.now
+        )
+        self.assertEqual(0.2, budget.record_throttle())
+        self.assertEqual(0.25, budget.record_throttle())
+        self.assertEqual(4, budget.rate)
+
+    def test_other_errors_propagate(self) -> None:
+        self.users_repository.create_user("john", {})
+        with self.assertRaises(in_memory.users.UserAlreadyExistsError):
+            self.users_repository.create_user("john", {})
+        self.assertEqual(2, self.write_budget.rate)
+
+    def test_is_throttling_error(self) -> None:
+        self.assertTrue(
+            users.is_throttling_error(
+                exceptions.ClientError(
+                    {
+                        "Error": {"Code": "TransactionCanceledException"},
+                        "CancellationReasons": [
+                            {"Code": "None"},
+                            {"Code": "ThrottlingError"},
+                        ],
+                    },
+                    "TransactWriteItems",
+                )
+            )
+        )
+        self.assertFalse(
+            users.is_throttling_error(
+                exceptions.ClientError(
+                    {"Error": {"Code": "ValidationException"}}, "GetItem"
+                )
+            )
+        )
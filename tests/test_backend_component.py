@@ -0,0 +1,530 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import dataclasses
+import json
+import unittest
+from typing import Optional
+
+import aws_cdk as cdk
+import aws_cdk.aws_dynamodb as dynamodb
+from aws_cdk import assertions
+
+from backend.api.infrastructure import AdmissionControlSettings
+from backend.api.infrastructure import APISettings
+from backend.api.infrastructure import InstrumentationSettings
+from backend.api.infrastructure import PerformanceProfile
+from backend.component import Backend
+from backend.component import BackendSettings
+from backend.database.infrastructure import DatabaseSettings
+from backend.database.infrastructure import DaxSettings
+from backend.database.infrastructure import EmailIndexSettings
+from backend.database.infrastructure import GlobalTableSettings
+from backend.database.infrastructure import LargeAttributeSettings
+from backend.stats.infrastructure import StatsSettings
+
+API_SETTINGS = APISettings(lambda_reserved_concurrency=1)
+DATABASE_SETTINGS = DatabaseSettings(
+    dynamodb_billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST
+)
+
+
+def synthesize_backend(
+    *,
+    api_settings: APISettings = API_SETTINGS,
+    database_settings: DatabaseSettings = DATABASE_SETTINGS,
+    stats_settings: StatsSettings = StatsSettings(),
+    env: Optional[cdk.Environment] = None,
+) -> assertions.Template:
+    # Bundling is covered by the API tests and needs Docker
+    app = cdk.App(context={"aws:cdk:bundling-stacks": []})
+    backend = Backend(
+        app,
+        "Backend",
+        env=env,
+        settings=BackendSettings(
+            api=api_settings, database=database_settings, stats=stats_settings
+        ),
+    )
+    return assertions.Template.from_stack(backend)
+
+
+class DaxTestCase(unittest.TestCase):
+    def test_without_dax(self) -> None:
+        template = synthesize_backend()
+        template.resource_count_is("AWS::DAX::Cluster", 0)
+        template.resource_count_is("AWS::EC2::VPC", 0)
+
+    def test_dax_cluster(self) -> None:
+        template = synthesize_backend(
+            database_settings=dataclasses.replace(
+                DATABASE_SETTINGS,
+                dax=DaxSettings(node_type="dax.r5.large", node_count=2),
+            )
+        )
+        template.has_resource_properties(
+            "AWS::DAX::Cluster",
+            {
+                "NodeType": "dax.r5.large",
+                "ReplicationFactor": 2,
+                "ClusterEndpointEncryptionType": "TLS",
+                "SSESpecification": {"SSEEnabled": True},
+            },
+        )
+        template.resource_count_is("AWS::DAX::SubnetGroup", 1)
+        template.has_resource_properties(
+            "AWS::EC2::SecurityGroupIngress",
+            {"IpProtocol": "tcp", "FromPort": 9111, "ToPort": 9111},
+        )
+
+    def test_dax_iam_grants(self) -> None:
+        template = synthesize_backend(
+            database_settings=dataclasses.replace(DATABASE_SETTINGS, dax=DaxSettings())
+        )
+        template.has_resource_properties(
+            "AWS::IAM::Policy",
+            {
+                "PolicyDocument": {
+                    "Statement": assertions.Match.array_with(
+                        [
+                            assertions.Match.object_like(
+                                {
+                                    "Action": assertions.Match.array_with(
+                                        ["dax:GetItem", "dax:PutItem"]
+                                    ),
+                                    "Resource": {
+                                        "Fn::GetAtt": [
+                                            assertions.Match.string_like_regexp(
+                                                "DAXCluster"
+                                            ),
+                                            "Arn",
+                                        ]
+                                    },
+                                }
+                            )
+                        ]
+                    )
+                },
+                "Roles": [
+                    {"Ref": assertions.Match.string_like_regexp("APILambdaFunction")}
+                ],
+            },
+        )
+        template.has_resource_properties(
+            "AWS::IAM::Role",
+            {
+                "AssumeRolePolicyDocument": {
+                    "Statement": [
+                        assertions.Match.object_like(
+                            {"Principal": {"Service": "dax.amazonaws.com"}}
+                        )
+                    ]
+                }
+            },
+        )
+
+    def test_dax_lambda_function_wiring(self) -> None:
+        template = synthesize_backend(
+            database_settings=dataclasses.replace(DATABASE_SETTINGS, dax=DaxSettings())
+        )
+        template.has_resource_properties(
+            "AWS::Lambda::Function",
+            {
+                "Environment": {
+                    "Variables": assertions.Match.object_like(
+                        {
+                            "DAX_ENDPOINT": {
+                                "Fn::GetAtt": [
+                                    assertions.Match.string_like_regexp("DAXCluster"),
+                                    "ClusterDiscoveryEndpointURL",
+                                ]
+                            }
+                        }
+                    )
+                },
+                "VpcConfig": assertions.Match.object_like(
+                    {"SubnetIds": assertions.Match.any_value()}
+                ),
+            },
+        )
+
+    def test_dax_client_bundled_with_dax(self) -> None:
+        for dax_settings, bundled_apart in [(None, False), (DaxSettings(), True)]:
+            template = synthesize_backend(
+                database_settings=dataclasses.replace(
+                    DATABASE_SETTINGS, dax=dax_settings
+                )
+            )
+            code_keys = {
+                function["Properties"]["Handler"]: function["Properties"]["Code"][
+                    "S3Key"
+                ]
+                for function in template.find_resources(
+                    "AWS::Lambda::Function"
+                ).values()
+            }
+            # The stats stream function never bundles the DAX client
+            api_code_key = code_keys["lambda_function.lambda_handler"]
+            stats_code_key = code_keys["stats.stream_handler"]
+            self.assertEqual(api_code_key != stats_code_key, bundled_apart)
+
+
+class PerformanceProfileTestCase(unittest.TestCase):
+    def test_memory_and_architecture(self) -> None:
+        template = synthesize_backend(
+            api_settings=dataclasses.replace(
+                API_SETTINGS, performance_profile=PerformanceProfile(memory_size=1769)
+            )
+        )
+        template.has_resource_properties(
+            "AWS::Lambda::Function",
+            {"MemorySize": 1769, "Architectures": ["arm64"]},
+        )
+
+    def test_alias_without_provisioned_concurrency(self) -> None:
+        template = synthesize_backend()
+        template.has_resource_properties(
+            "AWS::Lambda::Alias",
+            {
+                "Name": "live",
+                "ProvisionedConcurrencyConfig": assertions.Match.absent(),
+            },
+        )
+        template.resource_count_is("AWS::ApplicationAutoScaling::ScalableTarget", 0)
+
+    def test_provisioned_concurrency_auto_scaling(self) -> None:
+        template = synthesize_backend(
+            api_settings=dataclasses.replace(
+                API_SETTINGS,
+                performance_profile=PerformanceProfile(
+                    provisioned_concurrency=2,
+                    max_provisioned_concurrency=8,
+                    provisioned_concurrency_utilization_target=0.6,
+                ),
+            )
+        )
+        template.has_resource_properties(
+            "AWS::Lambda::Alias",
+            {"ProvisionedConcurrencyConfig": {"ProvisionedConcurrentExecutions": 2}},
+        )
+        template.has_resource_properties(
+            "AWS::ApplicationAutoScaling::ScalableTarget",
+            {
+                "ScalableDimension": "lambda:function:ProvisionedConcurrency",
+                "MinCapacity": 2,
+                "MaxCapacity": 8,
+            },
+        )
+        template.has_resource_properties(
+            "AWS::ApplicationAutoScaling::ScalingPolicy",
+            {
+                "TargetTrackingScalingPolicyConfiguration": assertions.Match.object_like(
+                    {"TargetValue": 0.6}
+                )
+            },
+        )
+
+    def test_http_api_integrates_alias(self) -> None:
+        template = synthesize_backend()
+        template.has_resource_properties(
+            "AWS::ApiGatewayV2::Integration",
+            {
+                "IntegrationUri": {
+                    "Ref": assertions.Match.string_like_regexp("APILambdaAlias")
+                }
+            },
+        )
+
+
+class InstrumentationTestCase(unittest.TestCase):
+    def test_tracing_and_metrics_enabled(self) -> None:
+        template = synthesize_backend()
+        template.has_resource_properties(
+            "AWS::Lambda::Function",
+            {
+                "TracingConfig": {"Mode": "Active"},
+                "Environment": {
+                    "Variables": assertions.Match.object_like(
+                        {
+                            "USERS_METRICS_ENABLED": "true",
+                            "USERS_TRACING_ENABLED": "true",
+                            "POWERTOOLS_METRICS_NAMESPACE": "UserManagement",
+                        }
+                    )
+                },
+            },
+        )
+        template.has_resource_properties(
+            "AWS::IAM::Policy",
+            {
+                "PolicyDocument": {
+                    "Statement": assertions.Match.array_with(
+                        [
+                            assertions.Match.object_like(
+                                {
+                                    "Action": [
+                                        "xray:PutTraceSegments",
+                                        "xray:PutTelemetryRecords",
+                                    ]
+                                }
+                            )
+                        ]
+                    )
+                }
+            },
+        )
+
+    def test_instrumentation_disabled(self) -> None:
+        template = synthesize_backend(
+            api_settings=dataclasses.replace(
+                API_SETTINGS,
+                instrumentation=InstrumentationSettings(
+                    metrics_enabled=False, tracing_enabled=False
+                ),
+            )
+        )
+        template.has_resource_properties(
+            "AWS::Lambda::Function",
+            {
+                "TracingConfig": assertions.Match.absent(),
+                "Environment": {
+                    "Variables": assertions.Match.object_like(
+                        {
+                            "USERS_METRICS_ENABLED": "false",
+                            "USERS_TRACING_ENABLED": "false",
+                        }
+                    )
+                },
+            },
+        )
+
+
+class EmailIndexTestCase(unittest.TestCase):
+    def test_email_index_wiring(self) -> None:
+        template = synthesize_backend(
+            database_settings=dataclasses.replace(
+                DATABASE_SETTINGS,
+                email_index=EmailIndexSettings(
+                    projection_type=dynamodb.ProjectionType.INCLUDE,
+                    non_key_attributes=["country", "state"],
+                ),
+            )
+        )
+        template.has_resource_properties(
+            "AWS::DynamoDB::Table",
+            {
+                "GlobalSecondaryIndexes": [
+                    {
+                        "IndexName": "email",
+                        "KeySchema": [{"AttributeName": "email", "KeyType": "HASH"}],
+                        "Projection": {
+                            "ProjectionType": "INCLUDE",
+                            "NonKeyAttributes": ["country", "state"],
+                        },
+                    }
+                ]
+            },
+        )
+        # Users, email claims and stats
+        template.resource_count_is("AWS::DynamoDB::Table", 3)
+        template.has_resource_properties(
+            "AWS::Lambda::Function",
+            {
+                "Environment": {
+                    "Variables": assertions.Match.object_like(
+                        {
+                            "DYNAMODB_EMAIL_INDEX_NAME": "email",
+                            "DYNAMODB_EMAIL_INDEX_ATTRIBUTES": "country,state",
+                            "DYNAMODB_EMAIL_TABLE_NAME": assertions.Match.any_value(),
+                        }
+                    )
+                }
+            },
+        )
+
+
+class AdmissionControlTestCase(unittest.TestCase):
+    def test_admission_control_settings(self) -> None:
+        template = synthesize_backend(
+            api_settings=dataclasses.replace(
+                API_SETTINGS,
+                admission_control=AdmissionControlSettings(
+                    enabled=True, read_max_rate=200, write_max_rate=50
+                ),
+            )
+        )
+        template.has_resource_properties(
+            "AWS::Lambda::Function",
+            {
+                "Environment": {
+                    "Variables": assertions.Match.object_like(
+                        {
+                            "USERS_ADMISSION_CONTROL_ENABLED": "true",
+                            "USERS_ADMISSION_READ_MAX_RATE": "200",
+                            "USERS_ADMISSION_WRITE_MAX_RATE": "50",
+                        }
+                    )
+                },
+            },
+        )
+
+
+class StatsTestCase(unittest.TestCase):
+    def test_stream_aggregation(self) -> None:
+        template = synthesize_backend(
+            stats_settings=StatsSettings(
+                counted_values={"plan": ("pro",)}, batch_size=50
+            )
+        )
+        template.has_resource_properties(
+            "AWS::DynamoDB::Table",
+            {
+                "KeySchema": [{"AttributeName": "username", "KeyType": "HASH"}],
+                "StreamSpecification": {"StreamViewType": "NEW_AND_OLD_IMAGES"},
+            },
+        )
+        template.has_resource_properties(
+            "AWS::DynamoDB::Table",
+            {
+                "KeySchema": [{"AttributeName": "id", "KeyType": "HASH"}],
+                "TimeToLiveSpecification": {
+                    "AttributeName": "expiresAt",
+                    "Enabled": True,
+                },
+            },
+        )
+        template.has_resource_properties(
+            "AWS::Lambda::Function",
+            {
+                "Handler": "stats.stream_handler",
+                "Environment": {
+                    "Variables": {
+                        "STATS_TABLE_NAME": assertions.Match.any_value(),
+                        "STATS_COUNTED_VALUES": '{"plan": ["pro"]}',
+                    }
+                },
+            },
+        )
+        template.has_resource_properties(
+            "AWS::Lambda::EventSourceMapping",
+            {"BatchSize": 50, "StartingPosition": "TRIM_HORIZON"},
+        )
+        template.has_resource_properties(
+            "AWS::Lambda::Function",
+            {
+                "Handler": "lambda_function.lambda_handler",
+                "Environment": {
+                    "Variables": assertions.Match.object_like(
+                        {"STATS_TABLE_NAME": assertions.Match.any_value()}
+                    )
+                },
+            },
+        )
+
+
+class LargeAttributesTestCase(unittest.TestCase):
+    def test_attributes_bucket_wiring(self) -> None:
+        template = synthesize_backend(
+            database_settings=dataclasses.replace(
+                DATABASE_SETTINGS,
+                large_attributes=LargeAttributeSettings(
+                    compression_threshold_bytes=1024, offload_threshold_bytes=32768
+                ),
+            )
+        )
+        template.resource_count_is("AWS::S3::Bucket", 1)
+        template.has_resource_properties(
+            "AWS::S3::Bucket",
+            {
+                "PublicAccessBlockConfiguration": {
+                    "BlockPublicAcls": True,
+                    "BlockPublicPolicy": True,
+                    "IgnorePublicAcls": True,
+                    "RestrictPublicBuckets": True,
+                }
+            },
+        )
+        template.has_resource_properties(
+            "AWS::Lambda::Function",
+            {
+                "Handler": "lambda_function.lambda_handler",
+                "Environment": {
+                    "Variables": assertions.Match.object_like(
+                        {
+                            "ATTRIBUTES_BUCKET_NAME": assertions.Match.any_value(),
+                            "DYNAMODB_COMPRESSION_THRESHOLD": "1024",
+                            "DYNAMODB_OFFLOAD_THRESHOLD": "32768",
+                        }
+                    )
+                },
+            },
+        )
+        template.has_resource_properties(
+            "AWS::IAM::Policy",
+            {
+                "PolicyDocument": {
+                    "Statement": assertions.Match.array_with(
+                        [
+                            assertions.Match.object_like(
+                                {
+                                    "Action": assertions.Match.array_with(
+                                        ["s3:GetObject*", "s3:DeleteObject*"]
+                                    )
+                                }
+                            )
+                        ]
+                    )
+                }
+            },
+        )
+
+
+class GlobalTableTestCase(unittest.TestCase):
+    def test_replica_region_runtime(self) -> None:
+        template = synthesize_backend(
+            env=cdk.Environment(account="111111111111", region="us-east-1"),
+            database_settings=dataclasses.replace(
+                DATABASE_SETTINGS,
+                global_table=GlobalTableSettings(
+                    primary_region="eu-west-1",
+                    parameter_name="/Users/GlobalTableNames",
+                    replica_regions=["us-east-1"],
+                ),
+            ),
+        )
+        template.has_resource_properties(
+            "AWS::Lambda::Function",
+            {
+                "Handler": "lambda_function.lambda_handler",
+                "Environment": {
+                    "Variables": assertions.Match.object_like(
+                        {
+                            "DYNAMODB_REGION": "us-east-1",
+                            "ATTRIBUTES_BUCKET_NAME": assertions.Match.any_value(),
+                            "ATTRIBUTES_BUCKET_REGION": "eu-west-1",
+                            "DYNAMODB_WRITE_REGION": "eu-west-1",
+                        }
+                    )
+                },
+            },
+        )
+        policies = template.find_resources("AWS::IAM::Policy")
+        self.assertIn(":dynamodb:eu-west-1:111111111111:table/", json.dumps(policies))
+        # The primary region aggregates the stream
+        template.resource_count_is("AWS::Lambda::EventSourceMapping", 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,202 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import unittest
+
+import aws_cdk as cdk
+import aws_cdk.aws_applicationautoscaling as applicationautoscaling
+import aws_cdk.aws_dynamodb as dynamodb
+from aws_cdk import assertions
+
+from backend.database.infrastructure import CapacityProfile
+from backend.database.infrastructure import Database
+from backend.database.infrastructure import DatabaseSettings
+from backend.database.infrastructure import GlobalTableSettings
+from backend.database.infrastructure import ScheduledCapacity
+
+GLOBAL_TABLE_SETTINGS = GlobalTableSettings(
+    primary_region="eu-west-1",
+    parameter_name="/Users/GlobalTableNames",
+    replica_regions=["us-east-1", "ap-southeast-2"],
+)
+
+
+def synthesize_global_database(region: str) -> assertions.Template:
+    stack = cdk.Stack(env=cdk.Environment(account="111111111111", region=region))
+    Database(
+        stack,
+        "Database",
+        settings=DatabaseSettings(
+            dynamodb_billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            global_table=GLOBAL_TABLE_SETTINGS,
+        ),
+    )
+    return assertions.Template.from_stack(stack)
+
+
+class DatabaseTestCase(unittest.TestCase):
+    def test_pay_per_request_without_auto_scaling(self) -> None:
+        stack = cdk.Stack()
+        Database(
+            stack,
+            "Database",
+            settings=DatabaseSettings(
+                dynamodb_billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST
+            ),
+        )
+        template = assertions.Template.from_stack(stack)
+        template.has_resource_properties(
+            "AWS::DynamoDB::Table", {"BillingMode": "PAY_PER_REQUEST"}
+        )
+        template.resource_count_is("AWS::ApplicationAutoScaling::ScalableTarget", 0)
+
+    def test_provisioned_auto_scaling(self) -> None:
+        stack = cdk.Stack()
+        Database(
+            stack,
+            "Database",
+            settings=DatabaseSettings(
+                dynamodb_billing_mode=dynamodb.BillingMode.PROVISIONED,
+                capacity_profile=CapacityProfile(
+                    min_read_capacity=10,
+                    min_write_capacity=5,
+                    max_read_capacity=400,
+                    max_write_capacity=200,
+                    target_utilization_percent=60,
+                    scheduled_capacities=[
+                        ScheduledCapacity(
+                            name="MorningPeak",
+                            schedule=applicationautoscaling.Schedule.cron(
+                                hour="7", minute="45"
+                            ),
+                            min_read_capacity=100,
+                            min_write_capacity=50,
+                        )
+                    ],
+                ),
+            ),
+        )
+        template = assertions.Template.from_stack(stack)
+        template.has_resource_properties(
+            "AWS::DynamoDB::Table",
+            {
+                "ProvisionedThroughput": {
+                    "ReadCapacityUnits": 10,
+                    "WriteCapacityUnits": 5,
+                }
+            },
+        )
+        template.has_resource_properties(
+            "AWS::ApplicationAutoScaling::ScalableTarget",
+            {
+                "ScalableDimension": "dynamodb:table:ReadCapacityUnits",
+                "MinCapacity": 10,
+                "MaxCapacity": 400,
+                "ScheduledActions": [
+                    {
+                        "ScalableTargetAction": {"MinCapacity": 100},
+                        "Schedule": "cron(45 7 * * ? *)",
+                        "ScheduledActionName": assertions.Match.any_value(),
+                    }
+                ],
+            },
+        )
+        template.has_resource_properties(
+            "AWS::ApplicationAutoScaling::ScalableTarget",
+            {
+                "ScalableDimension": "dynamodb:table:WriteCapacityUnits",
+                "MinCapacity": 5,
+                "MaxCapacity": 200,
+            },
+        )
+        # The email index scales separately from the table
+        template.has_resource_properties(
+            "AWS::ApplicationAutoScaling::ScalableTarget",
+            {
+                "ScalableDimension": "dynamodb:index:ReadCapacityUnits",
+                "MinCapacity": 10,
+                "MaxCapacity": 400,
+            },
+        )
+        template.resource_count_is("AWS::ApplicationAutoScaling::ScalingPolicy", 4)
+        template.has_resource_properties(
+            "AWS::ApplicationAutoScaling::ScalingPolicy",
+            {
+                "PolicyType": "TargetTrackingScaling",
+                "TargetTrackingScalingPolicyConfiguration": {
+                    "PredefinedMetricSpecification": {
+                        "PredefinedMetricType": "DynamoDBReadCapacityUtilization"
+                    },
+                    "TargetValue": 60,
+                },
+            },
+        )
+
+
+class GlobalTableTestCase(unittest.TestCase):
+    def test_primary_region_replicas(self) -> None:
+        template = synthesize_global_database("eu-west-1")
+        template.resource_count_is("AWS::DynamoDB::Table", 3)
+        # Renaming would replace the existing tables
+        template.has_resource_properties(
+            "AWS::DynamoDB::Table", {"TableName": assertions.Match.absent()}
+        )
+        # Two replica regions of three tables
+        template.resource_count_is("Custom::DynamoDBReplica", 6)
+        for region in ["us-east-1", "ap-southeast-2"]:
+            template.has_resource_properties(
+                "Custom::DynamoDBReplica", {"Region": region}
+            )
+        template.resource_count_is("AWS::S3::Bucket", 1)
+        template.has_resource_properties(
+            "AWS::SSM::Parameter", {"Name": "/Users/GlobalTableNames"}
+        )
+
+    def test_replica_region_imports_tables(self) -> None:
+        template = synthesize_global_database("us-east-1")
+        template.resource_count_is("AWS::DynamoDB::Table", 0)
+        template.resource_count_is("Custom::DynamoDBReplica", 0)
+        template.resource_count_is("AWS::S3::Bucket", 0)
+        # The names are read from the parameter of the primary region
+        template.has_resource_properties(
+            "Custom::AWS",
+            {
+                "Create": assertions.Match.serialized_json(
+                    assertions.Match.object_like(
+                        {
+                            "service": "SSM",
+                            "action": "getParameter",
+                            "parameters": {"Name": "/Users/GlobalTableNames"},
+                            "region": "eu-west-1",
+                        }
+                    )
+                )
+            },
+        )
+
+    def test_region_required(self) -> None:
+        with self.assertRaises(ValueError):
+            Database(
+                cdk.Stack(),
+                "Database",
+                settings=DatabaseSettings(
+                    dynamodb_billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+                    global_table=GLOBAL_TABLE_SETTINGS,
+                ),
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
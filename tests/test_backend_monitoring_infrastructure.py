@@ -0,0 +1,116 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import json
+import unittest
+
+import aws_cdk as cdk
+import aws_cdk.aws_dynamodb as dynamodb
+from aws_cdk import assertions
+
+from backend.api.infrastructure import API
+from backend.api.infrastructure import APISettings
+from backend.database.infrastructure import Database
+from backend.database.infrastructure import DatabaseSettings
+from backend.monitoring.infrastructure import AlarmSettings
+from backend.monitoring.infrastructure import Monitoring
+
+
+class MonitoringTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        # Bundling is covered by the API tests and needs Docker
+        app = cdk.App(context={"aws:cdk:bundling-stacks": []})
+        stack = cdk.Stack(app, "Stack")
+        database = Database(
+            stack,
+            "Database",
+            settings=DatabaseSettings(
+                dynamodb_billing_mode=dynamodb.BillingMode.PROVISIONED
+            ),
+        )
+        api = API(
+            stack,
+            "API",
+            database=database,
+            settings=APISettings(lambda_reserved_concurrency=1),
+        )
+        Monitoring(stack, "Monitoring", database=database, api=api).add_alarms(
+            AlarmSettings(
+                api_p99_latency_threshold_ms=250, api_error_rate_threshold_percent=2
+            )
+        )
+        self.template = assertions.Template.from_stack(stack)
+
+    def test_dashboard_widgets(self) -> None:
+        dashboards = self.template.find_resources("AWS::CloudWatch::Dashboard")
+        self.assertEqual(len(dashboards), 1)
+        dashboard_body = json.dumps(list(dashboards.values())[0])
+        for widget_title in [
+            "API latency (ms)",
+            "API integration latency (ms)",
+            "API error rates (%)",
+            "Lambda duration (ms)",
+            "Lambda cold starts",
+            "Lambda concurrency",
+            "Lambda throttles and errors",
+            "DynamoDB Read capacity units per second",
+            "DynamoDB Write capacity units per second",
+            "DynamoDB throttled requests",
+            "DynamoDB successful request latency (ms)",
+        ]:
+            self.assertIn(widget_title, dashboard_body)
+        for metric_name in [
+            "IntegrationLatency",
+            "ConcurrentExecutions",
+            "ProvisionedConcurrencyUtilization",
+            "ProvisionedReadCapacityUnits",
+            "SuccessfulRequestLatency",
+            "@initDuration",
+        ]:
+            self.assertIn(metric_name, dashboard_body)
+
+    def test_alarms(self) -> None:
+        self.template.resource_count_is("AWS::CloudWatch::Alarm", 4)
+        self.template.has_resource_properties(
+            "AWS::CloudWatch::Alarm",
+            {
+                "MetricName": "Latency",
+                "ExtendedStatistic": "p99",
+                "Threshold": 250,
+                "EvaluationPeriods": 5,
+                "DatapointsToAlarm": 3,
+            },
+        )
+        self.template.has_resource_properties(
+            "AWS::CloudWatch::Alarm",
+            {
+                "Threshold": 2,
+                "Metrics": assertions.Match.array_with(
+                    [
+                        assertions.Match.object_like(
+                            {"Expression": "100 * errors5xx / requests5xx"}
+                        )
+                    ]
+                ),
+            },
+        )
+        self.template.has_resource_properties(
+            "AWS::CloudWatch::Alarm",
+            {"MetricName": "Throttles", "Namespace": "AWS/Lambda", "Threshold": 1},
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
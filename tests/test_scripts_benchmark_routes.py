@@ -0,0 +1,61 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import importlib
+import os
+import unittest
+from unittest import mock
+
+from scripts import benchmark_routes
+
+# By module name as in the Lambda runtime, shared with the benchmarked handler
+helpers = importlib.import_module("helpers")
+lambda_function = importlib.import_module("lambda_function")
+
+ITERATIONS = 4
+
+
+class BenchmarkRoutesTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        for cached in [helpers.get_users_repository, helpers.get_stats_reader]:
+            cached.cache_clear()
+            self.addCleanup(cached.cache_clear)
+        environment = mock.patch.dict(os.environ)
+        environment.start()
+        self.addCleanup(environment.stop)
+
+    def test_every_route_benchmarked(self) -> None:
+        # The resolver keys its routes by method and path, e.g. GET/users
+        route_keys = lambda_function.app._route_keys  # pylint: disable=protected-access
+        benchmarked_route_keys = {
+            "".join(name.split()[:2])
+            for name in benchmark_routes.build_route_events(ITERATIONS)
+        }
+        self.assertEqual(set(route_keys), benchmarked_route_keys)
+
+    def test_every_request_succeeds(self) -> None:
+        handler = benchmark_routes.load_handler(latency_ms=0)
+        status_codes = {
+            name: {
+                handler(build(index), None)["statusCode"] for index in range(ITERATIONS)
+            }
+            for name, build in benchmark_routes.build_route_events(ITERATIONS).items()
+        }
+        self.assertEqual(status_codes.pop("GET /users/<username> If-None-Match"), {304})
+        self.assertEqual({200}, set.union(*status_codes.values()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,217 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import contextlib
+import decimal
+import importlib
+import io
+import json
+import pathlib
+import tempfile
+import unittest
+from typing import Any, Dict, Iterator, List, Sequence
+from unittest import mock
+
+from scripts import bulk_users
+
+# By module name as in the Lambda runtime, the tool only needs duck typing
+in_memory = importlib.import_module("in_memory")
+
+
+class FailingDatabase:
+    def __init__(self, failing_call: int, conflicting_username: str = ""):
+        self.database = in_memory.InMemoryDatabase()
+        self.calls = 0
+        self._failing_call = failing_call
+        self._conflicting_username = conflicting_username
+
+    def batch_write_users(
+        self,
+        users_to_put: Dict[str, Dict[str, Any]],
+        usernames_to_delete: Sequence[str],
+    ) -> List[Any]:
+        self.calls += 1
+        if self.calls == self._failing_call:
+            return [
+                in_memory.users.BatchItemResult(
+                    username, in_memory.users.BatchItemStatus.UNPROCESSED
+                )
+                for username in users_to_put
+            ]
+        conflicting_user = users_to_put.pop(self._conflicting_username, None)
+        results: List[Any] = self.database.batch_write_users(
+            users_to_put, usernames_to_delete
+        )
+        if conflicting_user is not None:
+            results.append(
+                in_memory.users.BatchItemResult(
+                    self._conflicting_username,
+                    in_memory.users.BatchItemStatus.CONFLICT,
+                )
+            )
+        return results
+
+    def iter_users(self, total_segments: int = 1) -> Iterator[Dict[str, Any]]:
+        user_iterator: Iterator[Dict[str, Any]] = self.database.iter_users(
+            total_segments
+        )
+        return user_iterator
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+        self.sleeps: List[float] = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def build_csv(users_count: int) -> io.StringIO:
+    rows = ["username,email,country"]
+    rows += [f"user{index},user{index}@example.com," for index in range(users_count)]
+    return io.StringIO("\n".join(rows) + "\n")
+
+
+class BulkUsersTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.token_bucket = bulk_users.TokenBucket(1000000)
+
+    def test_import_csv_and_export(self) -> None:
+        database = in_memory.InMemoryDatabase()
+        imported_records = bulk_users.import_users(
+            database,
+            bulk_users.read_records(build_csv(60), "csv"),
+            token_bucket=self.token_bucket,
+        )
+        self.assertEqual(imported_records, 60)
+        output_file = io.StringIO()
+        exported_users = bulk_users.export_users(
+            database, output_file, total_segments=4
+        )
+        self.assertEqual(exported_users, 60)
+        exported = {
+            user["username"]: user
+            for user in map(json.loads, output_file.getvalue().splitlines())
+        }
+        self.assertEqual(exported["user7"]["email"], "user7@example.com")
+        self.assertGreater(exported["user7"]["version"], 0)
+
+    def test_import_jsonl_numbers(self) -> None:
+        database = in_memory.InMemoryDatabase()
+        input_file = io.StringIO(
+            '{"username": "john", "balance": 12.5, "logins": 3}\n\n'
+            '{"username": "jane", "tags": ["a"]}\n'
+        )
+        bulk_users.import_users(
+            database,
+            bulk_users.read_records(input_file, "jsonl"),
+            token_bucket=self.token_bucket,
+        )
+        user: Dict[str, Any] = database.get_user("john") or {}
+        self.assertEqual(user["balance"], decimal.Decimal("12.5"))
+        output_file = io.StringIO()
+        bulk_users.export_users(database, output_file)
+        self.assertIn('"balance":12.5,"logins":3', output_file.getvalue())
+
+    def test_import_resumes_from_checkpoint(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint = bulk_users.Checkpoint(pathlib.Path(directory, "checkpoint"))
+            failing_database = FailingDatabase(failing_call=2)
+            with self.assertRaises(
+                bulk_users.BulkImportError
+            ), contextlib.redirect_stderr(io.StringIO()):
+                bulk_users.import_users(
+                    failing_database,
+                    bulk_users.read_records(build_csv(60), "csv"),
+                    token_bucket=self.token_bucket,
+                    workers=1,
+                    checkpoint=checkpoint,
+                )
+            self.assertEqual(checkpoint.load(), bulk_users.CHUNK_SIZE)
+            database = FailingDatabase(failing_call=0)
+            imported_records = bulk_users.import_users(
+                database,
+                bulk_users.read_records(build_csv(60), "csv"),
+                token_bucket=self.token_bucket,
+                checkpoint=checkpoint,
+            )
+        self.assertEqual(imported_records, 60)
+        # Only the 35 remaining users are written again, in 2 chunks
+        self.assertEqual(database.calls, 2)
+        self.assertIsNone(database.database.get_user("user0"))
+        self.assertIsNotNone(database.database.get_user("user59"))
+
+    def test_import_reports_conflicts(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint = bulk_users.Checkpoint(pathlib.Path(directory, "checkpoint"))
+            database = FailingDatabase(failing_call=0, conflicting_username="user30")
+            with self.assertRaises(
+                bulk_users.BulkImportError
+            ) as context, contextlib.redirect_stderr(io.StringIO()):
+                bulk_users.import_users(
+                    database,
+                    bulk_users.read_records(build_csv(60), "csv"),
+                    token_bucket=self.token_bucket,
+                    workers=1,
+                    checkpoint=checkpoint,
+                )
+            # The chunk of the conflicting user is imported again on resume
+            self.assertEqual(checkpoint.load(), bulk_users.CHUNK_SIZE)
+        self.assertEqual(context.exception.failed_usernames, ["user30"])
+        self.assertEqual(context.exception.imported_records, bulk_users.CHUNK_SIZE)
+        # Conflicts do not stop the import of the later chunks
+        self.assertEqual(database.calls, 3)
+        self.assertIsNotNone(database.database.get_user("user59"))
+
+    def test_token_bucket_throttles(self) -> None:
+        clock = FakeClock()
+        token_bucket = bulk_users.TokenBucket(10, clock=clock, sleep=clock.sleep)
+        token_bucket.acquire(10)
+        self.assertEqual(clock.sleeps, [])
+        token_bucket.acquire(5)
+        self.assertEqual(clock.sleeps, [0.5])
+        # Above capacity waits for a full bucket, then goes into debt
+        token_bucket.acquire(20)
+        self.assertEqual(clock.sleeps, [0.5, 1.0])
+        clock.now += 1.0
+        self.assertEqual(token_bucket.available(), 0)
+
+    def test_estimate_write_capacity_units(self) -> None:
+        self.assertEqual(bulk_users.estimate_write_capacity_units({"username": "j"}), 1)
+        self.assertEqual(
+            bulk_users.estimate_write_capacity_units(
+                {"username": "john", "bio": "x" * 2048}
+            ),
+            3,
+        )
+
+    @mock.patch("large_attributes.boto3.client")
+    @mock.patch("users.DynamoDBDatabase")
+    def test_load_database_large_attributes(
+        self, mock_database: mock.Mock, mock_client: mock.Mock
+    ) -> None:
+        bulk_users.load_database("Users", "Emails", "attributes")
+        store = mock_database.call_args.kwargs["large_attribute_store"]
+        self.assertIsNotNone(store)
+        mock_client.assert_called_once_with("s3", config=None)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import importlib
+import os
+import unittest
+from typing import Any, Dict, List, Optional, Tuple
+from unittest import mock
+
+from scripts import load_test
+
+# By module name as in the Lambda runtime, shared with the local handler
+helpers = importlib.import_module("helpers")
+
+
+class LoadTestTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        helpers.get_users_repository.cache_clear()
+        self.addCleanup(helpers.get_users_repository.cache_clear)
+        environment = mock.patch.dict(os.environ)
+        environment.start()
+        self.addCleanup(environment.stop)
+
+    def test_local_run_reports_every_operation(self) -> None:
+        send = load_test.local_sender(latency_ms=0)
+        results = load_test.run_load_test(send, concurrency=2, duration_seconds=0.2)
+        self.assertEqual(
+            [
+                "total",
+                "POST /users",
+                "GET /users/<username>",
+                "PUT /users/<username>",
+                "DELETE /users/<username>",
+            ],
+            list(results),
+        )
+        self.assertEqual(0, results["total"]["failed_requests"])
+        self.assertEqual(
+            4 * results["POST /users"]["requests"], results["total"]["requests"]
+        )
+        # Every user created was deleted again
+        self.assertEqual([], list(helpers.get_users_repository().iter_users()))
+
+    def test_failed_requests_are_counted(self) -> None:
+        requests: List[Tuple[str, str]] = []
+
+        def send(method: str, path: str, _body: Optional[Dict[str, Any]]) -> int:
+            requests.append((method, path))
+            return 500 if method == "PUT" else 0 if method == "DELETE" else 200
+
+        results = load_test.run_load_test(send, concurrency=1, duration_seconds=0.05)
+        self.assertEqual(
+            results["total"]["requests"] / 2, results["total"]["failed_requests"]
+        )
+        self.assertEqual(0, results["GET /users/<username>"]["failed_requests"])
+        self.assertEqual(("POST", "/users"), requests[0])
+        self.assertNotEqual(requests[1], requests[5])
+
+    def test_thresholds(self) -> None:
+        total = {
+            "requests": 1000.0,
+            "failed_requests": 2.0,
+            "p50_ms": 40.0,
+            "p99_ms": 300.0,
+        }
+        self.assertEqual([], load_test.Thresholds(50, 500, 0.01).check(total))
+        self.assertEqual(
+            [
+                "p50 40.0 ms > 20 ms",
+                "p99 300.0 ms > 200 ms",
+                "error rate 0.20% > 0.10%",
+            ],
+            load_test.Thresholds(20, 200, 0.001).check(total),
+        )
+
+    def test_http_sender_requires_https(self) -> None:
+        with self.assertRaises(ValueError):
+            load_test.http_sender("http://example.com", timeout_seconds=1)
@@ -0,0 +1,106 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import json
+import unittest
+
+import aws_cdk as cdk
+from aws_cdk import assertions
+
+import constants
+import toolchain
+
+
+class ToolchainTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        # Bundling is covered by the API tests and needs Docker
+        app = cdk.App(context={"aws:cdk:bundling-stacks": []})
+        self.toolchain = toolchain.Toolchain(
+            app,
+            "Toolchain",
+            env=cdk.Environment(account="111111111111", region="eu-west-1"),
+        )
+        self.stacks = {
+            stack.stack_name: stack for stack in app.synth().stacks_recursively
+        }
+
+    def test_production_stack_per_region(self) -> None:
+        regions = {
+            stack_name.removeprefix(constants.APP_NAME): stack.environment.region
+            for stack_name, stack in self.stacks.items()
+            if stack_name.startswith(constants.APP_NAME + "Production")
+        }
+        self.assertEqual(
+            regions,
+            {
+                "Production": "eu-west-1",
+                "ProductionUsEast1": "us-east-1",
+                "ProductionApSoutheast2": "ap-southeast-2",
+            },
+        )
+
+    def test_load_tested_tables_on_demand(self) -> None:
+        provisioned_tables = {
+            stack_name.removeprefix(constants.APP_NAME): [
+                logical_id
+                for logical_id, resource in stack.template["Resources"].items()
+                if "ProvisionedThroughput" in resource.get("Properties", {})
+            ]
+            for stack_name, stack in self.stacks.items()
+        }
+        self.assertEqual(provisioned_tables["PreProduction"], [])
+        self.assertNotEqual(provisioned_tables["Production"], [])
+
+    def test_production_replicas_deploy_after_primary(self) -> None:
+        template = assertions.Template.from_stack(self.toolchain)
+        pipeline = next(
+            iter(template.find_resources("AWS::CodePipeline::Pipeline").values())
+        )
+        stage_names = [stage["Name"] for stage in pipeline["Properties"]["Stages"]]
+        self.assertEqual(
+            stage_names[-2:],
+            [
+                toolchain.PRODUCTION_ENV_NAME,
+                toolchain.PRODUCTION_ENV_NAME + "Replicas",
+            ],
+        )
+        replicas = pipeline["Properties"]["Stages"][-1]
+        deploy_run_orders = [
+            action["RunOrder"]
+            for action in replicas["Actions"]
+            if action["Name"].endswith(".Deploy")
+        ]
+        self.assertEqual(deploy_run_orders, [2, 2])
+
+    def test_production_smoke_tests_fail_on_http_errors(self) -> None:
+        template = assertions.Template.from_stack(self.toolchain)
+        smoke_tests = [
+            project["Properties"]["Source"]["BuildSpec"]
+            for project in template.find_resources("AWS::CodeBuild::Project").values()
+            if "curl" in str(project["Properties"]["Source"].get("BuildSpec"))
+        ]
+        self.assertEqual(len(smoke_tests), 3)
+        for build_spec in smoke_tests:
+            self.assertEqual(
+                json.loads(build_spec)["phases"]["build"]["commands"],
+                [
+                    f'curl -f "${toolchain.API_ENDPOINT_ENV_VAR_NAME}'
+                    f'{toolchain.SMOKE_TEST_PATH}"'
+                ],
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
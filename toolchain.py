@@ -15,7 +15,7 @@
 
 import json
 import pathlib
-from typing import Any
+from typing import Any, Optional, Tuple
 
 import aws_cdk as cdk
 import aws_cdk.aws_codebuild as codebuild
@@ -24,15 +24,37 @@ from aws_cdk import pipelines
 from constructs import Construct
 
 import constants
+from backend.api.infrastructure import AdmissionControlSettings
+from backend.api.infrastructure import APISettings
+from backend.api.infrastructure import PerformanceProfile
 from backend.component import Backend
+from backend.component import BackendSettings
+from backend.database.infrastructure import CapacityProfile
+from backend.database.infrastructure import DatabaseSettings
+from backend.database.infrastructure import GlobalTableSettings
 
 GITHUB_CONNECTION_ARN = "CONNECTION_ARN"
 GITHUB_OWNER = "OWNER"
 GITHUB_REPO = "REPO"
 GITHUB_TRUNK_BRANCH = "TRUNK_BRANCH"
+PRE_PRODUCTION_ENV_NAME = "PreProduction"
+PRE_PRODUCTION_ENV_ACCOUNT = "111111111111"
+PRE_PRODUCTION_ENV_REGION = "eu-west-1"
+# Load test gating the promotion to production, latencies as seen by CodeBuild
+LOAD_TEST_CONCURRENCY = 10
+LOAD_TEST_DURATION_SECONDS = 120
+LOAD_TEST_MAX_P50_MS = 100
+LOAD_TEST_MAX_P99_MS = 500
+LOAD_TEST_MAX_ERROR_RATE = 0.001
+BUILD_SPEC = {"phases": {"install": {"runtime-versions": {"python": "3.11"}}}}
+API_ENDPOINT_ENV_VAR_NAME = constants.APP_NAME.upper() + "_API_ENDPOINT"
 PRODUCTION_ENV_NAME = "Production"
 PRODUCTION_ENV_ACCOUNT = "222222222222"
 PRODUCTION_ENV_REGION = "eu-west-1"
+# Regions the tables replicate to, each serves the users nearest to it
+PRODUCTION_ENV_REPLICA_REGIONS = ["us-east-1", "ap-southeast-2"]
+# A read answering 200 whether or not there are users, the API has no root route
+SMOKE_TEST_PATH = "/users?limit=1"
 
 
 class Toolchain(cdk.Stack):
@@ -44,11 +66,10 @@ class Toolchain(cdk.Stack):
             GITHUB_TRUNK_BRANCH,
             connection_arn=GITHUB_CONNECTION_ARN,
         )
-        build_spec = {"phases": {"install": {"runtime-versions": {"python": "3.11"}}}}
         synth = pipelines.CodeBuildStep(
             "Synth",
             input=source,
-            partial_build_spec=codebuild.BuildSpec.from_object(build_spec),
+            partial_build_spec=codebuild.BuildSpec.from_object(BUILD_SPEC),
             install_commands=["./scripts/install-deps.sh"],
             commands=["./scripts/run-tests.sh", "npx cdk synth"],
             primary_output_directory="cdk.out",
@@ -68,7 +89,8 @@ class Toolchain(cdk.Stack):
             publish_assets_in_parallel=False,
             synth=synth,
         )
-        Toolchain._add_production_stage(pipeline)
+        Toolchain._add_pre_production_stage(pipeline, source)
+        Toolchain._add_production_stages(pipeline)
 
     @staticmethod
     def _get_cdk_cli_version() -> str:
@@ -81,26 +103,126 @@ class Toolchain(cdk.Stack):
         return cdk_cli_version
 
     @staticmethod
-    def _add_production_stage(pipeline: pipelines.CodePipeline) -> None:
-        production = cdk.Stage(
+    def _add_pre_production_stage(
+        pipeline: pipelines.CodePipeline, source: pipelines.CodePipelineSource
+    ) -> None:
+        pre_production = cdk.Stage(
             pipeline,
-            PRODUCTION_ENV_NAME,
+            PRE_PRODUCTION_ENV_NAME,
             env=cdk.Environment(
-                account=PRODUCTION_ENV_ACCOUNT, region=PRODUCTION_ENV_REGION
+                account=PRE_PRODUCTION_ENV_ACCOUNT, region=PRE_PRODUCTION_ENV_REGION
+            ),
+        )
+        # The load test starts at full rate against idle tables, faster than
+        # auto scaling raises provisioned capacity from its minimum
+        backend = Toolchain._create_backend(
+            pre_production,
+            PRE_PRODUCTION_ENV_NAME,
+            dynamodb_billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+        )
+        load_test = pipelines.CodeBuildStep(
+            "LoadTest",
+            input=source,
+            partial_build_spec=codebuild.BuildSpec.from_object(BUILD_SPEC),
+            env_from_cfn_outputs={API_ENDPOINT_ENV_VAR_NAME: backend.api_endpoint},
+            commands=[
+                "python -m scripts.load_test"
+                f" --endpoint ${API_ENDPOINT_ENV_VAR_NAME}"
+                f" --concurrency {LOAD_TEST_CONCURRENCY}"
+                f" --duration {LOAD_TEST_DURATION_SECONDS}"
+                f" --max-p50-ms {LOAD_TEST_MAX_P50_MS}"
+                f" --max-p99-ms {LOAD_TEST_MAX_P99_MS}"
+                f" --max-error-rate {LOAD_TEST_MAX_ERROR_RATE}"
+            ],
+        )
+        pipeline.add_stage(pre_production, post=[load_test])
+
+    @staticmethod
+    def _add_production_stages(pipeline: pipelines.CodePipeline) -> None:
+        # The primary region's stack keeps the tables and adds their replicas
+        # before the stacks of the replica regions deploy in parallel
+        global_table_settings = GlobalTableSettings(
+            primary_region=PRODUCTION_ENV_REGION,
+            parameter_name=(
+                f"/{constants.APP_NAME}{PRODUCTION_ENV_NAME}/GlobalTableNames"
             ),
+            replica_regions=PRODUCTION_ENV_REPLICA_REGIONS,
         )
-        backend = Backend(
-            production,
-            constants.APP_NAME + PRODUCTION_ENV_NAME,
-            stack_name=constants.APP_NAME + PRODUCTION_ENV_NAME,
-            api_lambda_reserved_concurrency=10,
-            database_dynamodb_billing_mode=dynamodb.BillingMode.PROVISIONED,
+        production, smoke_test = Toolchain._create_production_stage(
+            pipeline, PRODUCTION_ENV_NAME, PRODUCTION_ENV_REGION, global_table_settings
         )
-        api_endpoint_env_var_name = constants.APP_NAME.upper() + "_API_ENDPOINT"
-        smoke_test_commands = [f"curl ${api_endpoint_env_var_name}"]
+        pipeline.add_stage(production, post=[smoke_test])
+        replicas = pipeline.add_wave(PRODUCTION_ENV_NAME + "Replicas")
+        for region in PRODUCTION_ENV_REPLICA_REGIONS:
+            production, smoke_test = Toolchain._create_production_stage(
+                pipeline,
+                PRODUCTION_ENV_NAME + _get_region_suffix(region),
+                region,
+                global_table_settings,
+            )
+            replicas.add_stage(production, post=[smoke_test])
+
+    @staticmethod
+    def _create_production_stage(
+        pipeline: pipelines.CodePipeline,
+        env_name: str,
+        region: str,
+        global_table_settings: GlobalTableSettings,
+    ) -> Tuple[cdk.Stage, pipelines.ShellStep]:
+        production = cdk.Stage(
+            pipeline,
+            env_name,
+            env=cdk.Environment(account=PRODUCTION_ENV_ACCOUNT, region=region),
+        )
+        backend = Toolchain._create_backend(production, env_name, global_table_settings)
+        # Load is generated in pre-production, production only gets a read
         smoke_test = pipelines.ShellStep(
             "SmokeTest",
-            env_from_cfn_outputs={api_endpoint_env_var_name: backend.api_endpoint},
-            commands=smoke_test_commands,
+            env_from_cfn_outputs={API_ENDPOINT_ENV_VAR_NAME: backend.api_endpoint},
+            commands=[f'curl -f "${API_ENDPOINT_ENV_VAR_NAME}{SMOKE_TEST_PATH}"'],
         )
-        pipeline.add_stage(production, post=[smoke_test])
+        return production, smoke_test
+
+    @staticmethod
+    def _create_backend(
+        stage: cdk.Stage,
+        env_name: str,
+        global_table_settings: Optional[GlobalTableSettings] = None,
+        *,
+        dynamodb_billing_mode: dynamodb.BillingMode = dynamodb.BillingMode.PROVISIONED,
+    ) -> Backend:
+        # Pre-production mirrors production so that its load test is telling,
+        # but for the capacity mode of its tables
+        return Backend(
+            stage,
+            constants.APP_NAME + env_name,
+            stack_name=constants.APP_NAME + env_name,
+            settings=BackendSettings(
+                api=APISettings(
+                    lambda_reserved_concurrency=10,
+                    # Provisioned capacity throttles before auto scaling catches up
+                    admission_control=AdmissionControlSettings(enabled=True),
+                    performance_profile=PerformanceProfile(
+                        memory_size=1024,
+                        provisioned_concurrency=2,
+                        max_provisioned_concurrency=8,
+                    ),
+                ),
+                database=DatabaseSettings(
+                    dynamodb_billing_mode=dynamodb_billing_mode,
+                    capacity_profile=CapacityProfile(
+                        min_read_capacity=10,
+                        max_read_capacity=400,
+                        min_write_capacity=5,
+                        max_write_capacity=200,
+                        target_utilization_percent=70,
+                    ),
+                    global_table=global_table_settings,
+                ),
+            ),
+        )
+
+
+def _get_region_suffix(region: str) -> str:
+    # e.g. EuWest1 for eu-west-1
+    return "".join(part.capitalize() for part in region.split("-"))